@@ -0,0 +1,166 @@
+##
+# @file bench_logging.py
+# @author Roman Moroz
+# @brief Микробенчмарк накладных расходов логирования на одно событие.
+# @details Скрипт сравнивает прежнюю схему логирования (синхронные `FileHandler`
+#          и `StreamHandler` прямо на логгере, сообщения через f-строки) с новой
+#          (`DeferredQueueHandler` + `QueueListener`, %-форматирование) в текстовом
+#          и JSON-формате. Для каждой схемы измеряется время, которое вызов
+#          `logger.info` занимает в вызывающем потоке (то есть в цикле событий бота),
+#          и полное время до записи всех сообщений на диск. Отдельно измеряется
+#          стоимость отключенного `logger.debug` с f-строкой и с %-аргументами.
+#
+#          Запуск из корня репозитория:
+#          `python benchmarks/bench_logging.py --events 20000`
+
+import argparse
+import logging
+import os
+import queue
+import sys
+import tempfile
+import time
+
+from logging import FileHandler, Formatter, StreamHandler
+from logging.handlers import QueueListener
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+
+from core.logger import TEXT_FORMAT, DeferredQueueHandler, build_handlers  # noqa: E402
+
+EVENT = ("message", 123456789, "benchmark_user")
+
+
+def bench_sync(directory: Path, console, events: int) -> tuple[float, float]:
+    """!
+    @brief Прежняя схема: синхронные обработчики и f-строки.
+    @return Время в вызывающем потоке и полное время, в секундах.
+    """
+
+    logger = _fresh_logger("bench.sync")
+    console_handler = StreamHandler(console)
+    console_handler.setFormatter(build_handlers(None)[0].formatter)
+    file_handler = FileHandler(directory / "sync.log")
+    file_handler.setFormatter(Formatter(TEXT_FORMAT))
+    logger.addHandler(console_handler)
+    logger.addHandler(file_handler)
+
+    name, user_id, username = EVENT
+    started = time.perf_counter()
+    for _ in range(events):
+        logger.info(f"Processing {name} from {user_id} ({username})")
+    elapsed = time.perf_counter() - started
+
+    file_handler.close()
+    return elapsed, elapsed
+
+
+def bench_queue(
+    directory: Path, console, events: int, file_format: str
+) -> tuple[float, float]:
+    """!
+    @brief Новая схема: очередь, обработчики в отдельном потоке и %-аргументы.
+    @return Время в вызывающем потоке и полное время (с ожиданием записи), в секундах.
+    """
+
+    logger = _fresh_logger(f"bench.queue.{file_format}")
+    handlers = build_handlers(
+        directory / f"queue-{file_format}.log",
+        console_stream=console,
+        console_level="INFO",
+        file_format=file_format,
+    )
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    listener.start()
+
+    name, user_id, username = EVENT
+    started = time.perf_counter()
+    for _ in range(events):
+        logger.info("Processing %s from %s (%s)", name, user_id, username)
+    elapsed = time.perf_counter() - started
+
+    listener.stop()
+    total = time.perf_counter() - started
+    for handler in handlers:
+        handler.close()
+    return elapsed, total
+
+
+def bench_disabled(events: int) -> tuple[float, float]:
+    """!
+    @brief Стоимость отключенного `logger.debug` с f-строкой и с %-аргументами.
+    @return Время для f-строки и для %-аргументов, в секундах.
+    """
+
+    logger = _fresh_logger("bench.disabled")
+    logger.setLevel(logging.INFO)
+    name, user_id, username = EVENT
+
+    started = time.perf_counter()
+    for _ in range(events):
+        logger.debug(f"Processing {name} from {user_id} ({username})")
+    eager = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(events):
+        logger.debug("Processing %s from %s (%s)", name, user_id, username)
+    lazy = time.perf_counter() - started
+    return eager, lazy
+
+
+def _fresh_logger(name: str) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers.clear()
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return logger
+
+
+def main() -> None:
+    """!
+    @brief Точка входа: разбирает аргументы и печатает таблицу результатов.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument(
+        "--console",
+        action="store_true",
+        help="писать консольный вывод в stderr вместо /dev/null",
+    )
+    args = parser.parse_args()
+
+    console = sys.stderr if args.console else open(os.devnull, "w")
+    per_event = 1e6 / args.events
+
+    with tempfile.TemporaryDirectory(prefix="bench-logging-") as workdir:
+        directory = Path(workdir)
+        rows = [
+            ("sync handlers, f-string", bench_sync(directory, console, args.events)),
+            (
+                "queue, text, %-args",
+                bench_queue(directory, console, args.events, "text"),
+            ),
+            (
+                "queue, json, %-args",
+                bench_queue(directory, console, args.events, "json"),
+            ),
+        ]
+
+    print(f"{'pipeline':<26} {'caller, us/event':>17} {'total, us/event':>16}")
+    for title, (caller, total) in rows:
+        print(f"{title:<26} {caller * per_event:>17.2f} {total * per_event:>16.2f}")
+
+    eager, lazy = bench_disabled(args.events)
+    print()
+    print(f"disabled debug, f-string: {eager * per_event:.3f} us/event")
+    print(f"disabled debug, %-args:   {lazy * per_event:.3f} us/event")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+##
+# @file bench_long_transcripts.py
+# @author Roman Moroz
+# @brief Бенчмарк анализа длинных расшифровок: один запрос против map-reduce.
+# @details Скрипт генерирует синтетические расшифровки возрастающей длины и измеряет
+#          сквозную задержку `CallAnalyzer.analyze_call` в двух режимах: все одним
+#          запросом и по частям (map-reduce). Вместо OpenRouter используется фиктивный
+#          бэкенд, задержка которого моделируется как сумма фиксированной части,
+#          времени обработки входных токенов и времени генерации выходных токенов.
+#          Все задержки можно сжать параметром `--time-scale`, результаты выводятся
+#          в исходном (несжатом) масштабе.
+#
+#          Запуск из корня репозитория:
+#          `python benchmarks/bench_long_transcripts.py --turns 50 200 800 3200`
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+os.environ["CACHE_ENABLED"] = "false"
+
+from services.analyzer import CallAnalyzer  # noqa: E402
+from services.backends import Completion  # noqa: E402
+from services.chunking import estimate_tokens  # noqa: E402
+
+WORDS = (
+    "здравствуйте заказ доставка оплата возврат спасибо подождите минуту "
+    "проверю номер договора к сожалению отлично конечно понимаю проблема "
+    "оператор менеджер скидка тариф подключение жалоба срок курьер"
+).split()
+
+
+def make_transcript(turns: int, rng: random.Random) -> str:
+    """!
+    @brief Генерирует синтетическую расшифровку из заданного числа реплик.
+    """
+
+    lines = []
+    for index in range(turns):
+        speaker = "Оператор" if index % 2 == 0 else "Клиент"
+        words = rng.choices(WORDS, k=rng.randint(8, 30))
+        lines.append(f"{speaker}: {' '.join(words).capitalize()}.")
+    return "\n".join(lines)
+
+
+class SlowBackend:
+    """!
+    @class SlowBackend
+    @brief Фиктивный бэкенд модели (см. `services.backends`) с моделью задержки.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.name = "benchmark"
+        self.calls = 0
+
+    async def complete(self, model, messages, *, max_tokens, **kwargs):
+        self.calls += 1
+        input_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+        if input_tokens > self.args.context_limit:
+            raise RuntimeError(f"context length exceeded: {input_tokens} tokens")
+
+        output_tokens = int(max_tokens * 0.6)
+        latency = (
+            self.args.base_latency
+            + input_tokens / self.args.prefill_rate
+            + output_tokens / self.args.decode_rate
+        )
+        await asyncio.sleep(latency * self.args.time_scale)
+
+        return Completion(
+            '{"tonality": "Нейтральная", "recommendations": ["a", "b"]}',
+            input_tokens,
+            output_tokens,
+        )
+
+
+async def measure(analyzer, completions, transcript, repeats, scale):
+    timings = []
+    calls_before = completions.calls
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = await analyzer.analyze_call(transcript)
+        timings.append((time.perf_counter() - started) / scale)
+        if not result.ok:
+            return None, completions.calls - calls_before
+    return statistics.median(timings), (completions.calls - calls_before) // repeats
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Сравнение задержки анализа длинных расшифровок"
+    )
+    parser.add_argument("--turns", type=int, nargs="+", default=[50, 200, 800, 3200])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--base-latency", type=float, default=0.4)
+    parser.add_argument("--prefill-rate", type=float, default=4000.0)
+    parser.add_argument("--decode-rate", type=float, default=150.0)
+    parser.add_argument("--context-limit", type=int, default=128_000)
+    parser.add_argument("--time-scale", type=float, default=0.05)
+    args = parser.parse_args()
+
+    logging.getLogger("call_assessment_bot").disabled = True
+
+    completions = SlowBackend(args)
+    analyzer = CallAnalyzer(backend=completions)
+    map_reduce_threshold = analyzer.long_threshold
+    rng = random.Random(args.seed)
+
+    print(
+        f"{'turns':>7} {'tokens':>8} {'single, s':>10} {'map-reduce, s':>14} {'calls':>6}"
+    )
+    for turns in args.turns:
+        transcript = make_transcript(turns, rng)
+
+        analyzer.long_threshold = float("inf")
+        single, _ = await measure(
+            analyzer, completions, transcript, args.repeats, args.time_scale
+        )
+
+        analyzer.long_threshold = map_reduce_threshold
+        chunked, calls = await measure(
+            analyzer, completions, transcript, args.repeats, args.time_scale
+        )
+
+        def fmt(value):
+            return "failed" if value is None else f"{value:.2f}"
+
+        print(
+            f"{turns:>7} {estimate_tokens(transcript):>8} {fmt(single):>10} "
+            f"{fmt(chunked):>14} {calls:>6}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,154 @@
+##
+# @file bench_microbatch.py
+# @author Roman Moroz
+# @brief Бенчмарк пакетных запросов к модели: отдельные запросы против `MicroBatcher`.
+# @details Скрипт запускает `--users` пользователей, каждый из которых в замкнутом
+#          цикле анализирует короткие синтетические расшифровки, и сравнивает два
+#          режима `CallAnalyzer`: каждая расшифровка отдельным запросом и пакетные
+#          запросы (`MICROBATCH_ENABLED`). Вместо модели используется `FakeBackend`:
+#          задержка запроса складывается из фиксированной части, обработки входных
+#          и генерации выходных токенов, а сервер модели обслуживает не более
+#          `--server-slots` запросов одновременно, как локальный сервер на одной GPU.
+#          Число одновременных пакетов ограничено `--batch-concurrency`
+#          (`MICROBATCH_MAX_CONCURRENCY`).
+#
+#          Для каждого режима печатаются пропускная способность, медиана и 95-й
+#          перцентиль задержки анализа, число запросов к модели и входных токенов
+#          на одну расшифровку. Задержки можно сжать параметром `--time-scale`,
+#          результаты выводятся в исходном (несжатом) масштабе.
+#
+#          Запуск из корня репозитория:
+#          `python benchmarks/bench_microbatch.py --users 4 16 64`
+
+import argparse
+import asyncio
+import logging
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+os.environ["CACHE_ENABLED"] = "false"
+os.environ["MICROBATCH_ENABLED"] = "true"
+
+from bench_long_transcripts import make_transcript  # noqa: E402
+from services.analyzer import CallAnalyzer  # noqa: E402
+from services.backends import FakeBackend  # noqa: E402
+
+
+class SlottedBackend(FakeBackend):
+    """!
+    @class SlottedBackend
+    @brief `FakeBackend`, который выполняет не более `slots` запросов одновременно.
+    """
+
+    def __init__(self, slots: int, **options):
+        super().__init__(**options)
+        self._slots = asyncio.Semaphore(slots)
+
+    async def complete(self, model, messages, **options):
+        async with self._slots:
+            return await super().complete(model, messages, **options)
+
+
+async def run(args, batched: bool, transcripts: list[str]) -> dict:
+    """!
+    @brief Прогоняет один режим и возвращает его показатели в исходном масштабе.
+    """
+
+    scale = args.time_scale
+    backend = SlottedBackend(
+        args.server_slots,
+        latency=args.base_latency * scale,
+        prefill_rate=args.prefill_rate / scale,
+        decode_rate=args.decode_rate / scale,
+    )
+    analyzer = CallAnalyzer(backend=backend)
+    if batched:
+        analyzer.batcher.max_wait = args.max_wait * scale
+        analyzer.batcher.max_concurrency = args.batch_concurrency or math.inf
+    else:
+        analyzer.batcher = None
+
+    timings: list[float] = []
+    failed = 0
+    deadline = time.perf_counter() + args.duration * scale
+
+    async def user(index: int) -> None:
+        nonlocal failed
+        position = index
+        while time.perf_counter() < deadline:
+            transcript = transcripts[position % len(transcripts)]
+            position += args.users
+            started = time.perf_counter()
+            result = await analyzer.analyze_call(transcript)
+            timings.append((time.perf_counter() - started) / scale)
+            if not result.ok:
+                failed += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(index) for index in range(args.users)))
+    elapsed = (time.perf_counter() - started) / scale
+    await analyzer.close()
+
+    timings.sort()
+    done = len(timings)
+    return {
+        "throughput": done / elapsed,
+        "p50": statistics.median(timings),
+        "p95": timings[min(done - 1, int(done * 0.95))],
+        "requests": backend.requests / done,
+        "prompt_tokens": backend.prompt_tokens / done,
+        "failed": failed,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Сравнение отдельных и пакетных запросов к модели"
+    )
+    parser.add_argument("--users", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--duration", type=float, default=60.0, help="секунд")
+    parser.add_argument("--turns", type=int, default=12, help="реплик в расшифровке")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-wait", type=float, default=0.05, help="секунд")
+    parser.add_argument("--server-slots", type=int, default=4)
+    parser.add_argument(
+        "--batch-concurrency", type=int, default=4, help="0 — без ограничения"
+    )
+    parser.add_argument("--base-latency", type=float, default=0.4)
+    parser.add_argument("--prefill-rate", type=float, default=4000.0)
+    parser.add_argument("--decode-rate", type=float, default=150.0)
+    parser.add_argument("--time-scale", type=float, default=0.05)
+    args = parser.parse_args()
+
+    logging.getLogger("call_assessment_bot").disabled = True
+
+    rng = random.Random(args.seed)
+    transcripts = [make_transcript(args.turns, rng) for _ in range(256)]
+
+    print(
+        f"{'users':>6} {'mode':>8} {'rps':>7} {'p50, s':>7} {'p95, s':>7} "
+        f"{'req/call':>9} {'tokens/call':>12} {'failed':>7}"
+    )
+    for users in args.users:
+        args.users = users
+        for batched in (False, True):
+            stats = await run(args, batched, transcripts)
+            print(
+                f"{users:>6} {'batch' if batched else 'single':>8} "
+                f"{stats['throughput']:>7.2f} {stats['p50']:>7.2f} "
+                f"{stats['p95']:>7.2f} {stats['requests']:>9.2f} "
+                f"{stats['prompt_tokens']:>12.0f} {stats['failed']:>7}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+##
+# @file bench_preprocessing.py
+# @author Roman Moroz
+# @brief Микробенчмарк очистки расшифровок перед отправкой в модель.
+# @details Скрипт генерирует синтетические расшифровки в формате системы
+#          распознавания речи (номера субтитров, временные метки, слова-паразиты,
+#          заикания, продублированные строки) заданных размеров, очищает их
+#          `TranscriptPreprocessor` и печатает время каждого этапа, общую
+#          скорость в МБ/с и долю сэкономленных оценочных токенов.
+#
+#          Запуск из корня репозитория:
+#          `python benchmarks/bench_preprocessing.py --sizes 10000 1000000`
+
+import argparse
+import os
+import random
+import sys
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+
+from services.preprocessing import STAGES, TranscriptPreprocessor  # noqa: E402
+
+PHRASES = (
+    "Здравствуйте, компания Связь, чем могу помочь?",
+    "У меня второй день не работает интернет.",
+    "Сейчас посмотрю, назовите, пожалуйста, номер договора.",
+    "Мастер приедет завтра в 10:30, вас устроит?",
+    "Спасибо, что разобрались так быстро.",
+    "Это уже третье обращение, и никто ничего не делает!",
+)
+FILLER_WORDS = ("ээ", "ну", "как бы", "типа", "ммм", "короче")
+
+
+def make_transcript(size: int, seed: int = 0) -> str:
+    """!
+    @brief Генерирует синтетическую расшифровку длиной не меньше `size` символов.
+    @param size [in] Желаемая длина в символах.
+    @param seed [in] Зерно генератора случайных чисел.
+    @return Текст расшифровки.
+    """
+
+    rng = random.Random(seed)
+    lines: list[str] = []
+    length = 0
+    index = 0
+    while length < size:
+        index += 1
+        seconds = index * 3
+        speaker = "ОПЕРАТОР" if index % 3 else "Клиент"
+        words = rng.choice(PHRASES).split()
+        for _ in range(rng.randint(0, 3)):
+            words.insert(rng.randrange(len(words)), rng.choice(FILLER_WORDS) + ",")
+        if rng.random() < 0.2:
+            words.insert(0, words[0].lower())
+        stamp = f"{seconds // 3600:02}:{seconds // 60 % 60:02}:{seconds % 60:02}"
+        line = f"[{stamp}] {speaker}: {' '.join(words)}"
+        block = [str(index), line]
+        if rng.random() < 0.1:
+            block.append(line)
+        lines.extend(block)
+        length += sum(len(item) + 1 for item in block)
+    return "\n".join(lines)
+
+
+def main() -> None:
+    """!
+    @brief Точка входа: разбирает аргументы и печатает таблицу результатов.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 5_000_000]
+    )
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--token-budget", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    preprocessor = TranscriptPreprocessor(args.stages, token_budget=args.token_budget)
+    header = f"{'size, chars':>12} " + " ".join(
+        f"{stage:>11}" for stage in preprocessor.stages
+    )
+    print(f"{header} {'total, ms':>10} {'MB/s':>7} {'tokens saved':>13}")
+
+    for size in args.sizes:
+        text = make_transcript(size)
+        runs = [preprocessor.process(text)[1] for _ in range(args.repeats)]
+        best = min(runs, key=lambda stats: stats.seconds)
+        megabytes = len(text.encode()) / 1e6
+        saved = (
+            100 * best.tokens_saved / best.tokens_before if best.tokens_before else 0
+        )
+        stages = " ".join(
+            f"{best.durations[stage] * 1000:>9.2f}ms" for stage in preprocessor.stages
+        )
+        print(
+            f"{len(text):>12} {stages} {best.seconds * 1000:>10.1f}"
+            f" {megabytes / best.seconds:>7.1f} {saved:>12.0f}%"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+##
+# @file bench_results_store.py
+# @author Roman Moroz
+# @brief Бенчмарк хранилища результатов анализа на большом журнале.
+# @details Скрипт заполняет временный файл `ResultsStore` синтетическими
+#          результатами (по умолчанию миллион записей от 500 пользователей
+#          за 90 дней, в хронологическом порядке, как при реальной работе) через
+#          обычный путь `record` с групповой фиксацией и печатает:
+#          - стоимость вызова `record` в цикле событий и скорость записи на диск;
+#          - время запросов `/stats` (пользователь и все пользователи) и `/history`.
+#
+#          Запуск из корня репозитория:
+#          `python benchmarks/bench_results_store.py --rows 1000000`
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+os.environ.setdefault("RESULTS_ENABLED", "false")
+
+from services.models import AnalysisResult, Tonality  # noqa: E402
+from services.results_store import ResultsStore  # noqa: E402
+
+RESULTS = [
+    AnalysisResult(tonality, ("Поблагодарите клиента.", "Уточните детали."))
+    for tonality in Tonality
+] + [AnalysisResult.failed("timeout")]
+
+
+async def fill(store: ResultsStore, rows: int, users: int, days: int) -> float:
+    """!
+    @brief Записывает `rows` результатов и ждет, пока они попадут на диск.
+    @return Время вызовов `record` в цикле событий, в секундах.
+    """
+
+    rng = random.Random(0)
+    first = time.time() - days * 86400
+    step = days * 86400 / rows
+    spent = 0.0
+    for start in range(0, rows, store.batch_size):
+        started = time.perf_counter()
+        for index in range(start, min(start + store.batch_size, rows)):
+            store.record(
+                user_id=rng.randrange(users),
+                chat_id=rng.randrange(users),
+                result=rng.choice(RESULTS),
+                latency=rng.lognormvariate(1, 0.5),
+                transcript_chars=rng.randrange(200, 5000),
+                created_at=first + index * step,
+            )
+        spent += time.perf_counter() - started
+        while store.pending > store.batch_size:
+            await asyncio.sleep(0.001)
+    return spent
+
+
+async def timed(call, repeats: int) -> float:
+    """!
+    @brief Медианное время асинхронного вызова, в миллисекундах.
+    """
+
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        await call()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+async def run(args) -> None:
+    with tempfile.TemporaryDirectory(prefix="bench-results-") as workdir:
+        store = ResultsStore(
+            os.path.join(workdir, "results.sqlite3"),
+            batch_size=args.batch_size,
+            flush_interval=0.05,
+            max_pending=args.rows,
+        )
+        await store.start()
+
+        started = time.perf_counter()
+        spent = await fill(store, args.rows, args.users, args.days)
+        await store.close()
+        elapsed = time.perf_counter() - started
+        print(f"rows:             {args.rows}")
+        print(f"record():         {spent / args.rows * 1e6:.2f} us/call in the loop")
+        print(f"write throughput: {args.rows / elapsed:,.0f} rows/s")
+
+        store = ResultsStore(os.path.join(workdir, "results.sqlite3"))
+        user = args.users // 2
+        queries = (
+            ("/stats (user, 30 days)", lambda: store.stats(user, 30)),
+            ("/stats all (90 days)", lambda: store.stats(None, 90)),
+            ("/history (10 rows)", lambda: store.history(user, 10)),
+        )
+        for title, call in queries:
+            print(f"{title:<24} {await timed(call, args.repeats):.2f} ms")
+        await store.close()
+
+
+def main() -> None:
+    """!
+    @brief Точка входа: разбирает аргументы и запускает бенчмарк.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--repeats", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+##
+# @file bench_startup.py
+# @author Roman Moroz
+# @brief Бенчмарк холодного старта бота: время импорта и время до первого ответа.
+# @details Скрипт измеряет две величины, важные при частых перезапусках контейнеров:
+#          - время импорта `main` по `python -X importtime` с разбивкой по пакетам
+#            верхнего уровня и список тяжелых библиотек, загруженных при импорте;
+#          - время от запуска процесса `python main.py` до первого запроса
+#            `getUpdates` и до первого ответа пользователю. Бот работает против
+#            заглушек из `fake_servers.py`, сообщение от пользователя уже ждет
+#            в очереди обновлений к моменту старта.
+#
+#          Каждое измерение повторяется `--repeats` раз, печатается медиана.
+#          Отчет можно сохранить в JSON (`--output`) и сравнить с предыдущим
+#          (`--compare`), как в `load_test.py`.
+#
+#          Запуск из корня репозитория:
+#          `python benchmarks/bench_startup.py --repeats 5 --output startup.json`
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import aiohttp
+
+import fake_servers
+
+from load_test import _free_port, _git_commit, _wait_for_port, configure_environment
+
+##
+# @var SRC_DIR
+# @brief Каталог с исходным кодом бота, из которого он запускается.
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+
+##
+# @var HEAVY_MODULES
+# @brief Библиотеки, которые не должны загружаться при импорте `main`.
+HEAVY_MODULES = ("openai", "colorlog", "httpx", "services.analyzer")
+
+
+def import_profile() -> dict:
+    """!
+    @brief Импортирует `main` в отдельном процессе под `-X importtime`.
+    @return Словарь с общим временем импорта (`total`), собственным временем
+            пакетов верхнего уровня (`packages`) и списком загруженных тяжелых
+            библиотек (`heavy`). Время в миллисекундах.
+    """
+
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    packages: dict[str, float] = {}
+    loaded: set[str] = set()
+    total = 0.0
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line.removeprefix("import time:").split("|")
+        name = name.strip()
+        loaded.add(name)
+        root = name.split(".")[0]
+        packages[root] = packages.get(root, 0.0) + int(own) / 1000
+        if name == "main":
+            total = int(cumulative) / 1000
+    return {
+        "total": total,
+        "packages": packages,
+        "heavy": [module for module in HEAVY_MODULES if module in loaded],
+    }
+
+
+async def first_update(args, telegram_url: str) -> dict:
+    """!
+    @brief Запускает бота и измеряет время до первых запросов к Telegram.
+    @details Перед запуском в заглушку Telegram ставится один диалог, после
+             первого ответа бота процесс останавливается сигналом SIGTERM.
+    @return Время (в секундах от запуска процесса) до первого вызова Bot API,
+            первого `getUpdates`, первого сообщения пользователю и итогового
+            сообщения о готовности.
+    """
+
+    async with aiohttp.ClientSession() as session:
+        await session.post(f"{telegram_url}/_control/reset")
+        started = time.time()
+        bot = await asyncio.create_subprocess_exec(
+            sys.executable, "main.py", cwd=SRC_DIR, stdout=subprocess.DEVNULL
+        )
+        try:
+            async with session.post(
+                f"{telegram_url}/_control/stage",
+                json={"users": 1, "duration": 0.001, "timeout": args.timeout},
+            ) as response:
+                stage = await response.json()
+            async with session.get(f"{telegram_url}/_control/stats") as response:
+                first_call = (await response.json())["first_call"]
+        finally:
+            bot.terminate()
+            await bot.wait()
+
+    if stage["outcomes"]["ok"] != 1:
+        raise RuntimeError(f"Бот не ответил на сообщение: {stage['outcomes']}")
+    return {
+        "first_api_call": min(first_call.values()) - started,
+        "first_get_updates": first_call["getUpdates"] - started,
+        "first_reply": first_call["sendMessage"] - started,
+        "ready": time.time() - started,
+    }
+
+
+def summarize(samples: list[dict]) -> dict:
+    """!
+    @brief Медиана каждой величины по повторам.
+    """
+
+    return {
+        key: statistics.median(sample[key] for sample in samples) for key in samples[0]
+    }
+
+
+def print_report(report: dict, top: int) -> None:
+    imports = report["imports"]
+    print(f"import main:        {imports['total']:8.1f} ms")
+    ranked = sorted(imports["packages"].items(), key=lambda item: -item[1])
+    for package, spent in ranked[:top]:
+        print(f"  {package:<16} {spent:8.1f} ms")
+    heavy = ", ".join(imports["heavy"]) or "нет"
+    print(f"heavy modules:      {heavy}")
+    for key, value in report["startup"].items():
+        print(f"{key + ':':<19} {value * 1000:8.0f} ms")
+
+
+def compare(report: dict, baseline_path: Path) -> None:
+    """!
+    @brief Печатает изменение основных величин относительно сохраненного отчета.
+    """
+
+    baseline = json.loads(baseline_path.read_text())
+    print(f"\nСравнение с {baseline_path} (коммит {baseline.get('commit') or '?'}):")
+    rows = [("import main", report["imports"]["total"], baseline["imports"]["total"])]
+    rows += [
+        (key, report["startup"][key] * 1000, baseline["startup"][key] * 1000)
+        for key in report["startup"]
+        if key in baseline["startup"]
+    ]
+    for title, new, old in rows:
+        change = f"{(new - old) / old * 100:+.0f}%" if old else "-"
+        print(f"  {title:<18} {old:8.0f} -> {new:8.0f} ms ({change})")
+
+
+def main() -> None:
+    """!
+    @brief Точка входа: разбирает аргументы, запускает заглушки и измерения.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="пакетов в разбивке")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="медиана, с")
+    parser.add_argument("--telegram-latency", type=float, default=0.0)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--output", type=Path, help="куда сохранить JSON-отчет")
+    parser.add_argument("--compare", type=Path, help="отчет для сравнения")
+    args = parser.parse_args()
+
+    telegram_port, openrouter_port = _free_port(args.host), _free_port(args.host)
+    configure_environment(
+        SimpleNamespace(host=args.host), telegram_port, openrouter_port
+    )
+    os.environ.setdefault("HTTP_WARMUP", "false")
+
+    context = multiprocessing.get_context("spawn")
+    fakes = context.Process(
+        target=fake_servers.serve,
+        args=(
+            args.host,
+            telegram_port,
+            openrouter_port,
+            {
+                "telegram_latency": args.telegram_latency,
+                "llm_latency": args.llm_latency,
+                "llm_sigma": 0.0,
+                "llm_error_rate": 0.0,
+                "turns": 10,
+                "seed": 1,
+            },
+        ),
+        name="fake-servers",
+        daemon=True,
+    )
+    fakes.start()
+
+    try:
+        asyncio.run(_wait_for_port(args.host, telegram_port))
+        asyncio.run(_wait_for_port(args.host, openrouter_port))
+        profiles = [import_profile() for _ in range(args.repeats)]
+        telegram_url = f"http://{args.host}:{telegram_port}"
+        runs = [
+            asyncio.run(first_update(args, telegram_url)) for _ in range(args.repeats)
+        ]
+    finally:
+        fakes.terminate()
+        fakes.join()
+
+    middle = sorted(profiles, key=lambda profile: profile["total"])[args.repeats // 2]
+    report = {
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "repeats": args.repeats,
+        "imports": middle,
+        "startup": summarize(runs),
+    }
+    print_report(report, args.top)
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+##
+# @file eval_tonality.py
+# @author Roman Moroz
+# @brief Оценка локального классификатора тональности по разметке модели.
+# @details Скрипт сравнивает ответы `LexiconScorer` с тональностью, которую
+#          определила модель, и печатает точность, полноту по классам, матрицу
+#          ошибок, долю диалогов, прошедших порог уверенности упрощенного пути,
+#          и точность на них, а также пропускную способность в расшифровках
+#          в секунду.
+#
+#          Разметку удобно получить пакетным анализом: отправьте боту файл
+#          с расшифровками и передайте скрипту тот же файл и полученный отчет:
+#          `python benchmarks/eval_tonality.py --transcripts calls.jsonl --labels results.csv`
+#
+#          Либо передайте один JSONL-файл с полями `transcript` и `tonality`:
+#          `python benchmarks/eval_tonality.py --data labeled.jsonl`
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+
+from config.config import settings  # noqa: E402
+from services.batch import iter_transcripts  # noqa: E402
+from services.models import Tonality  # noqa: E402
+from services.tonality import LexiconScorer  # noqa: E402
+
+
+def load_labeled(path: Path) -> list[tuple[str, Tonality]]:
+    """!
+    @brief Загружает JSONL-файл с полями `transcript` и `tonality`.
+    """
+
+    samples = []
+    with open(path, encoding="utf-8") as stream:
+        for line in stream:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            label = Tonality.parse(record.get("tonality"))
+            if label is not None and record.get("transcript"):
+                samples.append((record["transcript"], label))
+    return samples
+
+
+def load_joined(transcripts: Path, labels: Path) -> list[tuple[str, Tonality]]:
+    """!
+    @brief Соединяет файл расшифровок и отчет пакетного анализа по `id`.
+    @details Записи с ошибкой анализа или без тональности пропускаются.
+    """
+
+    if labels.suffix.lower() == ".csv":
+        with open(labels, encoding="utf-8", newline="") as stream:
+            rows = list(csv.DictReader(stream))
+    else:
+        with open(labels, encoding="utf-8") as stream:
+            rows = [json.loads(line) for line in stream if line.strip()]
+
+    by_id = {}
+    for row in rows:
+        label = Tonality.parse(row.get("tonality"))
+        if label is not None and not row.get("error"):
+            by_id[str(row["id"])] = label
+
+    return [
+        (item.transcript, by_id[item.call_id])
+        for item in iter_transcripts(
+            transcripts,
+            transcripts.name,
+            max_member_size=settings.BATCH_ZIP_MAX_MEMBER_SIZE,
+            max_unpacked_size=settings.BATCH_ZIP_MAX_UNPACKED_SIZE,
+        )
+        if not item.error and item.call_id in by_id
+    ]
+
+
+def main() -> None:
+    """!
+    @brief Точка входа: разбирает аргументы и печатает отчет.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data", type=Path, help="JSONL с transcript и tonality")
+    parser.add_argument("--transcripts", type=Path, help="файл для пакетного анализа")
+    parser.add_argument("--labels", type=Path, help="отчет пакетного анализа")
+    parser.add_argument("--lexicon", help="дополнительный словарь (TSV)")
+    parser.add_argument(
+        "--threshold", type=float, default=settings.TONALITY_FAST_THRESHOLD
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.data:
+        samples = load_labeled(args.data)
+    elif args.transcripts and args.labels:
+        samples = load_joined(args.transcripts, args.labels)
+    else:
+        parser.error("pass --data or both --transcripts and --labels")
+    if not samples:
+        parser.error("no labeled transcripts found")
+
+    scorer = LexiconScorer.from_file(args.lexicon)
+    estimates = [scorer.score(text) for text, _ in samples]
+
+    classes = list(Tonality)
+    confusion = {(truth, guess): 0 for truth in classes for guess in classes}
+    for (_, truth), estimate in zip(samples, estimates):
+        confusion[truth, estimate.tonality] += 1
+
+    total = len(samples)
+    correct = sum(confusion[label, label] for label in classes)
+    print(f"transcripts: {total}")
+    print(f"accuracy:    {correct / total:.1%}")
+    print()
+
+    print(f"{'class':<12} {'precision':>9} {'recall':>7} {'support':>8}")
+    for label in classes:
+        predicted = sum(confusion[truth, label] for truth in classes)
+        support = sum(confusion[label, guess] for guess in classes)
+        precision = confusion[label, label] / predicted if predicted else 0.0
+        recall = confusion[label, label] / support if support else 0.0
+        print(f"{label.value:<12} {precision:>9.1%} {recall:>7.1%} {support:>8}")
+    print()
+
+    print("confusion (rows: model label, columns: local guess)")
+    print(" " * 12 + "".join(f"{label.value:>13}" for label in classes))
+    for truth in classes:
+        row = "".join(f"{confusion[truth, guess]:>13}" for guess in classes)
+        print(f"{truth.value:<12}{row}")
+    print()
+
+    confident = [
+        (truth, estimate)
+        for (_, truth), estimate in zip(samples, estimates)
+        if estimate.confidence >= args.threshold
+    ]
+    confident_correct = sum(truth == estimate.tonality for truth, estimate in confident)
+    print(f"fast path at confidence >= {args.threshold:.2f}:")
+    print(f"  coverage: {len(confident) / total:.1%} ({len(confident)} transcripts)")
+    if confident:
+        print(f"  accuracy: {confident_correct / len(confident):.1%}")
+    print()
+
+    texts = [text for text, _ in samples]
+    started = time.perf_counter()
+    for _ in range(args.repeats):
+        for text in texts:
+            scorer.score(text)
+    elapsed = time.perf_counter() - started
+    scored = total * args.repeats
+    chars = sum(map(len, texts)) * args.repeats
+    print(f"throughput: {scored / elapsed:,.0f} transcripts/s")
+    print(f"            {elapsed / scored * 1e6:,.1f} us/transcript")
+    print(f"            {chars / elapsed / 1e6:,.1f} M chars/s")
+
+
+if __name__ == "__main__":
+    main()
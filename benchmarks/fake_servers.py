@@ -0,0 +1,508 @@
+##
+# @file fake_servers.py
+# @author Roman Moroz
+# @brief Локальные заглушки OpenRouter и Telegram Bot API для нагрузочного теста.
+# @details Этот модуль содержит два aiohttp-приложения, которые позволяют запустить
+#          бота целиком без сети и без настоящих ключей:
+#          - `FakeOpenRouter` — OpenAI-совместимый `/chat/completions` (в том числе
+#            потоковый) с настраиваемым распределением задержки и долей ошибок;
+#          - `FakeTelegram` — Bot API, который отдает боту синтетические обновления
+#            через `getUpdates`, записывает отправленные и отредактированные сообщения
+#            и моделирует пользователей, ожидающих ответа бота.
+#
+#          Обе заглушки запускаются функцией `serve` в отдельном процессе, чтобы их
+#          работа не искажала задержку цикла событий бота. Нагрузкой управляет
+#          `load_test.py` через служебный эндпоинт `/_control/stage`.
+
+import asyncio
+import json
+import math
+import random
+import time
+
+from collections import deque
+from dataclasses import dataclass
+
+from aiohttp import web
+
+##
+# @var READY_TEXT
+# @brief Фраза, которой бот завершает ответ на диалог.
+READY_TEXT = "Готов к анализу"
+
+##
+# @var ERROR_MARKER
+# @brief Фрагмент сообщения о неудачном анализе (`formatter.ERROR_TEXT`).
+ERROR_MARKER = "Ошибка анализа"
+
+##
+# @var REJECTED_MARKER
+# @brief Фрагмент ответа бота при переполненной очереди анализа.
+REJECTED_MARKER = "слишком много запросов"
+
+##
+# @var ANSWER
+# @brief Ответ фиктивной модели в формате, который ожидает `CallAnalyzer`.
+ANSWER = json.dumps(
+    {
+        "tonality": "Нейтральная",
+        "recommendations": [
+            "Оператору стоит назвать свое имя в начале разговора.",
+            "В конце разговора стоит уточнить, остались ли у клиента вопросы.",
+        ],
+    },
+    ensure_ascii=False,
+)
+
+PHRASES = (
+    "здравствуйте чем могу помочь",
+    "хочу узнать статус заказа",
+    "назовите пожалуйста номер договора",
+    "подождите минуту я проверю",
+    "курьер привезет заказ завтра до обеда",
+    "можно ли перенести доставку на выходные",
+    "конечно я оформлю перенос",
+    "спасибо за обращение хорошего дня",
+    "у меня списали оплату дважды",
+    "деньги вернутся в течение трех дней",
+)
+
+
+def make_transcript(rng: random.Random, turns: int) -> str:
+    """!
+    @brief Генерирует синтетическую расшифровку из заданного числа реплик.
+    @details В конец добавляется случайный номер обращения, чтобы каждая расшифровка
+             была уникальной и не попадала в кэш результатов.
+    """
+
+    lines = [
+        f"{'Оператор' if index % 2 == 0 else 'Клиент'}: "
+        f"{rng.choice(PHRASES).capitalize()}."
+        for index in range(turns)
+    ]
+    lines.append(f"Номер обращения {rng.getrandbits(48):x}.")
+    return "\n".join(lines)
+
+
+@dataclass(slots=True)
+class LatencyModel:
+    """!
+    @class LatencyModel
+    @brief Логнормальное распределение задержки ответа и доля ошибок.
+    @details `median` — медиана задержки в секундах, `sigma` — стандартное
+             отклонение логарифма (0 — постоянная задержка, 0.5 — заметный хвост).
+    """
+
+    median: float = 0.0
+    sigma: float = 0.0
+    error_rate: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median <= 0:
+            return 0.0
+        return self.median * math.exp(self.sigma * rng.gauss(0, 1))
+
+
+class FakeOpenRouter:
+    """!
+    @class FakeOpenRouter
+    @brief OpenAI-совместимый API с моделью задержки и ошибок.
+    @details Часть ошибок (`rate_limit_share`) возвращается как `429` с заголовком
+             `Retry-After`, остальные — как `500`. В потоковом режиме ответ делится
+             на `chunks` фрагментов; первый приходит через `ttft_share` от полной
+             задержки, остальные — равномерно за оставшееся время.
+             На пакетный запрос (сообщение пользователя — JSON-массив объектов
+             с `id`) возвращается `{"results": [...]}` с ответом для каждого `id`.
+    """
+
+    def __init__(
+        self,
+        latency: LatencyModel,
+        *,
+        rate_limit_share: float = 0.5,
+        ttft_share: float = 0.3,
+        chunks: int = 8,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.rate_limit_share = rate_limit_share
+        self.ttft_share = ttft_share
+        self.chunks = chunks
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/api/v1/chat/completions", self.completions)
+        app.router.add_route("*", "/api/v1", self.root)
+        app.router.add_get("/_control/stats", self.stats)
+        return app
+
+    async def root(self, request: web.Request) -> web.Response:
+        return web.Response(text="fake openrouter")
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"requests": self.requests, "errors": self.errors})
+
+    async def completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests += 1
+        duration = self.latency.sample(self.rng)
+
+        if self.rng.random() < self.latency.error_rate:
+            self.errors += 1
+            await asyncio.sleep(duration * self.ttft_share)
+            if self.rng.random() < self.rate_limit_share:
+                return web.json_response(
+                    {"error": {"message": "Rate limit exceeded", "code": 429}},
+                    status=429,
+                    headers={"Retry-After": "0.2"},
+                )
+            return web.json_response(
+                {"error": {"message": "Upstream error", "code": 500}}, status=500
+            )
+
+        model = body.get("model", "fake")
+        if body.get("stream"):
+            return await self._stream(request, model, duration)
+
+        await asyncio.sleep(duration)
+        answer = self._answer(body)
+        return web.json_response(
+            {
+                **self._envelope(model, "chat.completion"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": answer},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": self._usage(body, answer),
+            }
+        )
+
+    async def _stream(
+        self, request: web.Request, model: str, duration: float
+    ) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        envelope = self._envelope(model, "chat.completion.chunk")
+
+        await asyncio.sleep(duration * self.ttft_share)
+        step = math.ceil(len(ANSWER) / self.chunks)
+        pause = duration * (1 - self.ttft_share) / self.chunks
+        for offset in range(0, len(ANSWER), step):
+            if offset:
+                await asyncio.sleep(pause)
+            delta = {"content": ANSWER[offset : offset + step]}
+            await self._event(response, envelope, delta, None)
+        await self._event(response, envelope, {}, "stop")
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    @staticmethod
+    async def _event(response, envelope, delta, finish_reason) -> None:
+        chunk = {
+            **envelope,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+
+    @staticmethod
+    def _envelope(model: str, kind: str) -> dict:
+        return {
+            "id": f"gen-{time.monotonic_ns()}",
+            "object": kind,
+            "created": int(time.time()),
+            "model": model,
+        }
+
+    @staticmethod
+    def _answer(body: dict) -> str:
+        content = body["messages"][-1].get("content", "")
+        if not content.startswith("["):
+            return ANSWER
+        try:
+            items = json.loads(content)
+        except json.JSONDecodeError:
+            return ANSWER
+        results = [
+            {"id": item["id"], **json.loads(ANSWER)}
+            for item in items
+            if isinstance(item, dict) and "id" in item
+        ]
+        return json.dumps({"results": results}, ensure_ascii=False)
+
+    @staticmethod
+    def _usage(body: dict, answer: str) -> dict:
+        prompt = sum(len(m.get("content", "")) for m in body["messages"]) // 4
+        completion = len(answer) // 4
+        return {
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "total_tokens": prompt + completion,
+        }
+
+
+class FakeTelegram:
+    """!
+    @class FakeTelegram
+    @brief Bot API, который сам порождает пользователей и измеряет сквозную задержку.
+    @details
+    Каждый виртуальный пользователь работает по замкнутому циклу: отправляет
+    расшифровку, ждет, пока бот ответит сообщением "Готов к анализу..." (или
+    откажет из-за переполненной очереди), выжидает `think_time` и отправляет
+    следующую. Сквозная задержка — время от появления обновления в `getUpdates`
+    до завершающего сообщения бота. Если перед этим бот отредактировал сообщение
+    текстом об ошибке анализа, диалог считается неудачным.
+
+    Если задан `rate_limit`, заглушка, как настоящий Telegram, отвечает ошибкой 429
+    с `retry_after` на отправку и правку сообщений сверх этого числа в секунду.
+    """
+
+    def __init__(
+        self,
+        latency: LatencyModel,
+        *,
+        turns: int = 30,
+        seed: int = 0,
+        rate_limit: int = 0,
+    ):
+        self.latency = latency
+        self.turns = turns
+        self.rng = random.Random(seed)
+        self.rate_limit = rate_limit
+        self.calls: dict[str, int] = {}
+        self.first_call: dict[str, float] = {}
+        self.flood_errors = 0
+        self._sent: deque[float] = deque()
+
+        self._updates: list[dict] = []
+        self._update_id = 0
+        self._message_id = 0
+        self._has_updates = asyncio.Event()
+        self._waiters: dict[int, asyncio.Future] = {}
+        self._failed: set[int] = set()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.method)
+        app.router.add_post("/_control/stage", self.stage)
+        app.router.add_get("/_control/stats", self.stats)
+        app.router.add_post("/_control/reset", self.reset)
+        return app
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "calls": self.calls,
+                "first_call": self.first_call,
+                "flood_errors": self.flood_errors,
+            }
+        )
+
+    async def reset(self, request: web.Request) -> web.Response:
+        """!
+        @brief Обнуляет счетчики вызовов и очередь обновлений перед новым запуском бота.
+        """
+
+        self.calls.clear()
+        self.first_call.clear()
+        self.flood_errors = 0
+        self._updates.clear()
+        return web.json_response({"ok": True})
+
+    async def method(self, request: web.Request) -> web.Response:
+        name = request.match_info["method"]
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.first_call.setdefault(name, time.time())
+        params = dict(await request.post())
+
+        if name == "getUpdates":
+            result = await self._get_updates(params)
+        else:
+            await asyncio.sleep(self.latency.sample(self.rng))
+            if name == "getMe":
+                result = self._bot_user()
+            elif name in ("sendMessage", "editMessageText"):
+                if self._flooded():
+                    self.flood_errors += 1
+                    return web.json_response(
+                        {
+                            "ok": False,
+                            "error_code": 429,
+                            "description": "Too Many Requests: retry after 1",
+                            "parameters": {"retry_after": 1},
+                        }
+                    )
+                result = self._record(name, params)
+            else:
+                result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def stage(self, request: web.Request) -> web.Response:
+        """!
+        @brief Запускает этап нагрузки и возвращает его результаты.
+        @details Тело запроса: `{"users": N, "duration": S, "think_time": T,
+                 "timeout": S}`. Диалог, на который бот не ответил за `timeout`
+                 секунд, считается зависшим.
+        """
+
+        options = await request.json()
+        deadline = time.monotonic() + options["duration"]
+        think_time = options.get("think_time", 0.0)
+        timeout = options.get("timeout", 120.0)
+        latencies: list[float] = []
+        outcomes = {"ok": 0, "error": 0, "rejected": 0, "timeout": 0}
+
+        async def user(user_id: int) -> None:
+            while time.monotonic() < deadline:
+                started = time.monotonic()
+                try:
+                    outcome = await asyncio.wait_for(self.converse(user_id), timeout)
+                except asyncio.TimeoutError:
+                    outcome = "timeout"
+                outcomes[outcome] += 1
+                if outcome == "ok":
+                    latencies.append(time.monotonic() - started)
+                if think_time:
+                    await asyncio.sleep(think_time)
+
+        started = time.monotonic()
+        await asyncio.gather(*(user(index + 1) for index in range(options["users"])))
+        return web.json_response(
+            {
+                "elapsed": time.monotonic() - started,
+                "outcomes": outcomes,
+                "latencies": latencies,
+            }
+        )
+
+    async def converse(self, user_id: int) -> str:
+        """!
+        @brief Отправляет боту одну расшифровку от пользователя и ждет ответа.
+        @return "ok", "error" или "rejected".
+        """
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[user_id] = waiter
+        self._failed.discard(user_id)
+
+        self._update_id += 1
+        self._message_id += 1
+        self._updates.append(
+            {
+                "update_id": self._update_id,
+                "message": {
+                    "message_id": self._message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": {
+                        "id": user_id,
+                        "is_bot": False,
+                        "first_name": "Load",
+                        "username": f"user{user_id}",
+                    },
+                    "text": make_transcript(self.rng, self.turns),
+                },
+            }
+        )
+        self._has_updates.set()
+        return await waiter
+
+    def _flooded(self) -> bool:
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        while self._sent and self._sent[0] <= now - 1:
+            self._sent.popleft()
+        if len(self._sent) >= self.rate_limit:
+            return True
+        self._sent.append(now)
+        return False
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._has_updates.clear()
+            try:
+                await asyncio.wait_for(self._has_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    def _record(self, name: str, params: dict) -> dict:
+        chat_id = int(params["chat_id"])
+        text = params.get("text", "")
+        if name == "sendMessage":
+            self._message_id += 1
+            message_id = self._message_id
+        else:
+            message_id = int(params["message_id"])
+
+        if ERROR_MARKER in text:
+            self._failed.add(chat_id)
+        waiter = self._waiters.get(chat_id)
+        if waiter is not None and not waiter.done():
+            if READY_TEXT in text:
+                waiter.set_result("error" if chat_id in self._failed else "ok")
+            elif REJECTED_MARKER in text:
+                waiter.set_result("rejected")
+
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": self._bot_user(),
+            "text": text,
+        }
+
+    @staticmethod
+    def _bot_user() -> dict:
+        return {
+            "id": 1,
+            "is_bot": True,
+            "first_name": "Call rating bot",
+            "username": "call_rating_load_test_bot",
+        }
+
+
+def serve(host: str, telegram_port: int, openrouter_port: int, options: dict) -> None:
+    """!
+    @brief Запускает обе заглушки в текущем процессе до его завершения.
+    @param options [in] Параметры `LatencyModel` и генератора расшифровок.
+    """
+
+    telegram = FakeTelegram(
+        LatencyModel(options["telegram_latency"]),
+        turns=options["turns"],
+        seed=options["seed"],
+        rate_limit=options.get("telegram_rate_limit", 0),
+    )
+    openrouter = FakeOpenRouter(
+        LatencyModel(
+            options["llm_latency"], options["llm_sigma"], options["llm_error_rate"]
+        ),
+        seed=options["seed"],
+    )
+
+    async def run() -> None:
+        runners = []
+        for app, port in (
+            (telegram.app(), telegram_port),
+            (openrouter.app(), openrouter_port),
+        ):
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, host, port).start()
+            runners.append(runner)
+        await asyncio.Event().wait()
+
+    asyncio.run(run())
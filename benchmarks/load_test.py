@@ -0,0 +1,403 @@
+##
+# @file load_test.py
+# @author Roman Moroz
+# @brief Нагрузочный тест бота целиком, без сети и без настоящих ключей.
+# @details Скрипт запускает в отдельном процессе заглушки Telegram Bot API и OpenRouter
+#          (`fake_servers.py`), направляет на них бота через `TELEGRAM_API_URL` и
+#          `OPENROUTER_BASE_URL` и запускает его в этом процессе в режиме поллинга
+#          с настоящими диспетчером, middleware, хендлерами, планировщиком
+#          и `CallAnalyzer`. Затем число одновременных пользователей поэтапно
+#          увеличивается, и для каждого этапа измеряются пропускная способность,
+#          p50/p95/p99 сквозной задержки, потребление памяти и задержка цикла
+#          событий бота.
+#
+#          Результат сохраняется в JSON-отчет; с `--compare` отчет сравнивается
+#          с ранее сохраненным, поэтому регрессии в `handle_text_message`,
+#          `LoggingMiddleware` или `CallAnalyzer` видны в цифрах. Остальные
+#          настройки бота (например, `STREAMING_ENABLED=false` или
+#          `SCHEDULER_MAX_CONCURRENCY=16`) можно передать через окружение.
+#
+#          Запуск из корня репозитория:
+#          `python benchmarks/load_test.py --users 1 10 50 --stage-duration 20 --output report.json`
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import fake_servers  # noqa: E402
+
+
+def configure_environment(args, telegram_port: int, openrouter_port: int) -> None:
+    """!
+    @brief Направляет бота на заглушки и отключает все, что искажает измерения.
+    @details Кэш результатов отключен, так как каждая расшифровка уникальна,
+             а сервер метрик — чтобы не занимать порт. Логи и хранилище результатов
+             пишутся во временный каталог; значения, уже заданные в окружении,
+             не перезаписываются.
+    """
+
+    os.environ["BOT_TOKEN"] = "42:load-test"
+    os.environ["OPENROUTER_API_KEY"] = "load-test"
+    os.environ["TELEGRAM_API_URL"] = f"http://{args.host}:{telegram_port}"
+    os.environ["OPENROUTER_BASE_URL"] = f"http://{args.host}:{openrouter_port}/api/v1"
+    os.environ["CACHE_ENABLED"] = "false"
+    os.environ["METRICS_ENABLED"] = "false"
+    os.environ.setdefault("APP_ENV", "production")
+    os.environ.setdefault("LOG_CONSOLE_LEVEL", "WARNING")
+    workdir = tempfile.mkdtemp(prefix="load-test-")
+    os.environ.setdefault("LOG_DIR", os.path.join(workdir, "logs"))
+    os.environ.setdefault("RESULTS_DB_PATH", os.path.join(workdir, "results.sqlite3"))
+
+
+class LoopLagMonitor:
+    """!
+    @class LoopLagMonitor
+    @brief Измеряет задержку цикла событий: насколько позже срока просыпается `sleep`.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(time.perf_counter() - started - self.interval)
+
+
+def percentiles(values: list[float]) -> dict:
+    """!
+    @brief Возвращает p50, p95, p99 и максимум выборки в миллисекундах.
+    """
+
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    if len(values) == 1:
+        cuts = values * 99
+    else:
+        cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {
+        "p50": round(cuts[49] * 1000, 2),
+        "p95": round(cuts[94] * 1000, 2),
+        "p99": round(cuts[98] * 1000, 2),
+        "max": round(max(values) * 1000, 2),
+    }
+
+
+def memory_mb() -> tuple[float, float]:
+    """!
+    @brief Возвращает текущий и пиковый объем резидентной памяти процесса, в МБ.
+    """
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    try:
+        with open("/proc/self/statm") as stream:
+            pages = int(stream.read().split()[1])
+        current = pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        current = peak
+    return round(current, 1), round(peak, 1)
+
+
+async def run(args, telegram_url: str, openrouter_url: str) -> list[dict]:
+    """!
+    @brief Запускает бота, прогоняет этапы нагрузки и возвращает их результаты.
+    """
+
+    from core.logger import setup_logger, stop_logging
+    from main import create_bot, create_dispatcher
+
+    logger = setup_logger()
+    bot = create_bot()
+    dispatcher = create_dispatcher(logger)
+    polling = asyncio.create_task(
+        dispatcher.start_polling(bot, handle_signals=False, polling_timeout=1)
+    )
+    monitor = LoopLagMonitor()
+    monitor.start()
+    stages = []
+
+    async with aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=None)
+    ) as session:
+
+        async def stage(users: int, duration: float) -> dict:
+            async with session.post(
+                f"{telegram_url}/_control/stage",
+                json={
+                    "users": users,
+                    "duration": duration,
+                    "think_time": args.think_time,
+                    "timeout": args.timeout,
+                },
+            ) as response:
+                return await response.json()
+
+        async def llm_requests() -> int:
+            async with session.get(f"{openrouter_url}/_control/stats") as response:
+                return (await response.json())["requests"]
+
+        async def flood_errors() -> int:
+            async with session.get(f"{telegram_url}/_control/stats") as response:
+                return (await response.json())["flood_errors"]
+
+        try:
+            if args.warmup:
+                await stage(1, args.warmup)
+
+            for users in args.users:
+                monitor.samples.clear()
+                requests_before = await llm_requests()
+                floods_before = await flood_errors()
+                result = await stage(users, args.stage_duration)
+                requests_after = await llm_requests()
+                floods_after = await flood_errors()
+                current, peak = memory_mb()
+
+                outcomes = result["outcomes"]
+                stages.append(
+                    {
+                        "users": users,
+                        "elapsed_s": round(result["elapsed"], 2),
+                        "completed": outcomes["ok"],
+                        "outcomes": outcomes,
+                        "throughput_per_s": round(
+                            outcomes["ok"] / result["elapsed"], 2
+                        ),
+                        "latency_ms": percentiles(result["latencies"]),
+                        "loop_lag_ms": percentiles(monitor.samples),
+                        "llm_requests": requests_after - requests_before,
+                        "telegram_429": floods_after - floods_before,
+                        "rss_mb": current,
+                        "peak_rss_mb": peak,
+                    }
+                )
+                print_stage(stages[-1])
+        finally:
+            await monitor.stop()
+            await dispatcher.stop_polling()
+            await polling
+            await bot.session.close()
+            stop_logging()
+
+    return stages
+
+
+def print_stage(stage: dict) -> None:
+    latency, lag = stage["latency_ms"], stage["loop_lag_ms"]
+    failed = stage["outcomes"]["error"] + stage["outcomes"]["timeout"]
+    print(
+        f"{stage['users']:>6} {stage['throughput_per_s']:>8.2f} "
+        f"{_ms(latency['p50']):>8} {_ms(latency['p95']):>8} {_ms(latency['p99']):>8} "
+        f"{_ms(lag['p99']):>8} {_ms(lag['max']):>8} "
+        f"{failed:>6} {stage['outcomes']['rejected']:>8} {stage['telegram_429']:>5} "
+        f"{stage['rss_mb']:>7.1f}",
+        flush=True,
+    )
+
+
+def compare(stages: list[dict], baseline_path: Path) -> None:
+    """!
+    @brief Печатает изменение ключевых показателей относительно другого отчета.
+    @details Этапы сопоставляются по числу пользователей.
+    """
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    previous = {stage["users"]: stage for stage in baseline["stages"]}
+    print()
+    print(f"compared with {baseline_path} ({baseline['meta'].get('git_commit')}):")
+    print(f"{'users':>6} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'lag p99':>9}")
+    for stage in stages:
+        old = previous.get(stage["users"])
+        if old is None:
+            continue
+        row = [
+            _delta(stage["throughput_per_s"], old["throughput_per_s"]),
+            *(
+                _delta(stage["latency_ms"][key], old["latency_ms"][key])
+                for key in ("p50", "p95", "p99")
+            ),
+            _delta(stage["loop_lag_ms"]["p99"], old["loop_lag_ms"]["p99"]),
+        ]
+        print(f"{stage['users']:>6} " + " ".join(f"{cell:>9}" for cell in row))
+
+
+def _delta(new, old) -> str:
+    if new is None or not old:
+        return "-"
+    return f"{(new - old) / old:+.1%}"
+
+
+def _ms(value) -> str:
+    return "-" if value is None else f"{value:.0f}"
+
+
+def _free_port(host: str) -> int:
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_for_port(host: str, port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+        else:
+            writer.close()
+            return
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    """!
+    @brief Точка входа: разбирает аргументы, запускает заглушки и бота, пишет отчет.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 5, 10, 25, 50])
+    parser.add_argument("--stage-duration", type=float, default=15.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--think-time", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--turns", type=int, default=30, help="реплик в расшифровке")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="медиана, с")
+    parser.add_argument("--llm-sigma", type=float, default=0.4)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.03)
+    parser.add_argument(
+        "--telegram-rate-limit",
+        type=int,
+        default=0,
+        help="сообщений в секунду, сверх которых заглушка отвечает 429 (0 — без лимита)",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--output", type=Path, help="куда сохранить JSON-отчет")
+    parser.add_argument("--compare", type=Path, help="отчет для сравнения")
+    args = parser.parse_args()
+
+    telegram_port, openrouter_port = _free_port(args.host), _free_port(args.host)
+    configure_environment(args, telegram_port, openrouter_port)
+
+    context = multiprocessing.get_context("spawn")
+    fakes = context.Process(
+        target=fake_servers.serve,
+        args=(
+            args.host,
+            telegram_port,
+            openrouter_port,
+            {
+                "telegram_latency": args.telegram_latency,
+                "telegram_rate_limit": args.telegram_rate_limit,
+                "llm_latency": args.llm_latency,
+                "llm_sigma": args.llm_sigma,
+                "llm_error_rate": args.llm_error_rate,
+                "turns": args.turns,
+                "seed": args.seed,
+            },
+        ),
+        name="fake-servers",
+        daemon=True,
+    )
+    fakes.start()
+
+    print(
+        f"{'users':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'lag p99':>8} {'lag max':>8} {'failed':>6} {'rejected':>8} {'429':>5} "
+        f"{'rss MB':>7}"
+    )
+    try:
+        asyncio.run(_wait_for_port(args.host, telegram_port))
+        asyncio.run(_wait_for_port(args.host, openrouter_port))
+        stages = asyncio.run(
+            run(
+                args,
+                f"http://{args.host}:{telegram_port}",
+                f"http://{args.host}:{openrouter_port}",
+            )
+        )
+    finally:
+        fakes.terminate()
+        fakes.join()
+
+    from config.config import settings
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "args": {
+                key: str(value) if isinstance(value, Path) else value
+                for key, value in vars(args).items()
+            },
+            "settings": {
+                key: getattr(settings, key)
+                for key in (
+                    "STREAMING_ENABLED",
+                    "STREAM_EDIT_INTERVAL",
+                    "SCHEDULER_MAX_CONCURRENCY",
+                    "SCHEDULER_PER_USER_LIMIT",
+                    "SCHEDULER_MAX_QUEUE_SIZE",
+                    "HTTP_MAX_CONNECTIONS",
+                    "LOG_FORMAT",
+                )
+            },
+        },
+        "stages": stages,
+    }
+    if args.output:
+        args.output.write_text(
+            json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+        print(f"\nreport saved to {args.output}")
+    if args.compare:
+        compare(stages, args.compare)
+
+
+if __name__ == "__main__":
+    main()
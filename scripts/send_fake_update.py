@@ -0,0 +1,77 @@
+##
+# @file send_fake_update.py
+# @author Roman Moroz
+# @brief Отправляет поддельное обновление Telegram на локальный вебхук бота.
+# @details Скрипт позволяет проверить режим вебхука без участия Telegram: он
+#          формирует JSON-объект `Update` с текстовым сообщением и отправляет его
+#          POST-запросом на адрес вебхука вместе с секретным заголовком.
+#          Ответы бота при этом уходят в настоящий Bot API, поэтому для полной
+#          проверки укажите свой `--chat-id`.
+#
+#          Пример запуска из корня репозитория:
+#          `python scripts/send_fake_update.py --secret change_me --text "Оператор: ..."`
+
+import argparse
+import json
+import time
+import urllib.request
+
+
+def build_update(update_id: int, chat_id: int, text: str) -> dict:
+    """!
+    @brief Формирует минимальный объект `Update` с личным текстовым сообщением.
+    """
+
+    user = {"id": chat_id, "is_bot": False, "first_name": "Test", "username": "test"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": "Test"},
+            "from": user,
+            "text": text,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Отправка поддельного обновления на вебхук"
+    )
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default=None)
+    parser.add_argument("--chat-id", type=int, default=1)
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument(
+        "--text",
+        default=(
+            "Оператор: Здравствуйте, чем могу помочь? "
+            "Клиент: Мой заказ задерживается уже неделю, и никто не отвечает."
+        ),
+    )
+    args = parser.parse_args()
+
+    headers = {"Content-Type": "application/json"}
+    if args.secret:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = args.secret
+
+    base_id = int(time.time())
+    for index in range(args.count):
+        payload = build_update(base_id + index, args.chat_id, args.text)
+        request = urllib.request.Request(
+            args.url,
+            data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+            headers=headers,
+            method="POST",
+        )
+        started = time.perf_counter()
+        with urllib.request.urlopen(request) as response:
+            print(
+                f"update {payload['update_id']}: HTTP {response.status} "
+                f"in {(time.perf_counter() - started) * 1000:.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
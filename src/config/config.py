@@ -6,10 +6,23 @@
 # доступа к настройкам приложения, таким как API-токены, с использованием
 # переменных окружения из `.env` файла. Он использует библиотеку Pydantic
 # для обеспечения надежности и типизации настроек.
+#
+# Импорт модуля ничего не читает: настройки загружаются и проверяются при первом
+# обращении к `settings` (или вызове `get_settings()`). Поэтому модули бота можно
+# импортировать в тестах и инструментах без `.env` и без секретов.
+
+from functools import cache
+from pathlib import Path
+from typing import Literal
 
 from pydantic import SecretStr
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+##
+# @var ENV_FILE
+# @brief Файл `.env` в корне проекта.
+ENV_FILE = Path(__file__).resolve().parents[2] / ".env"
+
 
 class Settings(BaseSettings):
     ##
@@ -37,27 +50,552 @@ class Settings(BaseSettings):
     # и обходить гео-ограничения некоторых провайдеров.
     # @see https://openrouter.ai/keys
 
-    model_config = SettingsConfigDict(env_file="../.env", extra="ignore", env_prefix="")
+    CACHE_ENABLED: bool = True
+    ## @var CACHE_ENABLED
+    # @brief Включает кэширование результатов анализа.
+    # @details Повторно присланная расшифровка (с точностью до пробелов) не отправляется
+    # в модель повторно, а берется из кэша.
+
+    CACHE_TTL_SECONDS: float = 6 * 60 * 60
+    ## @var CACHE_TTL_SECONDS
+    # @brief Время жизни записи в кэше результатов, в секундах.
+
+    CACHE_MAX_ENTRIES: int = 1024
+    ## @var CACHE_MAX_ENTRIES
+    # @brief Максимальное число записей в оперативном (LRU) уровне кэша.
+
+    CACHE_DB_PATH: str | None = None
+    ## @var CACHE_DB_PATH
+    # @brief Путь к SQLite-файлу дискового уровня кэша.
+    # @details Если не задан, используется только кэш в памяти. Дисковый уровень
+    # переживает перезапуски бота.
+
+    SCHEDULER_MAX_CONCURRENCY: int = 8
+    ## @var SCHEDULER_MAX_CONCURRENCY
+    # @brief Максимальное число одновременных запросов к модели для всего бота.
+
+    SCHEDULER_PER_USER_LIMIT: int = 2
+    ## @var SCHEDULER_PER_USER_LIMIT
+    # @brief Максимальное число одновременных запросов к модели от одного пользователя.
+
+    SCHEDULER_MAX_QUEUE_SIZE: int = 100
+    ## @var SCHEDULER_MAX_QUEUE_SIZE
+    # @brief Максимальное число задач, ожидающих своей очереди.
+    # @details При переполнении новые запросы отклоняются с просьбой повторить позже.
+
+    STREAMING_ENABLED: bool = True
+    ## @var STREAMING_ENABLED
+    # @brief Включает потоковый режим: ответ модели показывается по мере генерации.
+    # @details При отключении используется прежний режим с одним итоговым сообщением.
+
+    STREAM_EDIT_INTERVAL: float = 1.0
+    ## @var STREAM_EDIT_INTERVAL
+    # @brief Минимальный интервал между правками сообщения в потоковом режиме, в секундах.
+    # @details Защищает от превышения лимитов Telegram на редактирование сообщений.
+
+    LONG_TRANSCRIPT_THRESHOLD: int = 16000
+    ## @var LONG_TRANSCRIPT_THRESHOLD
+    # @brief Порог длины расшифровки (в оценочных токенах) для анализа по частям.
+    # @details Более длинные расшифровки анализируются по схеме map-reduce.
+
+    CHUNK_MAX_TOKENS: int = 6000
+    ## @var CHUNK_MAX_TOKENS
+    # @brief Максимальный размер одного фрагмента длинной расшифровки, в оценочных токенах.
+
+    CHUNK_CONCURRENCY: int = 6
+    ## @var CHUNK_CONCURRENCY
+    # @brief Максимальное число фрагментов одной расшифровки, анализируемых одновременно.
+
+    PREPROCESS_ENABLED: bool = True
+    ## @var PREPROCESS_ENABLED
+    # @brief Очищать ли расшифровку перед отправкой в модель.
+    # @details Удаляет временные метки, слова-паразиты и повторы, экономя входные токены.
+
+    PREPROCESS_STAGES: list[str] = [
+        "timestamps",
+        "fillers",
+        "repeats",
+        "speakers",
+        "whitespace",
+        "truncate",
+    ]
+    ## @var PREPROCESS_STAGES
+    # @brief Включенные этапы очистки (см. `services.preprocessing.STAGES`).
+    # @details Задается в `.env` JSON-списком, например `["timestamps", "whitespace"]`.
+
+    PREPROCESS_TOKEN_BUDGET: int = 0
+    ## @var PREPROCESS_TOKEN_BUDGET
+    # @brief Бюджет оценочных токенов расшифровки; середина более длинной вырезается.
+    # @details 0 — не обрезать (длинные расшифровки анализируются по частям).
+
+    PREPROCESS_OFFLOAD_CHARS: int = 200_000
+    ## @var PREPROCESS_OFFLOAD_CHARS
+    # @brief Длина расшифровки в символах, начиная с которой очистка выполняется
+    # в отдельном потоке, а не в цикле событий.
+
+    RESPONSE_FORMAT: Literal["json_schema", "json_object", "none"] = "json_schema"
+    ## @var RESPONSE_FORMAT
+    # @brief Способ запроса структурированного (JSON) ответа у модели.
+    # @details `json_schema` — строгая схема ответа, `json_object` — произвольный
+    # JSON-объект (для моделей без поддержки схем), `none` — только инструкция в промпте.
+
+    ANALYSIS_BACKEND: Literal["openrouter", "openai", "fake"] = "openrouter"
+    ## @var ANALYSIS_BACKEND
+    # @brief Бэкенд, выполняющий запросы к модели (см. `services/backends.py`).
+    # @details `openrouter` — OpenRouter, `openai` — любой OpenAI-совместимый сервер
+    # по адресу `OPENAI_BASE_URL` (vLLM, llama.cpp, Ollama и т.п.), `fake` —
+    # детерминированная модель без сети для тестов и бенчмарков.
+
+    ANALYSIS_MODEL: str | None = None
+    ## @var ANALYSIS_MODEL
+    # @brief Основная модель анализа вместо встроенной `google/gemini-flash-1.5`.
+    # @details Нужна прежде всего для локального сервера, где модели называются иначе.
+
+    OPENAI_BASE_URL: str = "http://localhost:8000/v1"
+    ## @var OPENAI_BASE_URL
+    # @brief Базовый адрес OpenAI-совместимого сервера для `ANALYSIS_BACKEND=openai`.
+
+    OPENAI_API_KEY: SecretStr | None = None
+    ## @var OPENAI_API_KEY
+    # @brief Ключ OpenAI-совместимого сервера; локальные серверы обычно его не требуют.
+
+    FAKE_BACKEND_LATENCY: float = 0.0
+    ## @var FAKE_BACKEND_LATENCY
+    # @brief Задержка ответа фиктивной модели `ANALYSIS_BACKEND=fake`, в секундах.
+
+    MICROBATCH_ENABLED: bool = False
+    ## @var MICROBATCH_ENABLED
+    # @brief Объединять ли одновременные короткие расшифровки в один запрос к модели.
+    # @details См. `services/microbatch.py`. Действует на непотоковые анализы:
+    # рабочие процессы очереди, пакетную обработку файлов и режим
+    # `STREAMING_ENABLED=false`.
+
+    MICROBATCH_MAX_SIZE: int = 8
+    ## @var MICROBATCH_MAX_SIZE
+    # @brief Максимальное число расшифровок в одном пакетном запросе.
+
+    MICROBATCH_MAX_WAIT: float = 0.05
+    ## @var MICROBATCH_MAX_WAIT
+    # @brief Максимальное ожидание попутных расшифровок перед отправкой пакета, в секундах.
+    # @details При редких запросах пакет отправляется сразу, без ожидания.
+
+    MICROBATCH_MAX_ITEM_TOKENS: int = 2000
+    ## @var MICROBATCH_MAX_ITEM_TOKENS
+    # @brief Наибольшая расшифровка (в оценочных токенах), которая может попасть в пакет.
+
+    MICROBATCH_MAX_TOKENS: int = 8000
+    ## @var MICROBATCH_MAX_TOKENS
+    # @brief Наибольший суммарный размер расшифровок одного пакета, в оценочных токенах.
+
+    MICROBATCH_MAX_CONCURRENCY: int = 0
+    ## @var MICROBATCH_MAX_CONCURRENCY
+    # @brief Наибольшее число одновременно выполняемых пакетных запросов; 0 — без ограничения.
+    # @details Для локального сервера стоит задать число его параллельных слотов:
+    # пока сервер занят, готовый пакет ждет и продолжает набирать расшифровки.
+
+    FALLBACK_MODELS: list[str] = []
+    ## @var FALLBACK_MODELS
+    # @brief Упорядоченный список резервных моделей OpenRouter.
+    # @details Задается в `.env` JSON-списком, например
+    # `["meta-llama/llama-3.1-70b-instruct", "openai/gpt-4o-mini"]`. Резервные модели
+    # используются при сбоях основной модели и для хеджированных запросов.
+
+    RETRY_MAX_ATTEMPTS: int = 3
+    ## @var RETRY_MAX_ATTEMPTS
+    # @brief Максимальное число попыток одного запроса к модели (включая первую).
+
+    RETRY_BASE_DELAY: float = 0.5
+    ## @var RETRY_BASE_DELAY
+    # @brief Базовая задержка экспоненциального отката между попытками, в секундах.
+
+    RETRY_MAX_DELAY: float = 8.0
+    ## @var RETRY_MAX_DELAY
+    # @brief Максимальная задержка между попытками, в секундах.
+    # @details Ограничивает и значение заголовка `Retry-After`.
+
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    ## @var BREAKER_FAILURE_THRESHOLD
+    # @brief Число ошибок подряд, после которого модель временно исключается из работы.
+
+    BREAKER_RESET_SECONDS: float = 30.0
+    ## @var BREAKER_RESET_SECONDS
+    # @brief Через сколько секунд исключенной модели отправляется пробный запрос.
+
+    HEDGE_ENABLED: bool = False
+    ## @var HEDGE_ENABLED
+    # @brief Включает хеджированные запросы к резервной модели.
+    # @details Если основная модель не ответила за время, близкое к ее 95-му
+    # перцентилю задержки, тот же запрос отправляется резервной модели и
+    # используется первый полученный ответ. Требует непустого `FALLBACK_MODELS`
+    # и увеличивает расход токенов.
+
+    HEDGE_DELAY: float = 6.0
+    ## @var HEDGE_DELAY
+    # @brief Задержка перед хеджированным запросом, пока статистики задержек мало, в секундах.
+
+    HEDGE_MIN_DELAY: float = 1.5
+    ## @var HEDGE_MIN_DELAY
+    # @brief Нижняя граница задержки перед хеджированным запросом, в секундах.
+
+    TONALITY_PRECLASSIFIER: bool = True
+    ## @var TONALITY_PRECLASSIFIER
+    # @brief Показывать ли предварительную тональность, оцененную локально по словарю.
+    # @details Строка появляется в сообщении "Анализирую..." сразу, до ответа модели.
+
+    TONALITY_LEXICON_PATH: str | None = None
+    ## @var TONALITY_LEXICON_PATH
+    # @brief Путь к TSV-файлу (`основа<TAB>вес`), дополняющему встроенный словарь тональности.
+
+    TONALITY_FAST_PATH: bool = False
+    ## @var TONALITY_FAST_PATH
+    # @brief Отправлять ли очевидные по тональности диалоги более дешевой модели.
+
+    TONALITY_FAST_THRESHOLD: float = 0.75
+    ## @var TONALITY_FAST_THRESHOLD
+    # @brief Минимальная уверенность локальной оценки для упрощенного пути (от 0 до 1).
+
+    TONALITY_FAST_MODEL: str = "google/gemini-flash-1.5-8b"
+    ## @var TONALITY_FAST_MODEL
+    # @brief Модель OpenRouter для диалогов с очевидной тональностью.
+
+    ANALYSIS_MODE: Literal["inline", "queue"] = "inline"
+    ## @var ANALYSIS_MODE
+    # @brief Где выполняется анализ текстовых сообщений.
+    # @details `inline` — в процессе бота (через планировщик), `queue` — бот только
+    # кладет задачу в надежную очередь, а анализируют ее рабочие процессы `worker.py`.
+
+    JOB_QUEUE_BACKEND: Literal["sqlite", "redis"] = "sqlite"
+    ## @var JOB_QUEUE_BACKEND
+    # @brief Хранилище очереди задач: SQLite (одна машина) или Redis (несколько машин).
+    # @details Для `redis` нужен пакет `redis`.
+
+    JOB_QUEUE_PATH: str = "data/jobs.sqlite3"
+    ## @var JOB_QUEUE_PATH
+    # @brief Путь к SQLite-файлу очереди задач. Бот и воркеры должны видеть один файл.
+
+    JOB_QUEUE_REDIS_URL: str = "redis://localhost:6379/0"
+    ## @var JOB_QUEUE_REDIS_URL
+    # @brief Адрес Redis для очереди задач.
+
+    JOB_QUEUE_MAX_SIZE: int = 1000
+    ## @var JOB_QUEUE_MAX_SIZE
+    # @brief Максимальное число задач в очереди; при переполнении новые запросы отклоняются.
+
+    JOB_VISIBILITY_TIMEOUT: float = 120.0
+    ## @var JOB_VISIBILITY_TIMEOUT
+    # @brief Срок аренды задачи воркером, в секундах.
+    # @details Работающий воркер продлевает аренду; если он упал, по истечении срока
+    # задачу возьмет другой воркер.
+
+    JOB_MAX_ATTEMPTS: int = 3
+    ## @var JOB_MAX_ATTEMPTS
+    # @brief Максимальное число попыток выполнить задачу, включая попытки упавших воркеров.
+
+    JOB_RETRY_DELAY: float = 10.0
+    ## @var JOB_RETRY_DELAY
+    # @brief Задержка перед второй попыткой задачи, в секундах; далее она удваивается.
+
+    JOB_POLL_INTERVAL: float = 0.5
+    ## @var JOB_POLL_INTERVAL
+    # @brief Как часто свободный воркер проверяет пустую очередь, в секундах.
+
+    JOB_WORKERS: int = 2
+    ## @var JOB_WORKERS
+    # @brief Число рабочих процессов, запускаемых `worker.py` на этой машине.
+
+    JOB_WORKER_CONCURRENCY: int = 4
+    ## @var JOB_WORKER_CONCURRENCY
+    # @brief Число задач, одновременно выполняемых одним рабочим процессом.
+
+    JOB_WORKER_METRICS_PORT: int = 9208
+    ## @var JOB_WORKER_METRICS_PORT
+    # @brief Порт сервера метрик первого рабочего процесса; воркер N слушает порт
+    # `JOB_WORKER_METRICS_PORT + N`.
+
+    RESULTS_ENABLED: bool = True
+    ## @var RESULTS_ENABLED
+    # @brief Сохранять ли результаты анализа для команд `/stats` и `/history`.
+
+    RESULTS_DB_PATH: str = "data/results.sqlite3"
+    ## @var RESULTS_DB_PATH
+    # @brief Путь к SQLite-файлу хранилища результатов.
+    # @details Файл общий для бота, воркеров вебхука и воркеров очереди.
+
+    RESULTS_BATCH_SIZE: int = 200
+    ## @var RESULTS_BATCH_SIZE
+    # @brief Максимальное число результатов, записываемых одной транзакцией.
+
+    RESULTS_FLUSH_INTERVAL: float = 1.0
+    ## @var RESULTS_FLUSH_INTERVAL
+    # @brief Максимальное время, которое результат ждет записи на диск, в секундах.
+
+    RESULTS_MAX_PENDING: int = 10_000
+    ## @var RESULTS_MAX_PENDING
+    # @brief Максимальное число результатов, ожидающих записи.
+    # @details Если диск не успевает, новые результаты не сохраняются (ответ
+    # пользователю при этом не задерживается).
+
+    STATS_DEFAULT_DAYS: int = 30
+    ## @var STATS_DEFAULT_DAYS
+    # @brief Период по умолчанию для команды `/stats`, в днях.
+
+    STATS_ADMIN_IDS: list[int] = []
+    ## @var STATS_ADMIN_IDS
+    # @brief Пользователи Telegram, которым доступна общая статистика `/stats all`.
+    # @details Задается в `.env` JSON-списком, например `[123456789]`.
+
+    HISTORY_LIMIT: int = 10
+    ## @var HISTORY_LIMIT
+    # @brief Число последних анализов, которое показывает команда `/history`.
+
+    OPENROUTER_BASE_URL: str = "https://openrouter.ai/api/v1"
+    ## @var OPENROUTER_BASE_URL
+    # @brief Базовый адрес OpenAI-совместимого API.
+    # @details Меняется для работы через прокси или с локальной заглушкой
+    # при нагрузочном тестировании (`benchmarks/load_test.py`).
+
+    TELEGRAM_API_URL: str | None = None
+    ## @var TELEGRAM_API_URL
+    # @brief Адрес собственного сервера Telegram Bot API, например `http://localhost:8081`.
+    # @details Если не задан, используется `https://api.telegram.org`.
+    # @see https://github.com/tdlib/telegram-bot-api
+
+    OUTBOUND_ENABLED: bool = True
+    ## @var OUTBOUND_ENABLED
+    # @brief Пропускает все исходящие запросы к Telegram через планировщик отправки.
+    # @details Планировщик (`core/outbound.py`) соблюдает лимиты Telegram, повторяет
+    # запросы после `retry_after` и объединяет правки одного сообщения.
+
+    OUTBOUND_GLOBAL_RATE: float = 25.0
+    ## @var OUTBOUND_GLOBAL_RATE
+    # @brief Общий лимит отправки и редактирования сообщений бота, в запросах в секунду.
+    # @details Вместе с `OUTBOUND_GLOBAL_BURST` оставляет запас до лимита Telegram
+    # в 30 сообщений в секунду.
+
+    OUTBOUND_GLOBAL_BURST: int = 5
+    ## @var OUTBOUND_GLOBAL_BURST
+    # @brief Сколько запросов сверх общего лимита можно отправить подряд после простоя.
+
+    OUTBOUND_CHAT_RATE: float = 1.0
+    ## @var OUTBOUND_CHAT_RATE
+    # @brief Лимит запросов в один личный чат, в запросах в секунду.
+
+    OUTBOUND_CHAT_BURST: int = 3
+    ## @var OUTBOUND_CHAT_BURST
+    # @brief Сколько запросов в один личный чат можно отправить подряд после простоя.
+
+    OUTBOUND_GROUP_RATE: float = 20 / 60
+    ## @var OUTBOUND_GROUP_RATE
+    # @brief Лимит запросов в одну группу или канал, в запросах в секунду.
+    # @details Telegram разрешает боту не более 20 сообщений в минуту в одну группу.
+
+    OUTBOUND_MAX_RETRIES: int = 3
+    ## @var OUTBOUND_MAX_RETRIES
+    # @brief Сколько раз повторять запрос, на который Telegram ответил `retry_after`.
+
+    OUTBOUND_MAX_RETRY_AFTER: float = 60.0
+    ## @var OUTBOUND_MAX_RETRY_AFTER
+    # @brief Наибольшее ожидание `retry_after`, после которого запрос повторяется, в секундах.
+    # @details При более долгом запрете ошибка `TelegramRetryAfter` передается
+    # вызывающему коду, чтобы обработчик не висел минутами.
+
+    HTTP2_ENABLED: bool = True
+    ## @var HTTP2_ENABLED
+    # @brief Включает HTTP/2 для запросов к OpenRouter.
+
+    HTTP_MAX_CONNECTIONS: int = 20
+    ## @var HTTP_MAX_CONNECTIONS
+    # @brief Максимальное число одновременно открытых соединений с OpenRouter.
+
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    ## @var HTTP_MAX_KEEPALIVE_CONNECTIONS
+    # @brief Максимальное число простаивающих соединений, сохраняемых в пуле.
+
+    HTTP_KEEPALIVE_EXPIRY: float = 60.0
+    ## @var HTTP_KEEPALIVE_EXPIRY
+    # @brief Время, через которое простаивающее соединение закрывается, в секундах.
+
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    ## @var HTTP_CONNECT_TIMEOUT
+    # @brief Таймаут установки соединения (и ожидания свободного соединения в пуле), в секундах.
+
+    HTTP_READ_TIMEOUT: float = 40.0
+    ## @var HTTP_READ_TIMEOUT
+    # @brief Таймаут чтения ответа модели, в секундах.
+
+    HTTP_WARMUP: bool = True
+    ## @var HTTP_WARMUP
+    # @brief Выполнять ли прогревочный запрос к OpenRouter при запуске бота.
+    # @details Прогрев заранее устанавливает TLS-соединение, поэтому первый
+    # пользователь не ждет его установки.
+
+    BATCH_CONCURRENCY: int = 4
+    ## @var BATCH_CONCURRENCY
+    # @brief Максимальное число одновременно анализируемых расшифровок из одного файла.
+
+    BATCH_MAX_ITEMS: int = 1000
+    ## @var BATCH_MAX_ITEMS
+    # @brief Максимальное число расшифровок, обрабатываемых из одного файла.
+
+    BATCH_MAX_FILE_SIZE: int = 20 * 1024 * 1024
+    ## @var BATCH_MAX_FILE_SIZE
+    # @brief Максимальный размер загружаемого файла, в байтах.
+    # @details Bot API не позволяет ботам скачивать файлы больше 20 МБ.
+
+    BATCH_ZIP_MAX_MEMBER_SIZE: int = 5 * 1024 * 1024
+    ## @var BATCH_ZIP_MAX_MEMBER_SIZE
+    # @brief Наибольший распакованный размер одного файла в архиве `.zip`, в байтах.
+
+    BATCH_ZIP_MAX_UNPACKED_SIZE: int = 100 * 1024 * 1024
+    ## @var BATCH_ZIP_MAX_UNPACKED_SIZE
+    # @brief Наибольший суммарный распакованный размер архива `.zip`, в байтах.
+
+    BATCH_PROGRESS_INTERVAL: float = 3.0
+    ## @var BATCH_PROGRESS_INTERVAL
+    # @brief Минимальный интервал между обновлениями статуса пакетной обработки, в секундах.
+
+    BOT_MODE: Literal["polling", "webhook"] = "polling"
+    ## @var BOT_MODE
+    # @brief Способ получения обновлений от Telegram.
+    # @details `polling` — long-polling (по умолчанию), `webhook` — Telegram
+    # присылает обновления на встроенный HTTP-сервер.
+
+    WEBHOOK_URL: str | None = None
+    ## @var WEBHOOK_URL
+    # @brief Публичный HTTPS-адрес бота, например `https://bot.example.com`.
+    # @details К нему добавляется `WEBHOOK_PATH`. Обязателен в режиме `webhook`.
+
+    WEBHOOK_PATH: str = "/webhook"
+    ## @var WEBHOOK_PATH
+    # @brief Путь, по которому сервер принимает обновления.
+
+    WEBHOOK_SECRET: SecretStr | None = None
+    ## @var WEBHOOK_SECRET
+    # @brief Секретный токен, которым Telegram подписывает запросы к вебхуку.
+    # @details Запросы без правильного заголовка `X-Telegram-Bot-Api-Secret-Token`
+    # отклоняются.
+
+    WEBHOOK_HOST: str = "127.0.0.1"
+    ## @var WEBHOOK_HOST
+    # @brief Адрес, на котором слушает встроенный сервер (за обратным прокси).
+
+    WEBHOOK_PORT: int = 8080
+    ## @var WEBHOOK_PORT
+    # @brief Порт, на котором слушает встроенный сервер.
+
+    WEBHOOK_WORKERS: int = 1
+    ## @var WEBHOOK_WORKERS
+    # @brief Число процессов, обрабатывающих обновления в режиме `webhook`.
+    # @details Процессы слушают один порт через `SO_REUSEPORT` (только Linux/BSD).
+
+    WEBHOOK_SET_ON_STARTUP: bool = True
+    ## @var WEBHOOK_SET_ON_STARTUP
+    # @brief Регистрировать ли вебхук в Telegram при запуске.
+    # @details Стоит отключить на всех узлах, кроме одного, если бот запущен на нескольких машинах.
+
+    METRICS_ENABLED: bool = True
+    ## @var METRICS_ENABLED
+    # @brief Запускать ли HTTP-сервер метрик Prometheus (`/metrics`).
+
+    METRICS_HOST: str = "127.0.0.1"
+    ## @var METRICS_HOST
+    # @brief Адрес, на котором слушает сервер метрик.
+
+    METRICS_PORT: int = 9108
+    ## @var METRICS_PORT
+    # @brief Порт сервера метрик.
+    # @details При нескольких воркерах вебхука воркер с номером N слушает порт
+    # `METRICS_PORT + N`.
+
+    APP_ENV: Literal["development", "production"] = "development"
+    ## @var APP_ENV
+    # @brief Окружение, в котором запущен бот.
+    # @details В `production` при запуске не пишется отладочное сообщение о настройке логгера.
+
+    LOG_CONSOLE_LEVEL: str = "DEBUG"
+    ## @var LOG_CONSOLE_LEVEL
+    # @brief Минимальный уровень сообщений, выводимых в консоль.
+
+    LOG_FILE_LEVEL: str = "INFO"
+    ## @var LOG_FILE_LEVEL
+    # @brief Минимальный уровень сообщений, записываемых в файл.
+
+    LOG_FORMAT: Literal["text", "json"] = "text"
+    ## @var LOG_FORMAT
+    # @brief Формат файла логов: обычный текст или JSON Lines (по объекту на строку).
+    # @details JSON удобен для сборщиков логов (Loki, Elasticsearch, Vector).
+
+    LOG_DIR: str = "logs"
+    ## @var LOG_DIR
+    # @brief Каталог для файлов логов.
+
+    LOG_ROTATION: Literal["size", "time"] = "size"
+    ## @var LOG_ROTATION
+    # @brief Способ ротации файла логов: по размеру или по времени.
+
+    LOG_MAX_BYTES: int = 10 * 1024 * 1024
+    ## @var LOG_MAX_BYTES
+    # @brief Размер файла логов, после которого он ротируется (при `LOG_ROTATION=size`).
+
+    LOG_ROTATE_WHEN: str = "midnight"
+    ## @var LOG_ROTATE_WHEN
+    # @brief Момент ротации при `LOG_ROTATION=time` в терминах `TimedRotatingFileHandler`
+    # (`midnight`, `H`, `W0` и т.д.).
+
+    LOG_BACKUP_COUNT: int = 7
+    ## @var LOG_BACKUP_COUNT
+    # @brief Число хранимых старых файлов логов.
+
+    model_config = SettingsConfigDict(env_file=ENV_FILE, extra="ignore", env_prefix="")
     ## @var model_config
     # @brief Внутренняя конфигурация для Pydantic-модели `Settings`.
     # @details Определяет, как Pydantic должен загружать и обрабатывать переменные.
-    # - <b>env_file:</b> Путь к файлу с переменными окружения.
-    #   @note Путь `../.env` предполагает, что скрипт, использующий этот конфиг,
-    #         запускается из дочерней директории (например, `src/`). Для запуска
-    #         из корня проекта следует использовать `'.env'`.
+    # - <b>env_file:</b> Путь к файлу с переменными окружения (`ENV_FILE`, `.env`
+    #   в корне проекта). Путь не зависит от текущего каталога, поэтому бот,
+    #   воркеры и скрипты из `benchmarks/` можно запускать откуда угодно.
     # - <b>extra:</b> Значение `'ignore'` указывает, что лишние переменные в `.env`
     #   файле (не описанные в классе `Settings`) будут проигнорированы, а не вызовут ошибку.
     # - <b>env_prefix:</b> Пустой префикс (`""`) означает, что переменные в `.env` файле
     #   должны иметь то же имя, что и поля класса (например, `BOT_TOKEN`, а не `MYAPP_BOT_TOKEN`).
 
 
+@cache
+def get_settings() -> Settings:
+    """!
+    @brief Загружает и проверяет настройки при первом вызове.
+    @details Последующие вызовы возвращают тот же объект. В тестах настройки
+             можно перечитать после изменения окружения через
+             `get_settings.cache_clear()`.
+    @return Settings: единый экземпляр настроек.
+    @throw pydantic.ValidationError Если обязательная переменная не задана.
+    """
+
+    return Settings()
+
+
+class _LazySettings:
+    """!
+    @class _LazySettings
+    @brief Заместитель `Settings`, загружающий настройки при первом обращении к полю.
+    """
+
+    __slots__ = ()
+
+    def __getattr__(self, name: str):
+        return getattr(get_settings(), name)
+
+    def __repr__(self) -> str:
+        return "<lazy Settings>"
+
+
 ##
 # @var settings
-# @brief Глобальный, единый экземпляр (синглтон) класса настроек `Settings`.
-# @details Этот объект создается один раз при импорте модуля и затем используется
-# во всем приложении для получения доступа к конфигурационным параметрам.
-# Например: `from core.config import settings; bot_token = settings.BOT_TOKEN`.
-# @warning Не следует выводить этот объект в лог целиком, несмотря на защиту
+# @brief Глобальная точка доступа к настройкам приложения.
+# @details Это не сам экземпляр `Settings`, а ленивый заместитель: настройки
+# читаются из окружения и `.env` только при первом обращении к любому полю
+# (например, `settings.BOT_TOKEN`), а не при импорте модуля. Все обращения
+# делегируются единому экземпляру из `get_settings()`.
+# @warning Не следует выводить настройки в лог целиком, несмотря на защиту
 # `SecretStr`, чтобы избежать потенциальных утечек в будущем при добавлении
 # незащищенных полей.
-settings = Settings()
+settings = _LazySettings()
@@ -0,0 +1,213 @@
+##
+# @file container.py
+# @author Roman Moroz
+# @brief Контейнер зависимостей приложения с ленивым созданием сервисов.
+# @details Раньше каждый сервис (`CallAnalyzer`, планировщик, очередь задач,
+#          хранилище результатов и т.д.) создавался как синглтон при импорте своего
+#          модуля, а вместе с ним читались настройки, открывались файлы SQLite
+#          и импортировались тяжелые библиотеки (`openai`, `httpx`). Теперь сервисы
+#          создает `Container` при первом обращении к ним (обычно в хуке запуска
+#          диспетчера), а модули сервисов импортируются только в этот момент.
+#          Поэтому `import main` и импорт хендлеров быстры и не требуют `.env`.
+
+import logging
+
+from functools import cached_property
+
+from config.config import Settings, get_settings
+
+logger = logging.getLogger("call_assessment_bot")
+
+
+class Container:
+    """!
+    @class Container
+    @brief Лениво создаваемые сервисы бота.
+    @details
+    Каждое свойство создает сервис при первом обращении и дальше возвращает
+    тот же объект (`functools.cached_property`). Обращения выполняются из потока
+    цикла событий, поэтому блокировки не нужны.
+
+    Необязательные сервисы (`job_queue`, `results_store`) равны `None`, если они
+    отключены в настройках. `close()` освобождает ресурсы только уже созданных
+    сервисов и ничего не создает ради закрытия.
+    """
+
+    @cached_property
+    def settings(self) -> Settings:
+        """!
+        @brief Настройки приложения (см. `config.config.get_settings`).
+        """
+
+        return get_settings()
+
+    @cached_property
+    def analyzer(self):
+        """!
+        @brief Сервис анализа `CallAnalyzer`.
+        @details Сетевой клиент создается не здесь, а в `CallAnalyzer.start()`.
+                 Счетчики кэша результатов и хеджированных запросов
+                 экспортируются в метрики.
+        """
+
+        from core.metrics import (
+            CACHE_EVENTS,
+            CACHE_SAVED_SECONDS,
+            CACHE_SAVED_TOKENS,
+            HEDGE_WINS,
+            HEDGES,
+        )
+        from services.analyzer import CallAnalyzer
+
+        analyzer = CallAnalyzer(
+            backend=self.backend,
+            preprocessor=self.preprocessor,
+            tonality_scorer=self.tonality_scorer,
+        )
+        if analyzer.cache is not None:
+            stats = analyzer.cache.stats
+            CACHE_EVENTS.set_function(
+                lambda: {
+                    ("hit",): stats.hits,
+                    ("disk_hit",): stats.disk_hits,
+                    ("miss",): stats.misses,
+                    ("store",): stats.stores,
+                    ("eviction",): stats.evictions,
+                    ("expiration",): stats.expirations,
+                }
+            )
+            CACHE_SAVED_SECONDS.set_function(lambda: stats.saved_seconds)
+            CACHE_SAVED_TOKENS.set_function(lambda: stats.saved_tokens)
+
+        models = analyzer.resilience.stats
+        HEDGES.set_function(
+            lambda: {(model,): stats.hedges for model, stats in models.items()}
+        )
+        HEDGE_WINS.set_function(
+            lambda: {(model,): stats.hedge_wins for model, stats in models.items()}
+        )
+        return analyzer
+
+    @cached_property
+    def backend(self):
+        """!
+        @brief Бэкенд модели по настройке `ANALYSIS_BACKEND` (см. `services.backends`).
+        """
+
+        from services.backends import create_backend
+
+        return create_backend()
+
+    @cached_property
+    def scheduler(self):
+        """!
+        @brief Планировщик задач анализа `AnalysisScheduler`.
+        @details Все хендлеры, запускающие анализ, ставят задачи через этот объект,
+                 чтобы глобальный лимит параллелизма соблюдался для всего бота.
+        """
+
+        from core.metrics import IN_FLIGHT, QUEUE_DEPTH, QUEUE_REJECTED
+        from services.scheduler import AnalysisScheduler
+
+        scheduler = AnalysisScheduler(
+            max_concurrency=self.settings.SCHEDULER_MAX_CONCURRENCY,
+            per_user_limit=self.settings.SCHEDULER_PER_USER_LIMIT,
+            max_queue_size=self.settings.SCHEDULER_MAX_QUEUE_SIZE,
+        )
+        QUEUE_DEPTH.set_function(lambda: scheduler.queue_depth)
+        IN_FLIGHT.set_function(lambda: scheduler.in_flight)
+        QUEUE_REJECTED.set_function(lambda: scheduler.stats.rejected)
+        return scheduler
+
+    @cached_property
+    def preprocessor(self):
+        """!
+        @brief Цепочка очистки расшифровок `TranscriptPreprocessor`.
+        """
+
+        from services.preprocessing import TranscriptPreprocessor
+
+        return TranscriptPreprocessor(
+            self.settings.PREPROCESS_STAGES,
+            token_budget=self.settings.PREPROCESS_TOKEN_BUDGET,
+            offload_chars=self.settings.PREPROCESS_OFFLOAD_CHARS,
+        )
+
+    @cached_property
+    def tonality_scorer(self):
+        """!
+        @brief Словарный классификатор тональности `LexiconScorer`.
+        @details Словарь из `TONALITY_LEXICON_PATH` (если задан) дополняет встроенный.
+        """
+
+        from services.tonality import LexiconScorer
+
+        return LexiconScorer.from_file(self.settings.TONALITY_LEXICON_PATH)
+
+    @cached_property
+    def job_queue(self):
+        """!
+        @brief Очередь задач анализа или `None`, если бот анализирует сам.
+        @details Создается только в режиме `ANALYSIS_MODE=queue`.
+        """
+
+        if self.settings.ANALYSIS_MODE != "queue":
+            return None
+
+        from services.job_queue import create_job_queue
+
+        return create_job_queue()
+
+    @cached_property
+    def results_store(self):
+        """!
+        @brief Хранилище результатов `ResultsStore` или `None`, если `RESULTS_ENABLED=false`.
+        """
+
+        if not self.settings.RESULTS_ENABLED:
+            return None
+
+        from core.metrics import RESULTS_PENDING
+        from services.results_store import ResultsStore
+
+        store = ResultsStore(
+            self.settings.RESULTS_DB_PATH,
+            batch_size=self.settings.RESULTS_BATCH_SIZE,
+            flush_interval=self.settings.RESULTS_FLUSH_INTERVAL,
+            max_pending=self.settings.RESULTS_MAX_PENDING,
+        )
+        RESULTS_PENDING.set_function(lambda: store.pending)
+        return store
+
+    async def start(self) -> None:
+        """!
+        @brief Создает сервисы, нужные для обработки обновлений, и запускает их.
+        @details Вызывается из хуков запуска бота и воркеров очереди, чтобы первое
+                 обновление не платило за импорт и создание сервисов.
+        """
+
+        await self.analyzer.start()
+        if self.results_store is not None:
+            await self.results_store.start()
+
+    async def close(self) -> None:
+        """!
+        @brief Останавливает созданные сервисы: закрывает соединения с API модели,
+               дисковый уровень кэша, очередь задач и хранилище результатов.
+        """
+
+        created = vars(self)
+        if "analyzer" in created:
+            await self.analyzer.close()
+        if created.get("results_store") is not None:
+            await self.results_store.close()
+        if created.get("job_queue") is not None:
+            self.job_queue.close()
+
+
+##
+# @var container
+# @brief Единый контейнер сервисов процесса.
+# @details Хендлеры и точки входа обращаются к сервисам только через него,
+#          например `container.analyzer`, и только во время работы, а не при импорте.
+container = Container()
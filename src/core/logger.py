@@ -4,58 +4,171 @@
 # @brief Модуль для централизованной настройки логирования и обработки ошибок в приложении.
 # @details Этот файл содержит две ключевые части:
 #          1. `setup_logger()`: Функция для инициализации и конфигурации глобального логгера.
+#             Записи передаются через очередь (`QueueHandler`/`QueueListener`), поэтому
+#             форматирование и запись в файл и консоль не блокируют цикл событий.
 #          2. `LoggingMiddleware`: Класс middleware для `aiogram`, который перехватывает
 #             все входящие события для их логирования и централизованно обрабатывает
 #             любые исключения, возникающие в хендлерах, предотвращая падение бота.
 
+import atexit
+import json
 import logging
+import queue
 import sys
+import time
 
-from pathlib import Path
+from datetime import datetime, timezone
 from logging import Formatter, StreamHandler
-from colorlog import ColoredFormatter
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+    TimedRotatingFileHandler,
+)
+from pathlib import Path
+
+from config.config import settings
+from core.metrics import ERRORS, UPDATE_DURATION, UPDATES
+
+##
+# @var TEXT_FORMAT
+# @brief Формат строки текстового файла логов.
+TEXT_FORMAT = "[%(asctime)s] %(name)s:%(levelname)s | %(funcName)s: %(message)s"
+
+##
+# @var DATE_FORMAT
+# @brief Формат даты в текстовых логах.
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_STANDARD_ATTRS = frozenset(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {
+    "message",
+    "asctime",
+    "taskName",
+}
+
+_listener: QueueListener | None = None
 
 
-def setup_logger() -> logging.Logger:
+class JsonFormatter(Formatter):
     """!
-    @brief Инициализирует и настраивает главный логгер приложения.
-    @details
-    Создает и конфигурирует именованный логгер (`call_assessment_bot`). Настройка
-    включает два обработчика (handlers):
-    - <b>Консольный обработчик:</b> Выводит логи всех уровней (от DEBUG и выше) в
-      консоль с использованием цветного форматирования для лучшей читаемости
-      во время разработки. Использует библиотеку `colorlog`.
-    - <b>Файловый обработчик:</b> Записывает логи уровня INFO и выше в файл `logs/bot.log`.
-      Это позволяет сохранять важную информацию о работе бота в продакшене,
-      исключая отладочные сообщения.
+    @class JsonFormatter
+    @brief Форматирует запись лога как один JSON-объект в строке (JSON Lines).
+    @details Помимо времени, уровня, имени логгера, функции и текста сообщения,
+             в объект попадают все поля из `extra` (например, `user_id`), а также
+             текст исключения, если оно было передано через `exc_info`.
+    """
 
-    Функция также автоматически создает директорию `logs`, если она не существует.
-    @note Эту функцию следует вызывать только один раз при старте приложения (в `main.py`),
-          чтобы избежать дублирования обработчиков и многократной записи одних и тех же логов.
-          Тестовые сообщения в конце функции служат для проверки корректности настройки
-          при первом запуске.
-    @return logging.Logger: Полностью настроенный экземпляр логгера.
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "func": record.funcName,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """!
+    @class DeferredQueueHandler
+    @brief `QueueHandler`, который не форматирует трассировку в потоке вызова.
+    @details Стандартный `QueueHandler.prepare` форматирует всю запись, включая
+             трассировку исключения, еще в потоке цикла событий. Здесь в потоке
+             вызова только подставляются аргументы в сообщение: это дешево, а
+             объекты в аргументах (например, исключения) могут измениться или
+             перестать существовать до записи лога. Трассировку, форматтер и
+             запись в файл обрабатывает поток `QueueListener`.
     """
 
-    log_dir = Path("logs")
-    log_dir.mkdir(parents=True, exist_ok=True)
-    log_file = log_dir / "bot.log"
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
 
-    logger = logging.getLogger("call_assessment_bot")
-    logger.setLevel(logging.DEBUG)
 
-    if logger.hasHandlers():
-        logger.handlers.clear()
+def build_handlers(
+    log_file: Path | None,
+    *,
+    console_stream=sys.stdout,
+    console_level: str = "DEBUG",
+    file_level: str = "INFO",
+    file_format: str = "text",
+    rotation: str = "size",
+    max_bytes: int = 10 * 1024 * 1024,
+    rotate_when: str = "midnight",
+    backup_count: int = 7,
+) -> list[logging.Handler]:
+    """!
+    @brief Создает обработчики логов: цветную консоль и ротируемый файл.
+    @details Обработчики не подключаются к логгеру напрямую: их обслуживает
+             `QueueListener` в отдельном потоке (см. `setup_logger`). Цвета
+             (`colorlog`) используются, только если консоль — терминал; в контейнере
+             консольный вывод пишется обычным текстом, и `colorlog` не импортируется.
+    @param log_file [in] Путь к файлу логов или `None`, чтобы писать только в консоль.
+    @param console_stream [in] Поток для консольного вывода.
+    @param console_level [in] Уровень консольного обработчика.
+    @param file_level [in] Уровень файлового обработчика.
+    @param file_format [in] Формат файла: `text` или `json`.
+    @param rotation [in] Ротация файла: `size` или `time`.
+    @param max_bytes [in] Размер файла для ротации по размеру.
+    @param rotate_when [in] Момент ротации по времени.
+    @param backup_count [in] Число хранимых старых файлов.
+    @return Список настроенных обработчиков.
+    """
+
+    console_handler = StreamHandler(console_stream)
+    console_handler.setFormatter(_console_formatter(console_stream))
+    console_handler.setLevel(console_level.upper())
+    handlers: list[logging.Handler] = [console_handler]
+
+    if log_file is not None:
+        if rotation == "time":
+            file_handler = TimedRotatingFileHandler(
+                log_file,
+                when=rotate_when,
+                backupCount=backup_count,
+                encoding="utf-8",
+            )
+        else:
+            file_handler = RotatingFileHandler(
+                log_file,
+                maxBytes=max_bytes,
+                backupCount=backup_count,
+                encoding="utf-8",
+            )
+        file_handler.setFormatter(
+            JsonFormatter()
+            if file_format == "json"
+            else Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT)
+        )
+        file_handler.setLevel(file_level.upper())
+        handlers.append(file_handler)
+
+    return handlers
+
+
+def _console_formatter(stream) -> Formatter:
+    isatty = getattr(stream, "isatty", None)
+    if isatty is None or not isatty():
+        return Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT)
+
+    from colorlog import ColoredFormatter
 
     console_format = (
         "%(log_color)s[%(asctime)s] %(blue)s%(name)s:%(reset)s "
         "%(log_color)s%(levelname)s%(reset)s | "
         "%(cyan)s%(funcName)s:%(reset)s %(log_color)s%(message)s"
     )
-
-    console_formatter = ColoredFormatter(
+    return ColoredFormatter(
         console_format,
-        datefmt="%Y-%m-%d %H:%M:%S",
+        datefmt=DATE_FORMAT,
         reset=True,
         log_colors={
             "DEBUG": "cyan",
@@ -68,30 +181,89 @@ def setup_logger() -> logging.Logger:
         style="%",
     )
 
-    console_handler = StreamHandler(sys.stdout)
-    console_handler.setFormatter(console_formatter)
-    console_handler.setLevel(logging.DEBUG)
 
-    file_handler = logging.FileHandler(log_file)
-    file_formatter = Formatter(
-        "[%(asctime)s] %(name)s:%(levelname)s | %(funcName)s: %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
+def setup_logger(process_name: str | None = None) -> logging.Logger:
+    """!
+    @brief Инициализирует и настраивает главный логгер приложения.
+    @details
+    Создает и конфигурирует именованный логгер (`call_assessment_bot`). Настройка
+    включает два обработчика (handlers):
+    - <b>Консольный обработчик:</b> Выводит логи (по умолчанию от DEBUG и выше) в
+      консоль; в терминале — с цветным форматированием (библиотека `colorlog`)
+      для лучшей читаемости во время разработки.
+    - <b>Файловый обработчик:</b> Записывает логи (по умолчанию от INFO и выше) в файл
+      `logs/bot.log` обычным текстом или в формате JSON Lines (`LOG_FORMAT`).
+      Файл ротируется по размеру или по времени (`LOG_ROTATION`), поэтому
+      не растет бесконечно.
+
+    Обработчики не вызываются в потоке цикла событий. К логгеру подключается только
+    `DeferredQueueHandler`, который подставляет аргументы в сообщение и кладет
+    запись в очередь, а форматирование и запись на диск и в консоль выполняет
+    `QueueListener` в отдельном потоке.
+    Уровень логгера равен минимальному уровню обработчиков, поэтому сообщения,
+    которые никуда не попадут, отбрасываются сразу, без создания записи.
+
+    Функция также автоматически создает директорию `logs`, если она не существует.
+    @note Эту функцию следует вызывать только один раз при старте приложения (в `main.py`),
+          чтобы избежать дублирования обработчиков и многократной записи одних и тех же логов.
+          Вне `APP_ENV=production` функция пишет одно отладочное сообщение с путем
+          к файлу логов.
+    @param process_name [in] Имя процесса (например, `webhook-1`). Если задано, процесс
+           пишет в собственный файл `bot.<имя>.log`, чтобы несколько процессов
+           не ротировали один файл одновременно.
+    @return logging.Logger: Полностью настроенный экземпляр логгера.
+    """
+
+    global _listener
+
+    log_dir = Path(settings.LOG_DIR)
+    log_dir.mkdir(parents=True, exist_ok=True)
+    log_file = log_dir / (f"bot.{process_name}.log" if process_name else "bot.log")
+
+    logger = logging.getLogger("call_assessment_bot")
+
+    stop_logging()
+    if logger.hasHandlers():
+        logger.handlers.clear()
+
+    handlers = build_handlers(
+        log_file,
+        console_level=settings.LOG_CONSOLE_LEVEL,
+        file_level=settings.LOG_FILE_LEVEL,
+        file_format=settings.LOG_FORMAT,
+        rotation=settings.LOG_ROTATION,
+        max_bytes=settings.LOG_MAX_BYTES,
+        rotate_when=settings.LOG_ROTATE_WHEN,
+        backup_count=settings.LOG_BACKUP_COUNT,
     )
-    file_handler.setFormatter(file_formatter)
-    file_handler.setLevel(logging.INFO)
 
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
 
-    logger.debug("Debug message test")
-    logger.info("Info message test")
-    logger.warning("Warning message test")
-    logger.error("Error message test")
-    logger.critical("Critical message test")
+    logger.setLevel(min(handler.level for handler in handlers))
+    logger.addHandler(DeferredQueueHandler(log_queue))
+
+    if settings.APP_ENV != "production":
+        logger.debug("Logging to %s", log_file)
 
     return logger
 
 
+def stop_logging() -> None:
+    """!
+    @brief Дописывает оставшиеся в очереди записи и останавливает поток логирования.
+    @details Вызывается автоматически при завершении процесса; повторный вызов безопасен.
+    """
+
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
 class LoggingMiddleware:
     """!
     @class LoggingMiddleware
@@ -108,6 +280,8 @@ class LoggingMiddleware:
        для всего бота, предотвращая его остановку из-за ошибки в одном из хендлеров.
     3. В случае ошибки, логировать полную информацию об исключении и отправлять
        пользователю вежливое сообщение о сбое.
+    4. Учитывать каждое событие в метриках: число обновлений, полное время
+       обработки и ошибки по типам исключений (см. `core.metrics`).
     """
 
     def __init__(self, logger):
@@ -131,19 +305,27 @@ class LoggingMiddleware:
                  нужно ее распространять дальше, что предотвращает остановку бота.
         """
 
+        started = time.perf_counter()
+        event_name = _event_name(event)
+        UPDATES.labels(event_name).inc()
+
         user = data.get("event_from_user")
-        user_info = f"{user.id} ({user.username})" if user else "Unknown"
+        user_id = user.id if user else None
 
         self.logger.info(
-            f"Processing {type(event).__name__} from {user_info}",
-            extra={"user": user_info},
+            "Processing %s from %s (%s)",
+            event_name,
+            user_id,
+            user.username if user else None,
+            extra={"user_id": user_id},
         )
 
         try:
             return await handler(event, data)
         except Exception as e:
+            ERRORS.labels("handler", type(e).__name__).inc()
             self.logger.error(
-                f"Error in handler for {type(event).__name__}: {e}", exc_info=True
+                "Error in handler for %s: %s", event_name, e, exc_info=True
             )
 
             if hasattr(event, "answer"):
@@ -152,3 +334,12 @@ class LoggingMiddleware:
                 )
 
             return True
+        finally:
+            UPDATE_DURATION.labels(event_name).observe(time.perf_counter() - started)
+
+
+def _event_name(event) -> str:
+    try:
+        return event.event_type
+    except Exception:
+        return type(event).__name__
@@ -0,0 +1,107 @@
+##
+# @file message_editor.py
+# @author Roman Moroz
+# @brief Поэтапное редактирование сообщений Telegram с ограничением частоты.
+# @details Этот модуль содержит класс `ThrottledEditor`, который позволяет показывать
+#          пользователю ответ модели по мере его генерации. Telegram ограничивает
+#          частоту редактирования сообщений, поэтому промежуточные версии текста
+#          объединяются: отправляется только самая свежая версия не чаще, чем
+#          один раз в заданный интервал.
+
+import asyncio
+import logging
+import time
+
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+logger = logging.getLogger("call_assessment_bot")
+
+
+class ThrottledEditor:
+    """!
+    @class ThrottledEditor
+    @brief Редактор сообщения, объединяющий частые обновления в редкие правки.
+    @details
+    Метод `push` не выполняет сетевых запросов: он лишь запоминает новую версию
+    текста и при необходимости запускает фоновую задачу. Эта задача выжидает
+    минимальный интервал с момента последней правки и отправляет последнюю
+    накопленную версию, отбрасывая все промежуточные. Если Telegram отвечает
+    ошибкой `retry_after`, следующая правка откладывается на указанное время.
+    """
+
+    def __init__(self, message: types.Message, min_interval: float):
+        """!
+        @brief Конструктор редактора.
+        @param message [in] Сообщение бота, которое будет редактироваться.
+        @param min_interval [in] Минимальный интервал между правками, в секундах.
+        """
+
+        self.message = message
+        self.min_interval = min_interval
+        self.edits = 0
+        self.coalesced = 0
+
+        self._pending: str | None = None
+        self._last_sent: str | None = None
+        self._next_edit_at = 0.0
+        self._flush_task: asyncio.Task | None = None
+
+    def push(self, text: str) -> None:
+        """!
+        @brief Запоминает новую версию текста для отображения.
+        @details Предыдущая неотправленная версия отбрасывается.
+        @param text [in] Полный текст сообщения (без Markdown-разметки).
+        """
+
+        if self._pending is not None:
+            self.coalesced += 1
+        self._pending = text
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        """!
+        @brief Останавливает фоновые правки.
+        @details Неотправленная версия текста отбрасывается: после вызова этого метода
+                 вызывающий код сам выполняет финальное редактирование сообщения.
+        """
+
+        self._pending = None
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+
+    async def _flush_loop(self) -> None:
+        try:
+            while self._pending is not None:
+                delay = self._next_edit_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                text, self._pending = self._pending, None
+                if text is not None and text != self._last_sent:
+                    await self._edit(text)
+        finally:
+            self._flush_task = None
+
+    async def _edit(self, text: str) -> None:
+        try:
+            await self.message.edit_text(text)
+        except TelegramRetryAfter as e:
+            logger.warning("Telegram asked to slow down edits for %ss", e.retry_after)
+            self._next_edit_at = time.monotonic() + e.retry_after
+            if self._pending is None:
+                self._pending = text
+            return
+        except TelegramBadRequest as e:
+            logger.debug("Skipping progressive edit: %s", e)
+        else:
+            self.edits += 1
+            self._last_sent = text
+
+        self._next_edit_at = time.monotonic() + self.min_interval
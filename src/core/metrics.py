@@ -0,0 +1,441 @@
+##
+# @file metrics.py
+# @author Roman Moroz
+# @brief Метрики работы бота в формате Prometheus.
+# @details Этот модуль содержит легковесные счетчики, датчики и гистограммы,
+#          набор метрик приложения и HTTP-сервер, отдающий их по адресу `/metrics`
+#          в текстовом формате Prometheus. Запись метрики — это поиск в словаре
+#          и несколько арифметических операций без блокировок (бот работает в одном
+#          цикле событий), поэтому инструментирование горячего пути почти ничего
+#          не стоит. Кроме того, здесь находится middleware `aiogram`, измеряющий
+#          время запросов к Telegram Bot API.
+
+import logging
+import math
+import time
+
+from bisect import bisect_left
+from typing import Callable
+
+from aiohttp import web
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+logger = logging.getLogger("call_assessment_bot")
+
+##
+# @var LATENCY_BUCKETS
+# @brief Границы корзин гистограмм задержки, в секундах.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60)
+
+##
+# @var LENGTH_BUCKETS
+# @brief Границы корзин гистограммы длины расшифровки, в символах.
+LENGTH_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+##
+# @var FAST_BUCKETS
+# @brief Границы корзин гистограмм быстрых локальных операций, в секундах.
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 0.5)
+
+##
+# @var BATCH_SIZE_BUCKETS
+# @brief Границы корзин гистограммы размера пакетного запроса, в расшифровках.
+BATCH_SIZE_BUCKETS = (1, 2, 3, 4, 6, 8, 12, 16, 24, 32)
+
+_REGISTRY: list["_Metric"] = []
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: dict[tuple, object] = {}
+        self._function: Callable[[], object] | None = None
+        if not labelnames:
+            self._children[()] = self._new_child()
+        _REGISTRY.append(self)
+
+    def labels(self, *values):
+        """!
+        @brief Возвращает экземпляр метрики для заданных значений меток.
+        @details Полученный объект можно сохранить и использовать повторно, чтобы
+                 не искать его в словаре при каждой записи.
+        """
+
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def set_function(self, function: Callable[[], object]) -> None:
+        """!
+        @brief Задает функцию, вычисляющую значение метрики при сборе метрик.
+        @details Так экспортируются счетчики, которые сервис уже ведет сам
+                 (например, `CacheStats`): горячий путь вообще не затрагивается.
+                 Для метрики без меток функция возвращает число, для метрики
+                 с метками — словарь `{кортеж значений меток: число}`.
+        """
+
+        self._function = function
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def _function_samples(self):
+        value = self._function()
+        if not self.labelnames:
+            yield "", (), value
+            return
+        for values, child_value in value.items():
+            yield "", zip(self.labelnames, values), child_value
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for suffix, labels, value in self._samples():
+            lines.append(
+                f"{self.name}{suffix}{_format_labels(labels)} {_format(value)}"
+            )
+        return lines
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric):
+    """!
+    @class Counter
+    @brief Монотонно растущий счетчик (число запросов, ошибок, токенов).
+    @details По соглашению Prometheus имя счетчика заканчивается на `_total`.
+    """
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1) -> None:
+        """!
+        @brief Увеличивает счетчик без меток.
+        """
+
+        self._children[()].value += amount
+
+    def _new_child(self):
+        return _Value()
+
+    def _samples(self):
+        if self._function is not None:
+            yield from self._function_samples()
+            return
+        for values, child in self._children.items():
+            yield "", zip(self.labelnames, values), child.value
+
+
+class Gauge(_Metric):
+    """!
+    @class Gauge
+    @brief Текущее значение величины, которое может как расти, так и уменьшаться.
+    @details Значение можно не записывать, а вычислять в момент сбора метрик
+             функцией из `set_function` — тогда горячий путь вообще не затрагивается.
+    """
+
+    kind = "gauge"
+
+    def inc(self, amount: float = 1) -> None:
+        """!
+        @brief Увеличивает значение датчика без меток.
+        """
+
+        self._children[()].value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        """!
+        @brief Уменьшает значение датчика без меток.
+        """
+
+        self._children[()].value -= amount
+
+    def _new_child(self):
+        return _Value()
+
+    def _samples(self):
+        if self._function is not None:
+            yield from self._function_samples()
+            return
+        for values, child in self._children.items():
+            yield "", zip(self.labelnames, values), child.value
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    """!
+    @class Histogram
+    @brief Распределение величины по корзинам (задержки, длины текстов).
+    @details Из корзин Prometheus вычисляет перцентили, например
+             `histogram_quantile(0.99, rate(bot_update_duration_seconds_bucket[5m]))`.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = LATENCY_BUCKETS,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float) -> None:
+        """!
+        @brief Учитывает одно наблюдение в гистограмме без меток.
+        """
+
+        self._children[()].observe(value)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def _samples(self):
+        for values, child in self._children.items():
+            labels = list(zip(self.labelnames, values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                yield "_bucket", labels + [("le", bound)], cumulative
+            yield "_sum", labels, child.sum
+            yield "_count", labels, child.count
+
+
+def render() -> str:
+    """!
+    @brief Формирует текст всех метрик в формате Prometheus.
+    """
+
+    lines = []
+    for metric in _REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels) -> str:
+    pairs = [
+        f'{name}="{_format(value) if name == "le" else _escape(value)}"'
+        for name, value in labels
+    ]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+UPDATES = Counter("bot_updates_total", "Processed Telegram updates.", ("event",))
+UPDATE_DURATION = Histogram(
+    "bot_update_duration_seconds",
+    "Total time spent in the middleware chain per update.",
+    ("event",),
+)
+ERRORS = Counter(
+    "bot_errors_total", "Errors by stage and exception type.", ("stage", "error")
+)
+QUEUE_WAIT = Histogram(
+    "bot_queue_wait_seconds", "Time an analysis job waited in the scheduler queue."
+)
+QUEUE_DEPTH = Gauge("bot_queue_depth", "Analysis jobs waiting in the scheduler queue.")
+IN_FLIGHT = Gauge("bot_analyses_in_flight", "Analysis jobs currently running.")
+QUEUE_REJECTED = Counter(
+    "bot_queue_rejected_total",
+    "Analysis jobs rejected because the scheduler queue was full.",
+)
+ANALYSES = Counter(
+    "bot_analyses_total", "Completed analyses by result source.", ("source",)
+)
+ANALYSIS_DURATION = Histogram(
+    "bot_analysis_duration_seconds",
+    "End-to-end analysis time by result source.",
+    ("source",),
+)
+TRANSCRIPT_LENGTH = Histogram(
+    "bot_transcript_length_chars",
+    "Length of analysed transcripts in characters.",
+    buckets=LENGTH_BUCKETS,
+)
+OPENROUTER_DURATION = Histogram(
+    "bot_openrouter_request_duration_seconds",
+    "OpenRouter completion request latency by model and outcome.",
+    ("model", "outcome"),
+)
+PREPROCESS_DURATION = Histogram(
+    "bot_preprocess_duration_seconds",
+    "Transcript preprocessing time by stage.",
+    ("stage",),
+    buckets=FAST_BUCKETS,
+)
+PREPROCESS_TOKENS = Counter(
+    "bot_preprocess_tokens_total",
+    "Estimated transcript tokens before and after preprocessing.",
+    ("kind",),
+)
+RESULTS_FLUSH = Histogram(
+    "bot_results_flush_duration_seconds",
+    "Time to write one batch of analysis results to the results store.",
+    buckets=FAST_BUCKETS,
+)
+RESULTS_PENDING = Gauge(
+    "bot_results_pending", "Analysis results waiting to be written to the store."
+)
+FAST_PATH = Counter(
+    "bot_tonality_fast_path_total",
+    "Analyses routed to the fast model by the local tonality scorer.",
+    ("tonality",),
+)
+MICROBATCH_SIZE = Histogram(
+    "bot_microbatch_size",
+    "Transcripts per model request sent by the micro-batcher.",
+    buckets=BATCH_SIZE_BUCKETS,
+)
+MICROBATCH_WAIT = Histogram(
+    "bot_microbatch_wait_seconds",
+    "Time a transcript waited for its micro-batch to be sent.",
+    buckets=FAST_BUCKETS,
+)
+MICROBATCH_FALLBACKS = Counter(
+    "bot_microbatch_fallbacks_total",
+    "Transcripts analysed individually because their batch failed or lacked them.",
+)
+CACHE_EVENTS = Counter(
+    "bot_cache_events_total",
+    "Analysis cache lookups, stores, evictions and expirations by event.",
+    ("event",),
+)
+CACHE_SAVED_SECONDS = Counter(
+    "bot_cache_saved_seconds_total",
+    "Model time saved by cache hits, from the cost recorded with each entry.",
+)
+CACHE_SAVED_TOKENS = Counter(
+    "bot_cache_saved_tokens_total",
+    "Model tokens saved by cache hits, from the cost recorded with each entry.",
+)
+HEDGES = Counter(
+    "bot_hedged_requests_total",
+    "Hedged completion requests sent to a backup model.",
+    ("model",),
+)
+HEDGE_WINS = Counter(
+    "bot_hedge_wins_total",
+    "Hedged requests whose backup model answered first.",
+    ("model",),
+)
+TOKENS = Counter("bot_tokens_total", "Tokens reported by OpenRouter usage.", ("kind",))
+TELEGRAM_DURATION = Histogram(
+    "bot_telegram_request_duration_seconds",
+    "Telegram Bot API request latency by method.",
+    ("method",),
+)
+TELEGRAM_SEND_DURATION = Histogram(
+    "bot_telegram_send_duration_seconds",
+    "Time to deliver a Telegram request through the outbound scheduler, "
+    "including rate limit waits and retries.",
+    ("method",),
+)
+TELEGRAM_RATE_WAIT = Histogram(
+    "bot_telegram_rate_limit_wait_seconds",
+    "Time a Telegram request waited for per-chat and global rate limit tokens.",
+    ("method",),
+)
+TELEGRAM_FLOOD_WAIT = Counter(
+    "bot_telegram_flood_wait_seconds_total",
+    "Seconds of retry_after requested by Telegram.",
+    ("method",),
+)
+TELEGRAM_COALESCED = Counter(
+    "bot_telegram_coalesced_total",
+    "Message edits superseded by a newer edit before they were sent.",
+)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """!
+    @class TelegramMetricsMiddleware
+    @brief Middleware сессии `aiogram`, измеряющий время запросов к Telegram Bot API.
+    @details Регистрируется через `bot.session.middleware(...)` и охватывает все
+             исходящие вызовы: отправку, редактирование сообщений и загрузку файлов.
+    """
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            ERRORS.labels("telegram", type(e).__name__).inc()
+            raise
+        finally:
+            TELEGRAM_DURATION.labels(name).observe(time.perf_counter() - started)
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """!
+    @brief Запускает HTTP-сервер с эндпоинтом `/metrics`.
+    @details Сервер работает в том же цикле событий, что и бот. Его следует
+             слушать только на локальном интерфейсе или закрыть от внешнего мира.
+    @param host [in] Адрес для прослушивания.
+    @param port [in] Порт для прослушивания.
+    @return web.AppRunner: объект, который нужно остановить через `cleanup()`.
+    """
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Metrics are served on http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,281 @@
+##
+# @file outbound.py
+# @author Roman Moroz
+# @brief Планировщик исходящих запросов к Telegram Bot API.
+# @details Telegram ограничивает частоту сообщений бота: около 30 в секунду всего,
+#          около одного в секунду в личный чат и 20 в минуту в группу. При
+#          превышении он отвечает ошибкой 429 с полем `retry_after`, и обработчик,
+#          который отправлял сообщение, падает или ждет. Этот модуль содержит
+#          middleware сессии `aiogram`, через которое проходят все ответы бота:
+#          - запросы в чат ждут свободного токена в корзине чата и в общей корзине,
+#            поэтому бот сам держится в пределах лимитов; запросы в один чат уходят
+#            по очереди, в порядке вызова;
+#          - после `retry_after` чат приостанавливается на указанное время,
+#            а запрос повторяется первым в очереди чата;
+#          - правка сообщения, которая еще ждет своей очереди, заменяется более
+#            новой правкой того же сообщения, и в Telegram уходит только последняя.
+
+import asyncio
+import logging
+import time
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText
+
+from core.metrics import (
+    TELEGRAM_COALESCED,
+    TELEGRAM_FLOOD_WAIT,
+    TELEGRAM_RATE_WAIT,
+    TELEGRAM_SEND_DURATION,
+)
+
+logger = logging.getLogger("call_assessment_bot")
+
+##
+# @var MAX_CHAT_BUCKETS
+# @brief Число корзин чатов, после которого простаивающие корзины удаляются.
+MAX_CHAT_BUCKETS = 10_000
+
+
+class TokenBucket:
+    """!
+    @class TokenBucket
+    @brief Корзина токенов, ограничивающая частоту запросов.
+    @details
+    Реализована по алгоритму GCRA: вместо числа токенов хранится теоретическое
+    время следующего запроса, поэтому корзине не нужна фоновая задача пополнения.
+    `reserve` сразу занимает место в очереди и возвращает, сколько нужно подождать,
+    так что ожидающие запросы уходят в порядке вызова.
+    """
+
+    __slots__ = ("interval", "tolerance", "_tat")
+
+    def __init__(self, rate: float, burst: int = 1):
+        """!
+        @brief Конструктор корзины.
+        @param rate [in] Допустимая частота запросов, в запросах в секунду.
+        @param burst [in] Сколько запросов можно отправить подряд после простоя.
+        """
+
+        self.interval = 1 / rate
+        self.tolerance = (max(burst, 1) - 1) * self.interval
+        self._tat = 0.0
+
+    def reserve(self, now: float) -> float:
+        """!
+        @brief Занимает место для одного запроса.
+        @param now [in] Текущее время `time.monotonic()`.
+        @return Сколько секунд нужно подождать перед отправкой запроса.
+        """
+
+        start = max(now, self._tat - self.tolerance)
+        self._tat = max(self._tat, now) + self.interval
+        return start - now
+
+    def pause(self, until: float) -> None:
+        """!
+        @brief Запрещает запросы до момента `until` (после ответа `retry_after`).
+        @details После паузы запросы снова идут с обычным интервалом, без всплеска.
+        """
+
+        self._tat = max(self._tat, until + self.tolerance)
+
+    def idle(self, now: float) -> bool:
+        """!
+        @brief Проверяет, что корзина полна и ее можно удалить без потери состояния.
+        """
+
+        return self._tat <= now
+
+
+class _ChatLane:
+    __slots__ = ("bucket", "lock")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.lock = asyncio.Lock()
+
+
+class _PendingEdit:
+    __slots__ = ("method", "future")
+
+    def __init__(self, method: EditMessageText, future: asyncio.Future):
+        self.method = method
+        self.future = future
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """!
+    @class OutboundScheduler
+    @brief Middleware сессии `aiogram`, пропускающий запросы к Telegram с учетом лимитов.
+    @details
+    Регистрируется через `bot.session.middleware(...)` раньше
+    `TelegramMetricsMiddleware`, поэтому время запроса в метриках не включает
+    ожидание лимитов. Ограничиваются только запросы с `chat_id` (отправка,
+    редактирование сообщений, загрузка файлов); `getUpdates`, `getMe` и т.п.
+    проходят без задержки. Запросы в один чат выполняются по одному в порядке
+    вызова, поэтому сообщения не перемешиваются даже после повтора.
+
+    Правки текста одного сообщения (`editMessageText`) доставляет отдельная задача.
+    Пока правка ждет токена, новые правки того же сообщения лишь заменяют ее
+    текст, и все вызывающие получают результат последней отправленной правки.
+    Поэтому отмена вызывающего кода не теряет уже принятую правку.
+
+    Ответ `retry_after` приостанавливает только очередь своего чата: общий лимит
+    бот соблюдает сам, поэтому ошибки 429 почти всегда относятся к одному чату.
+    Если пауза длиннее `max_retry_after` или попытки закончились, исключение
+    `TelegramRetryAfter` передается вызывающему коду.
+    """
+
+    def __init__(
+        self,
+        *,
+        global_rate: float,
+        global_burst: int,
+        chat_rate: float,
+        chat_burst: int,
+        group_rate: float,
+        max_retries: int,
+        max_retry_after: float,
+    ):
+        """!
+        @brief Конструктор планировщика.
+        @param global_rate [in] Общий лимит запросов бота, в запросах в секунду.
+        @param global_burst [in] Допустимый всплеск сверх общего лимита.
+        @param chat_rate [in] Лимит запросов в один личный чат, в запросах в секунду.
+        @param chat_burst [in] Допустимый всплеск запросов в один чат.
+        @param group_rate [in] Лимит запросов в одну группу или канал.
+        @param max_retries [in] Число повторов после ответа `retry_after`.
+        @param max_retry_after [in] Наибольшая пауза `retry_after`, после которой
+               запрос еще повторяется, в секундах.
+        """
+
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats: dict[int | str, _ChatLane] = {}
+        self._edits: dict[tuple, _PendingEdit] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._pruned_at = 0.0
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        started = time.perf_counter()
+        try:
+            if isinstance(method, EditMessageText) and method.message_id is not None:
+                return await self._edit(make_request, bot, method)
+            return await self._send(make_request, bot, method)
+        finally:
+            TELEGRAM_SEND_DURATION.labels(type(method).__name__).observe(
+                time.perf_counter() - started
+            )
+
+    async def _edit(self, make_request, bot, method: EditMessageText):
+        key = (method.chat_id, method.message_id)
+        pending = self._edits.get(key)
+        if pending is not None:
+            pending.method = method
+            TELEGRAM_COALESCED.inc()
+            return await asyncio.shield(pending.future)
+
+        pending = self._edits[key] = _PendingEdit(
+            method, asyncio.get_running_loop().create_future()
+        )
+        task = asyncio.create_task(self._deliver_edit(make_request, bot, key, pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return await asyncio.shield(pending.future)
+
+    async def _deliver_edit(self, make_request, bot, key: tuple, pending) -> None:
+        try:
+            result = await self._send(make_request, bot, pending.method, key)
+        except asyncio.CancelledError:
+            pending.future.cancel()
+            raise
+        except Exception as e:
+            pending.future.set_exception(e)
+            # Все вызывающие могли быть отменены; ошибку уже записали в лог.
+            pending.future.exception()
+        else:
+            pending.future.set_result(result)
+        finally:
+            if self._edits.get(key) is pending:
+                del self._edits[key]
+
+    async def _send(self, make_request, bot, method, edit_key: tuple | None = None):
+        name = type(method).__name__
+        lane = self._lane(method.chat_id)
+        superseded = None
+        async with lane.lock:
+            attempt = 0
+            while True:
+                await self._acquire(lane.bucket, name)
+                if edit_key is not None:
+                    # С этого момента правка в пути: более новая правка встанет
+                    # в очередь заново и не потеряется.
+                    pending = self._edits.pop(edit_key)
+                    method = pending.method
+                try:
+                    return await make_request(bot, method)
+                except TelegramRetryAfter as e:
+                    TELEGRAM_FLOOD_WAIT.labels(name).inc(e.retry_after)
+                    lane.bucket.pause(time.monotonic() + e.retry_after)
+                    attempt += 1
+                    if (
+                        attempt > self.max_retries
+                        or e.retry_after > self.max_retry_after
+                    ):
+                        raise
+                    logger.warning(
+                        "Telegram asked to wait %ss before %s to chat %s, retry %d",
+                        e.retry_after,
+                        name,
+                        method.chat_id,
+                        attempt,
+                    )
+                    if edit_key is not None:
+                        newer = self._edits.setdefault(edit_key, pending)
+                        if newer is not pending:
+                            superseded = newer
+                            break
+        # Более новая правка ждет очереди чата, поэтому ждем ее вне блокировки.
+        return await asyncio.shield(superseded.future)
+
+    async def _acquire(self, bucket: TokenBucket, name: str) -> None:
+        started = time.monotonic()
+        for limit in (bucket, self._global):
+            delay = limit.reserve(time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+        TELEGRAM_RATE_WAIT.labels(name).observe(time.monotonic() - started)
+
+    def _lane(self, chat_id: int | str) -> _ChatLane:
+        lane = self._chats.get(chat_id)
+        if lane is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._prune()
+            private = isinstance(chat_id, int) and chat_id > 0
+            rate = self.chat_rate if private else self.group_rate
+            lane = self._chats[chat_id] = _ChatLane(TokenBucket(rate, self.chat_burst))
+        return lane
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        if now - self._pruned_at < 1.0:
+            return
+        self._pruned_at = now
+        idle = [
+            chat_id
+            for chat_id, lane in self._chats.items()
+            if not lane.lock.locked() and lane.bucket.idle(now)
+        ]
+        for chat_id in idle:
+            del self._chats[chat_id]
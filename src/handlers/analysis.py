@@ -8,12 +8,19 @@
 #          Основной принцип работы - принять запрос, провести базовую валидацию
 #          и передать "тяжелую" работу по анализу текста в сервисный модуль `analyzer`.
 
+import asyncio
 import logging
+import time
 
 from aiogram import Router, F, types
 from aiogram.filters import CommandStart
 
-from services.analyzer import analyzer
+from config.config import settings
+from core.container import container
+from core.message_editor import ThrottledEditor
+from services.formatter import render_partial, render_preliminary, render_reply
+from services.models import AnalysisResult
+from services.scheduler import QueueFullError
 
 logger = logging.getLogger("call_assessment_bot")
 
@@ -25,6 +32,13 @@ logger = logging.getLogger("call_assessment_bot")
 #          что обеспечивает модульность и чистоту кода.
 analysis_router = Router()
 
+##
+# @var QUEUE_FULL_TEXT
+# @brief Ответ пользователю, когда очередь анализа переполнена.
+QUEUE_FULL_TEXT = (
+    "⏳ Сейчас слишком много запросов. Пожалуйста, повторите попытку через минуту."
+)
+
 
 @analysis_router.message(CommandStart())
 async def cmd_start(message: types.Message):
@@ -41,7 +55,10 @@ async def cmd_start(message: types.Message):
         f"👋 **Привет, {message.from_user.full_name}!**\n\n"
         "Я — ИИ-агент по оценке звонков. "
         "Отправьте мне расшифровку телефонного разговора, "
-        "и я определю его тон и дам две рекомендации по улучшению."
+        "и я определю его тон и дам две рекомендации по улучшению.\n\n"
+        "Для пакетного анализа пришлите файл .txt (расшифровки через строку `---`), "
+        ".jsonl, .csv или .zip — я верну таблицу с результатами по каждому звонку.\n\n"
+        "/stats — ваша статистика за месяц, /history — последние анализы."
     )
     await message.answer(welcome_text, parse_mode="Markdown")
 
@@ -57,13 +74,27 @@ async def handle_text_message(message: types.Message):
         Если проверка не пройдена, информирует пользователя и прекращает выполнение.
     2.  <b>Обратная связь:</b> Немедленно отправляет пользователю сообщение "Анализирую...",
         чтобы показать, что запрос принят в работу. Это улучшает пользовательский опыт.
-    3.  <b>Делегирование:</b> Вызывает асинхронный метод `analyze_call` из импортированного
-        сервиса `analyzer`, передавая ему текст сообщения. Вся сложная логика анализа
-        инкапсулирована там.
-    4.  <b>Отображение результата:</b> После получения результата от `analyzer`, редактирует
-        ранее отправленное сообщение "Анализирую...", заменяя его на финальный отчет.
-        Это позволяет избежать "засорения" чата лишними сообщениями.
-    5.  <b>Приглашение к действию:</b> Сообщает пользователю, что готов к следующему заданию.
+        Если включен `TONALITY_PRECLASSIFIER`, в сообщение сразу добавляется
+        предварительная тональность, оцененная локально по словарю.
+    3.  <b>Делегирование:</b> Ставит вызов `analyze_call` сервиса `analyzer` в очередь
+        планировщика `scheduler`, который ограничивает число одновременных запросов
+        к модели и распределяет их между пользователями по кругу. Если задача не
+        может стартовать сразу, пользователь видит свою позицию в очереди, а если
+        очередь переполнена — просьбу повторить попытку позже.
+    4.  <b>Отображение результата:</b> В потоковом режиме (`STREAMING_ENABLED`) ответ
+        модели появляется в сообщении "Анализирую..." по мере генерации (см.
+        `_run_analysis`). По завершении сообщение редактируется еще раз, заменяясь
+        на финальный отчет в Markdown. Это позволяет избежать "засорения" чата
+        лишними сообщениями.
+    5.  <b>Приглашение к действию:</b> В конце отчета сообщает, что готов к следующему
+        заданию. Приглашение входит в ту же правку, а не отправляется отдельным
+        сообщением, чтобы не расходовать лимиты Telegram (см. `core/outbound.py`).
+    6.  <b>Сохранение:</b> Передает результат и время ответа в хранилище `results_store`
+        для команд `/stats` и `/history`. Запись выполняется в фоне.
+
+    В режиме `ANALYSIS_MODE=queue` шаги 3–6 выполняет рабочий процесс (`worker.py`):
+    хендлер лишь отправляет сообщение "Диалог в очереди..." и кладет задачу
+    в надежную очередь (см. `_enqueue_analysis`).
     @param message [in] Объект `aiogram.types.Message` с текстом для анализа.
     """
 
@@ -73,19 +104,145 @@ async def handle_text_message(message: types.Message):
         )
         return
 
+    started = time.perf_counter()
+    preliminary = ""
+    if settings.TONALITY_PRECLASSIFIER:
+        preliminary = "\n\n" + render_preliminary(
+            container.tonality_scorer.score(message.text)
+        )
+
+    if container.job_queue is not None:
+        await _enqueue_analysis(message, preliminary)
+        return
+
+    placeholder = asyncio.get_running_loop().create_future()
+
+    try:
+        job = container.scheduler.submit(
+            message.from_user.id, lambda: _run_analysis(message.text, placeholder)
+        )
+    except QueueFullError:
+        logger.warning(
+            "Analysis queue is full, rejecting user %s", message.from_user.id
+        )
+        await message.answer(QUEUE_FULL_TEXT)
+        return
+
+    try:
+        if job.position:
+            processing_msg = await message.answer(
+                f"⏳ Ваш диалог в очереди на анализ, позиция {job.position}."
+                + preliminary
+            )
+        else:
+            processing_msg = await message.answer(
+                "🔍 Анализирую диалог... Это может занять до 30 секунд." + preliminary
+            )
+    except BaseException:
+        placeholder.cancel()
+        raise
+    placeholder.set_result(processing_msg)
+
+    logger.info(
+        "Queued analysis for user %s. Text length: %d, queue position: %d, "
+        "queue depth: %d",
+        message.from_user.id,
+        len(message.text),
+        job.position,
+        container.scheduler.queue_depth,
+    )
+
+    analysis_result = await job
+
+    await processing_msg.edit_text(render_reply(analysis_result), parse_mode="Markdown")
+    logger.info("Finished analysis for user %s", message.from_user.id)
+
+    if container.results_store is not None:
+        container.results_store.record(
+            user_id=message.from_user.id,
+            chat_id=message.chat.id,
+            result=analysis_result,
+            latency=time.perf_counter() - started,
+            transcript_chars=len(message.text),
+        )
+
+
+async def _enqueue_analysis(message: types.Message, preliminary: str) -> None:
+    """!
+    @brief Передает расшифровку рабочим процессам через очередь задач.
+    @details Сначала отправляется сообщение "Диалог в очереди...", так как воркеру
+             нужен его идентификатор, чтобы заменить сообщение результатом. Если
+             очередь переполнена, это сообщение заменяется просьбой повторить позже.
+    @param message [in] Сообщение пользователя с расшифровкой.
+    @param preliminary [in] Строка с предварительной тональностью или пустая строка.
+    """
+
     processing_msg = await message.answer(
-        "🔍 Анализирую диалог... Это может занять до 30 секунд."
+        "⏳ Ваш диалог поставлен в очередь на анализ." + preliminary
     )
+    try:
+        job_id = await container.job_queue.put(
+            chat_id=message.chat.id,
+            message_id=processing_msg.message_id,
+            user_id=message.from_user.id,
+            transcript=message.text,
+        )
+    except QueueFullError as e:
+        logger.warning(
+            "Job queue is full (%d jobs), rejecting user %s",
+            e.depth,
+            message.from_user.id,
+        )
+        await processing_msg.edit_text(QUEUE_FULL_TEXT)
+        return
+
     logger.info(
-        f"Started analysis for user {message.from_user.id}. Text length: {len(message.text)}"
+        "Enqueued analysis job %s for user %s. Text length: %d",
+        job_id,
+        message.from_user.id,
+        len(message.text),
     )
 
-    analysis_result = await analyzer.analyze_call(message.text)
 
-    await processing_msg.edit_text(analysis_result, parse_mode="Markdown")
+async def _run_analysis(transcript: str, placeholder: asyncio.Future) -> AnalysisResult:
+    """!
+    @brief Выполняет анализ внутри слота планировщика.
+    @details
+    В обычном режиме просто вызывает `analyzer.analyze_call`. В потоковом режиме
+    дожидается сообщения-заглушки (оно отправляется хендлером уже после постановки
+    задачи в очередь) и показывает в нем ответ модели по мере генерации через
+    `ThrottledEditor`. Незавершенный JSON-ответ превращается в читаемый текст
+    функцией `render_partial` и отправляется без Markdown-разметки.
+
+    Если поток прервался из-за ошибки, выполняется обычный непотоковый запрос,
+    который сам обработает ошибку и вернет вежливое сообщение.
+    @param transcript [in] Текст расшифровки для анализа.
+    @param placeholder [in] Future, в который хендлер помещает сообщение-заглушку.
+    @return AnalysisResult: итоговый результат анализа.
+    """
 
-    logger.info(f"Finished analysis for user {message.from_user.id}")
-    await message.answer("Готов к анализу следующего диалога!")
+    if not settings.STREAMING_ENABLED:
+        return await container.analyzer.analyze_call(transcript)
+
+    processing_msg = await placeholder
+    editor = ThrottledEditor(processing_msg, settings.STREAM_EDIT_INTERVAL)
+    stream = container.analyzer.stream_call(transcript)
+    parts = []
+
+    try:
+        async for chunk in stream:
+            parts.append(chunk)
+            partial = render_partial("".join(parts))
+            if partial:
+                editor.push(partial + " ▌")
+    except Exception as e:
+        logger.warning("Streaming analysis failed, falling back to single-shot: %s", e)
+    finally:
+        await editor.close()
+
+    if stream.result is None:
+        return await container.analyzer.analyze_call(transcript)
+    return stream.result
 
 
 @analysis_router.message(F.content_type.is_not(types.ContentType.TEXT))
@@ -95,8 +252,12 @@ async def handle_unsupported_message(message: types.Message):
     @details
     Этот хендлер использует "магический" фильтр `F.content_type.is_not(...)` для
     перехвата всех сообщений, которые НЕ являются текстом (например, фото, стикеры,
-    аудио, документы и т.д.). Он вежливо сообщает пользователю о том, что бот
-    умеет работать только с текстом.
+    аудио и т.д.). Документы сюда не попадают: их раньше перехватывает `batch_router`.
+    Он вежливо сообщает пользователю о том, что бот умеет работать только с текстом
+    и файлами расшифровок.
     """
 
-    await message.answer("❌ Я умею анализировать только текстовые сообщения.")
+    await message.answer(
+        "❌ Я умею анализировать только текстовые сообщения "
+        "и файлы расшифровок (.txt, .jsonl, .csv, .zip)."
+    )
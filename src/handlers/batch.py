@@ -0,0 +1,167 @@
+##
+# @file batch.py
+# @author Roman Moroz
+# @brief Обработчик документов для пакетного анализа расшифровок.
+# @details Этот файл содержит хендлер, который принимает от пользователя файл
+#          с множеством расшифровок (`.txt`, `.jsonl`, `.csv` или `.zip`),
+#          анализирует их через общий планировщик и возвращает один файл
+#          с тональностью и рекомендациями по каждому звонку.
+
+import asyncio
+import csv
+import itertools
+import logging
+import tempfile
+import time
+import zipfile
+
+from pathlib import Path
+
+from aiogram import Bot, F, Router, types
+
+from config.config import settings
+from core.container import container
+from core.message_editor import ThrottledEditor
+from services.models import AnalysisResult
+from services.batch import (
+    SUPPORTED_EXTENSIONS,
+    ResultWriter,
+    iter_transcripts,
+    run_batch,
+)
+from services.scheduler import QueueFullError
+
+logger = logging.getLogger("call_assessment_bot")
+
+##
+# @var batch_router
+# @brief Экземпляр `aiogram.Router` для пакетного анализа.
+# @details Подключается в `main.py` раньше `analysis_router`, чтобы документы
+#          перехватывались здесь, а не хендлером неподдерживаемых сообщений.
+batch_router = Router()
+
+
+@batch_router.message(F.document)
+async def handle_document(message: types.Message, bot: Bot):
+    """!
+    @brief Обработчик загруженного документа с расшифровками.
+    @details
+    1.  <b>Валидация:</b> проверяет расширение и размер файла.
+    2.  <b>Загрузка:</b> скачивает документ во временную директорию.
+    3.  <b>Анализ:</b> потоково читает расшифровки (не больше `BATCH_MAX_ITEMS`,
+        о лишних пользователь получает предупреждение) и анализирует их, одновременно
+        не более `BATCH_CONCURRENCY` штук. Каждый анализ проходит через
+        `scheduler`, поэтому пакет не вытесняет интерактивных пользователей.
+    4.  <b>Прогресс:</b> редактирует одно статусное сообщение не чаще, чем раз
+        в `BATCH_PROGRESS_INTERVAL` секунд.
+    5.  <b>Результат:</b> отправляет итоговый CSV (или JSONL для входного JSONL) файл.
+    @param message [in] Сообщение с документом.
+    @param bot [in] Экземпляр бота, используется для скачивания файла.
+    """
+
+    document = message.document
+    filename = document.file_name or "transcripts.txt"
+    extension = Path(filename).suffix.lower()
+
+    if extension not in SUPPORTED_EXTENSIONS:
+        await message.answer(
+            "❌ Поддерживаются файлы .txt, .jsonl, .csv и .zip с расшифровками."
+        )
+        return
+
+    if document.file_size and document.file_size > settings.BATCH_MAX_FILE_SIZE:
+        await message.answer(
+            f"❌ Файл слишком большой. Максимальный размер — "
+            f"{settings.BATCH_MAX_FILE_SIZE // (1024 * 1024)} МБ."
+        )
+        return
+
+    status_msg = await message.answer("📥 Загружаю файл...")
+    user_id = message.from_user.id
+    logger.info("Started batch analysis for user %s: %s", user_id, filename)
+    started = time.monotonic()
+
+    with tempfile.TemporaryDirectory(prefix="batch-") as workdir:
+        source = Path(workdir) / f"source{extension}"
+        await bot.download(document, destination=source)
+
+        output_format = "jsonl" if extension == ".jsonl" else "csv"
+        output = Path(workdir) / f"{Path(filename).stem}-results.{output_format}"
+        writer = ResultWriter(output, output_format)
+        editor = ThrottledEditor(status_msg, settings.BATCH_PROGRESS_INTERVAL)
+
+        try:
+            items = iter_transcripts(
+                source,
+                filename,
+                max_member_size=settings.BATCH_ZIP_MAX_MEMBER_SIZE,
+                max_unpacked_size=settings.BATCH_ZIP_MAX_UNPACKED_SIZE,
+            )
+            results = run_batch(
+                itertools.islice(items, settings.BATCH_MAX_ITEMS),
+                lambda transcript: _analyze_scheduled(user_id, transcript),
+                concurrency=settings.BATCH_CONCURRENCY,
+            )
+            async for result in results:
+                writer.write(result)
+                editor.push(
+                    f"⚙️ Обработано звонков: {writer.written}, ошибок: {writer.errors}"
+                )
+            truncated = await asyncio.to_thread(next, items, None) is not None
+        except (ValueError, OSError, csv.Error, zipfile.BadZipFile) as e:
+            logger.warning("Failed to read batch file %s: %s", filename, e)
+            await editor.close()
+            await status_msg.edit_text(f"❌ Не удалось прочитать файл: {e}")
+            return
+        finally:
+            await editor.close()
+            writer.close()
+
+        elapsed = time.monotonic() - started
+        logger.info(
+            "Finished batch analysis for user %s: %d calls, %d errors in %.1fs",
+            user_id,
+            writer.written,
+            writer.errors,
+            elapsed,
+        )
+
+        if not writer.written:
+            await status_msg.edit_text("⚠️ В файле не найдено ни одной расшифровки.")
+            return
+
+        summary = (
+            f"✅ Готово! Обработано звонков: {writer.written}, ошибок: {writer.errors}."
+        )
+        if truncated:
+            logger.warning(
+                "Batch file %s truncated to %d calls",
+                filename,
+                settings.BATCH_MAX_ITEMS,
+            )
+            summary += (
+                f"\n⚠️ В файле больше {settings.BATCH_MAX_ITEMS} расшифровок, "
+                f"обработаны только первые {settings.BATCH_MAX_ITEMS}."
+            )
+        await status_msg.edit_text(summary)
+        await message.answer_document(types.FSInputFile(output, filename=output.name))
+
+
+async def _analyze_scheduled(user_id: int, transcript: str) -> AnalysisResult:
+    """!
+    @brief Анализирует одну расшифровку пакета через общий планировщик.
+    @details Если очередь планировщика переполнена, ждет и повторяет попытку:
+             пакетная обработка не должна падать из-за всплеска интерактивных запросов.
+    """
+
+    while True:
+        try:
+            job = container.scheduler.submit(
+                user_id,
+                lambda: container.analyzer.analyze_call(transcript),
+                limit=settings.BATCH_CONCURRENCY,
+            )
+        except QueueFullError:
+            await asyncio.sleep(1.0)
+            continue
+        return await job
@@ -0,0 +1,100 @@
+##
+# @file stats.py
+# @author Roman Moroz
+# @brief Команды `/stats` и `/history` для просмотра сохраненных результатов анализа.
+# @details Оба хендлера только читают хранилище результатов: `/stats` —
+#          агрегаты по дням, `/history` — последние записи пользователя. Поэтому
+#          они отвечают быстро при любом размере журнала и не обращаются к модели.
+
+import logging
+
+from aiogram import Router, types
+from aiogram.filters import Command, CommandObject
+
+from config.config import settings
+from core.container import container
+from services.formatter import render_history, render_stats
+
+logger = logging.getLogger("call_assessment_bot")
+
+##
+# @var stats_router
+# @brief Экземпляр `aiogram.Router` для команд статистики.
+# @details Подключается в `main.py` раньше `analysis_router`, иначе команды
+#          перехватил бы хендлер текстовых сообщений.
+stats_router = Router()
+
+##
+# @var DISABLED_TEXT
+# @brief Ответ на команды статистики, когда хранилище результатов отключено.
+DISABLED_TEXT = "📊 Сохранение результатов отключено, статистика недоступна."
+
+##
+# @var MAX_STATS_DAYS
+# @brief Максимальный период, который можно запросить командой `/stats`, в днях.
+MAX_STATS_DAYS = 366
+
+
+@stats_router.message(Command("stats"))
+async def cmd_stats(message: types.Message, command: CommandObject):
+    """!
+    @brief Обработчик команды `/stats [all] [дней]`.
+    @details
+    Без аргументов показывает статистику пользователя за `STATS_DEFAULT_DAYS` дней:
+    число анализов, распределение тональностей, долю ошибок, среднее время ответа
+    и число анализов по дням. Число в аргументах задает другой период. Аргумент
+    `all` показывает статистику по всем пользователям; он доступен только
+    пользователям из `STATS_ADMIN_IDS`.
+    @param message [in] Сообщение с командой.
+    @param command [in] Разобранная команда с аргументами.
+    """
+
+    results_store = container.results_store
+    if results_store is None:
+        await message.answer(DISABLED_TEXT)
+        return
+
+    days = settings.STATS_DEFAULT_DAYS
+    everyone = False
+    for argument in (command.args or "").split():
+        if argument.lower() == "all":
+            everyone = True
+        elif argument.isdigit() and int(argument) > 0:
+            days = min(int(argument), MAX_STATS_DAYS)
+        else:
+            await message.answer("Использование: /stats [all] [число дней]")
+            return
+
+    if everyone and message.from_user.id not in settings.STATS_ADMIN_IDS:
+        await message.answer("⛔ Общая статистика доступна только администраторам.")
+        return
+
+    summary = await results_store.stats(
+        None if everyone else message.from_user.id, days
+    )
+    title = "Статистика всех пользователей" if everyone else "Ваша статистика"
+    await message.answer(render_stats(summary, title), parse_mode="Markdown")
+    logger.info(
+        "Sent %s statistics for %d days to user %s",
+        "team" if everyone else "personal",
+        days,
+        message.from_user.id,
+    )
+
+
+@stats_router.message(Command("history"))
+async def cmd_history(message: types.Message):
+    """!
+    @brief Обработчик команды `/history`.
+    @details Показывает последние `HISTORY_LIMIT` анализов пользователя: время,
+             тональность и первую рекомендацию.
+    @param message [in] Сообщение с командой.
+    """
+
+    results_store = container.results_store
+    if results_store is None:
+        await message.answer(DISABLED_TEXT)
+        return
+
+    results = await results_store.history(message.from_user.id, settings.HISTORY_LIMIT)
+    await message.answer(render_history(results), parse_mode="Markdown")
@@ -4,49 +4,261 @@
 # @brief Главная точка входа для запуска Telegram-бота.
 # @details Этот скрипт отвечает за инициализацию всех ключевых компонентов приложения:
 #          логгера, бота, диспетчера, а также за регистрацию "middleware" и роутеров.
-#          После завершения настройки он запускает бота в режиме long-polling.
+#          После завершения настройки он запускает бота в режиме long-polling
+#          (по умолчанию) или в режиме вебхука (`BOT_MODE=webhook`), когда Telegram
+#          сам присылает обновления на встроенный aiohttp-сервер.
 
 import asyncio
 import logging
+import multiprocessing
+
+from aiohttp import web
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 from config.config import settings
+from core.container import container
 from core.logger import setup_logger, LoggingMiddleware
+from core.metrics import TelegramMetricsMiddleware, start_metrics_server
+from core.outbound import OutboundScheduler
 from handlers.analysis import analysis_router
+from handlers.batch import batch_router
+from handlers.stats import stats_router
+
+
+async def on_startup(dispatcher: Dispatcher):
+    """!
+    @brief Хук запуска диспетчера.
+    @details Создает сервисы контейнера (`container.start()`): анализатор с пулом
+             соединений с OpenRouter и фоновую запись результатов анализа. Если
+             включено в настройках (`HTTP_WARMUP`), прогревает пул в фоне, чтобы
+             первый пользователь не ждал установки TLS-соединения, а получение
+             обновлений не ждало прогрева. Если включены метрики
+             (`METRICS_ENABLED`), запускает сервер `/metrics` на порту из данных
+             диспетчера.
+    """
+
+    await container.start()
+    if settings.HTTP_WARMUP:
+        dispatcher["warmup_task"] = asyncio.create_task(container.analyzer.warm_up())
+    if settings.METRICS_ENABLED:
+        dispatcher["metrics_runner"] = await start_metrics_server(
+            settings.METRICS_HOST, dispatcher["metrics_port"]
+        )
+
+
+async def on_shutdown(dispatcher: Dispatcher):
+    """!
+    @brief Хук остановки диспетчера.
+    @details Закрывает соединения с OpenRouter, дисковый уровень кэша, очередь задач,
+             дописывает и закрывает хранилище результатов и останавливает сервер метрик.
+    """
+
+    warmup = dispatcher.workflow_data.pop("warmup_task", None)
+    if warmup is not None:
+        warmup.cancel()
+    await container.close()
+    runner = dispatcher.workflow_data.pop("metrics_runner", None)
+    if runner is not None:
+        await runner.cleanup()
+
+
+def create_bot(processes: int = 1) -> Bot:
+    """!
+    @brief Создает экземпляр `Bot` с измерением времени запросов к Telegram.
+    @details Если задан `TELEGRAM_API_URL`, запросы отправляются на собственный
+             сервер Bot API (или на заглушку при нагрузочном тестировании). Если
+             включен `OUTBOUND_ENABLED`, все запросы проходят через планировщик
+             отправки `OutboundScheduler`, соблюдающий лимиты Telegram.
+             Планировщик считает лимиты только в своем процессе, поэтому общий
+             лимит `OUTBOUND_GLOBAL_*` делится между `processes` процессами.
+    @param processes [in] Число процессов, одновременно отправляющих сообщения
+           от имени бота (воркеры вебхука или очереди задач).
+    @return Bot: бот с зарегистрированными `OutboundScheduler`
+            и `TelegramMetricsMiddleware`.
+    """
+
+    session = None
+    if settings.TELEGRAM_API_URL:
+        session = AiohttpSession(
+            api=TelegramAPIServer.from_base(settings.TELEGRAM_API_URL)
+        )
+    bot = Bot(token=settings.BOT_TOKEN.get_secret_value(), session=session)
+    if settings.OUTBOUND_ENABLED:
+        bot.session.middleware(
+            OutboundScheduler(
+                global_rate=settings.OUTBOUND_GLOBAL_RATE / processes,
+                global_burst=max(1, settings.OUTBOUND_GLOBAL_BURST // processes),
+                chat_rate=settings.OUTBOUND_CHAT_RATE,
+                chat_burst=settings.OUTBOUND_CHAT_BURST,
+                group_rate=settings.OUTBOUND_GROUP_RATE,
+                max_retries=settings.OUTBOUND_MAX_RETRIES,
+                max_retry_after=settings.OUTBOUND_MAX_RETRY_AFTER,
+            )
+        )
+    bot.session.middleware(TelegramMetricsMiddleware())
+    return bot
+
+
+def create_dispatcher(
+    logger: logging.Logger, metrics_port: int | None = None
+) -> Dispatcher:
+    """!
+    @brief Собирает диспетчер со всеми middleware, роутерами и хуками.
+    @details Используется в обоих режимах работы, поэтому поведение бота при
+             поллинге и при вебхуке полностью совпадает.
+    @param logger [in] Настроенный логгер приложения.
+    @param metrics_port [in] Порт сервера метрик этого процесса; по умолчанию
+           `METRICS_PORT`.
+    @return Dispatcher: готовый к запуску диспетчер.
+    """
+
+    if metrics_port is None:
+        metrics_port = settings.METRICS_PORT
+    dp = Dispatcher(metrics_port=metrics_port)
+
+    logging_middleware = LoggingMiddleware(logger)
+    dp.update.outer_middleware(logging_middleware)
+
+    dp.include_router(batch_router)
+    dp.include_router(stats_router)
+    dp.include_router(analysis_router)
+
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    return dp
 
 
 async def main():
     """!
-    @brief Основная асинхронная функция для инициализации и запуска бота.
+    @brief Основная асинхронная функция для инициализации и запуска бота в режиме поллинга.
     @details
     Выполняет последовательность действий для сборки и запуска приложения:
     1. Инициализирует глобальный логгер с помощью `setup_logger`.
     2. Создает экземпляр `Bot` с токеном из файла конфигурации.
-    3. Создает экземпляр `Dispatcher` для обработки входящих обновлений.
-    4. Регистрирует `LoggingMiddleware` как "внешний" middleware (outer_middleware).
-       Это позволяет логировать и безопасно обрабатывать ошибки для всех без исключения событий.
-    5. Подключает к главному диспетчеру все обработчики команд и сообщений из `analysis_router`.
-    6. Удаляет любые предыдущие настройки вебхука для чистого запуска в режиме поллинга.
-    7. Запускает бесконечный цикл получения обновлений от Telegram (long-polling).
+    3. Создает экземпляр `Dispatcher` через `create_dispatcher`, который регистрирует
+       `LoggingMiddleware` как "внешний" middleware (outer_middleware), подключает
+       обработчики из `batch_router`, `stats_router` и `analysis_router` и хуки
+       `on_startup`/`on_shutdown`.
+    4. Удаляет любые предыдущие настройки вебхука для чистого запуска в режиме поллинга.
+    5. Запускает бесконечный цикл получения обновлений от Telegram (long-polling).
     """
 
     logger = setup_logger()
 
-    bot = Bot(token=settings.BOT_TOKEN.get_secret_value())
-    dp = Dispatcher()
-
-    logging_middleware = LoggingMiddleware(logger)
-    dp.update.outer_middleware(logging_middleware)
-
-    dp.include_router(analysis_router)
+    bot = create_bot()
+    dp = create_dispatcher(logger)
 
     logger.info("Bot is starting polling...")
     await bot.delete_webhook(drop_pending_updates=True)
     await dp.start_polling(bot)
 
 
+async def register_webhook():
+    """!
+    @brief Сообщает Telegram адрес вебхука.
+    @details Вызывается один раз в главном процессе до запуска рабочих процессов,
+             поэтому при нескольких воркерах вебхук не переустанавливается каждым
+             из них. В Telegram передается секретный токен: он будет приходить
+             в заголовке `X-Telegram-Bot-Api-Secret-Token` каждого запроса.
+    """
+
+    if not settings.WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_URL must be set to register the webhook")
+
+    async with create_bot() as bot:
+        await bot.set_webhook(
+            url=settings.WEBHOOK_URL.rstrip("/") + settings.WEBHOOK_PATH,
+            secret_token=_webhook_secret(),
+            allowed_updates=["message"],
+        )
+
+
+def serve_webhook(reuse_port: bool = False, worker: int = 0):
+    """!
+    @brief Запускает aiohttp-сервер, принимающий обновления от Telegram.
+    @details
+    Обновления принимает `SimpleRequestHandler` из интеграции aiogram с aiohttp.
+    Он проверяет секретный токен и сразу отвечает Telegram `200 OK`, а само
+    обновление обрабатывается в фоне тем же диспетчером, что и при поллинге.
+    `setup_application` связывает хуки запуска и остановки диспетчера с жизненным
+    циклом aiohttp-приложения.
+
+    Сервер слушает `WEBHOOK_HOST:WEBHOOK_PORT` без TLS: предполагается, что перед
+    ним стоит обратный прокси (nginx, Caddy и т.д.), который завершает HTTPS.
+    @param reuse_port [in] Открыть сокет с `SO_REUSEPORT`, чтобы несколько процессов
+           слушали один порт, а ядро распределяло между ними соединения.
+    @param worker [in] Номер рабочего процесса; определяет порт сервера метрик
+           и имя файла логов.
+    """
+
+    logger = setup_logger(f"webhook-{worker}" if reuse_port else None)
+
+    bot = create_bot(settings.WEBHOOK_WORKERS if reuse_port else 1)
+    dp = create_dispatcher(logger, metrics_port=settings.METRICS_PORT + worker)
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, secret_token=_webhook_secret()
+    ).register(app, path=settings.WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    logger.info(
+        "Bot is serving webhook on %s:%s%s",
+        settings.WEBHOOK_HOST,
+        settings.WEBHOOK_PORT,
+        settings.WEBHOOK_PATH,
+    )
+    web.run_app(
+        app,
+        host=settings.WEBHOOK_HOST,
+        port=settings.WEBHOOK_PORT,
+        reuse_port=reuse_port,
+        print=None,
+    )
+
+
+def run_webhook():
+    """!
+    @brief Запускает бота в режиме вебхука с заданным числом рабочих процессов.
+    @details При `WEBHOOK_WORKERS > 1` каждый воркер запускается в отдельном процессе
+             (метод `spawn`, чтобы процессы не наследовали открытые соединения и файлы
+             родителя) и слушает общий порт через `SO_REUSEPORT`.
+    """
+
+    if settings.WEBHOOK_SET_ON_STARTUP:
+        asyncio.run(register_webhook())
+
+    if settings.WEBHOOK_WORKERS <= 1:
+        serve_webhook()
+        return
+
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(
+            target=serve_webhook, args=(True, index), name=f"webhook-{index}"
+        )
+        for index in range(settings.WEBHOOK_WORKERS)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def _webhook_secret() -> str | None:
+    if settings.WEBHOOK_SECRET is None:
+        return None
+    return settings.WEBHOOK_SECRET.get_secret_value()
+
+
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        if settings.BOT_MODE == "webhook":
+            run_webhook()
+        else:
+            asyncio.run(main())
     except (KeyboardInterrupt, SystemExit):
         logging.getLogger("call_assessment_bot").info("Bot stopped manually.")
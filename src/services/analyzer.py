@@ -4,16 +4,144 @@
 # @brief Сервисный модуль, отвечающий за взаимодействие с ИИ-моделями.
 # @details Этот модуль содержит класс `CallAnalyzer`, который является "мозгом" бота.
 #          Он инкапсулирует всю логику, связанную с API-запросами к ИИ, обработкой
-#          текста и формированием ответа. Ключевая особенность - использование
-#
+#          текста и формированием ответа. Сами запросы выполняет сменный бэкенд
+#          (`services.backends`): OpenRouter, локальный OpenAI-совместимый сервер
+#          или фиктивная модель для тестов.
 
+import asyncio
+import json
 import logging
+import math
+import time
+
+from typing import AsyncIterator, Hashable
 
-from openai import AsyncOpenAI
 from config.config import settings
+from core.metrics import (
+    ANALYSES,
+    ANALYSIS_DURATION,
+    ERRORS,
+    FAST_PATH,
+    MICROBATCH_FALLBACKS,
+    TOKENS,
+    TRANSCRIPT_LENGTH,
+)
+from services.backends import FakeBackend, OpenAIBackend, create_backend
+from services.cache import AnalysisCache
+from services.chunking import estimate_tokens, split_transcript
+from services.microbatch import MicroBatcher
+from services.models import (
+    AnalysisResult,
+    MalformedOutputError,
+    Tonality,
+    parse_batch_output,
+)
+from services.preprocessing import TranscriptPreprocessor
+from services.resilience import ResilientCaller
+from services.tonality import LexiconScorer
 
 logger = logging.getLogger("call_assessment_bot")
 
+##
+# @var SYSTEM_PROMPT
+# @brief Системный промпт, задающий роль модели и строгий формат ответа.
+SYSTEM_PROMPT = (
+    "Ты — опытный ИИ-аналитик колл-центра. Твоя задача — анализировать расшифровки "
+    "телефонных разговоров. Внимательно изучи предоставленный диалог. "
+    "Твой ответ должен быть четким и на русском языке. "
+    "Верни СТРОГО один JSON-объект без Markdown и без лишних вступлений и заключений:\n"
+    '{"tonality": "Позитивная" | "Нейтральная" | "Негативная", '
+    '"recommendations": ["первая краткая и конкретная рекомендация по улучшению '
+    'диалога", "вторая краткая и конкретная рекомендация"]}'
+)
+
+##
+# @var RESPONSE_SCHEMA
+# @brief JSON Schema ответа модели для режима структурированного вывода.
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "tonality": {"type": "string", "enum": [t.value for t in Tonality]},
+        "recommendations": {
+            "type": "array",
+            "items": {"type": "string"},
+            "minItems": 2,
+            "maxItems": 2,
+        },
+    },
+    "required": ["tonality", "recommendations"],
+    "additionalProperties": False,
+}
+
+##
+# @var BATCH_PROMPT
+# @brief Системный промпт пакетного запроса: несколько расшифровок в одном запросе.
+# @details Расшифровки передаются JSON-массивом `[{"id": 1, "transcript": "..."}]`,
+#          чтобы границы между ними были однозначны, а ответы — сопоставимы по `id`.
+BATCH_PROMPT = (
+    "Ты — опытный ИИ-аналитик колл-центра. Твоя задача — анализировать расшифровки "
+    "телефонных разговоров. Тебе дан JSON-массив расшифровок, у каждой есть поле "
+    "id. Проанализируй каждую расшифровку независимо от остальных. "
+    "Ответы должны быть четкими и на русском языке. "
+    "Верни СТРОГО один JSON-объект без Markdown и без лишних вступлений и заключений:\n"
+    '{"results": [{"id": id расшифровки, '
+    '"tonality": "Позитивная" | "Нейтральная" | "Негативная", '
+    '"recommendations": ["первая краткая и конкретная рекомендация по улучшению '
+    'диалога", "вторая краткая и конкретная рекомендация"]}]}\n'
+    "В results должно быть ровно по одному элементу на каждую расшифровку."
+)
+
+##
+# @var BATCH_RESPONSE_SCHEMA
+# @brief JSON Schema ответа на пакетный запрос.
+BATCH_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "integer"},
+                    **RESPONSE_SCHEMA["properties"],
+                },
+                "required": ["id", *RESPONSE_SCHEMA["required"]],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["results"],
+    "additionalProperties": False,
+}
+
+##
+# @var REPAIR_PROMPT
+# @brief Сообщение, которым модель просят исправить некорректный ответ.
+REPAIR_PROMPT = (
+    "Твой ответ не является корректным JSON-объектом требуемого формата. "
+    "Верни только исправленный JSON-объект, без пояснений."
+)
+
+##
+# @var CHUNK_PROMPT
+# @brief Системный промпт этапа "map": краткий анализ одного фрагмента длинного звонка.
+CHUNK_PROMPT = (
+    "Ты — опытный ИИ-аналитик колл-центра. Тебе дан фрагмент {index} из {total} "
+    "расшифровки одного длинного телефонного разговора. Кратко, на русском языке, "
+    "опиши тональность этого фрагмента (Позитивная, Нейтральная или Негативная) "
+    "и перечисли до трех конкретных ошибок или удачных приемов оператора. "
+    "Не пиши вступлений и заключений."
+)
+
+##
+# @var REDUCE_PREFACE
+# @brief Вводная часть пользовательского сообщения этапа "reduce".
+REDUCE_PREFACE = (
+    "Расшифровка разговора слишком длинная, поэтому она была проанализирована "
+    "по частям. Ниже приведены анализы последовательных фрагментов одного звонка. "
+    "Сведи их в итоговую оценку всего разговора в требуемом формате.\n\n"
+)
+
 
 class CallAnalyzer:
     """!
@@ -21,100 +149,615 @@ class CallAnalyzer:
     @brief Инкапсулирует всю логику для анализа расшифровок звонков с помощью ИИ.
     @details
     Этот класс предоставляет единый метод `analyze_call` для выполнения всей работы.
-    В конструкторе он настраивает асинхронный клиент для взаимодействия с API,
-    а сам метод отвечает за формирование промпта, вызов модели и обработку ее ответа,
-    включая возможные ошибки.
+    Он отвечает за формирование промпта, вызов модели и обработку ее ответа,
+    включая возможные ошибки. Сам запрос выполняет бэкенд (`services.backends`),
+    выбранный настройкой `ANALYSIS_BACKEND`; модель задается `ANALYSIS_MODEL`.
+
+    Успешные ответы модели сохраняются в `AnalysisCache`, поэтому повторный анализ
+    той же расшифровки возвращается мгновенно и не расходует токены.
+
+    Длинные расшифровки (больше `LONG_TRANSCRIPT_THRESHOLD` оценочных токенов)
+    анализируются по схеме map-reduce: текст делится на фрагменты по репликам,
+    фрагменты анализируются параллельно (не более `CHUNK_CONCURRENCY` запросов
+    одновременно), а затем отдельный запрос сводит частичные анализы в итоговый
+    ответ привычного формата.
+
+    Модель отвечает в формате JSON (`response_format`), а ответ разбирается
+    в типизированный `AnalysisResult`. Если ответ не удалось разобрать даже после
+    дешевого локального ремонта, модель один раз просят исправить его.
+    Отображение результата пользователю выполняет модуль `formatter`.
+
+    Все запросы к модели проходят через `ResilientCaller`: временные ошибки
+    повторяются с экспоненциальной задержкой, недоступная модель исключается
+    автоматическим выключателем, а при сбоях или медленных ответах запрос
+    переключается (или хеджируется) на резервные модели из `FALLBACK_MODELS`.
+
+    Перед анализом расшифровка очищается (`services.preprocessing`): удаляются
+    временные метки, слова-паразиты и повторы, которые только расходуют токены.
+    Ключ кэша и выбор модели вычисляются уже по очищенному тексту.
+
+    Если включен упрощенный путь (`TONALITY_FAST_PATH`), расшифровка сначала
+    оценивается локальным словарным классификатором (`services.tonality`).
+    Диалоги с очевидной тональностью отправляются более дешевой модели
+    `TONALITY_FAST_MODEL`, а при ее сбое — основной.
+
+    Если включены пакетные запросы (`MICROBATCH_ENABLED`), короткие расшифровки,
+    пришедшие почти одновременно, собираются `MicroBatcher` в один запрос
+    к модели (`_analyze_batch`). Если ответ на пакет не удалось разобрать
+    или в нем нет результата для расшифровки, она анализируется отдельно;
+    если пакетный запрос завершился ошибкой, отдельно анализируется каждая
+    расшифровка пакета.
+    Потоковый режим (`stream_call`) пакетные запросы не использует.
     """
 
-    def __init__(self):
+    MODEL = "google/gemini-flash-1.5"
+    TEMPERATURE = 0.4
+    MAX_TOKENS = 500
+    CHUNK_MAX_TOKENS = 300
+
+    def __init__(
+        self,
+        *,
+        backend: OpenAIBackend | FakeBackend | None = None,
+        preprocessor: TranscriptPreprocessor | None = None,
+        tonality_scorer: LexiconScorer | None = None,
+    ):
         """!
         @brief Конструктор класса `CallAnalyzer`.
         @details
-        Инициализирует асинхронный клиент `AsyncOpenAI`, но настраивает его для работы
-        с серверами OpenRouter. Это ключевое решение, позволяющее:
-        1.  Обойти гео-блокировки, с которыми можно столкнуться при прямом использовании OpenAI.
-        2.  Получить доступ к широкому спектру моделей от разных провайдеров (Google, Anthropic и др.).
+        Создает кэш результатов, если он включен в настройках, и считывает параметры
+        разбиения длинных расшифровок. Сетевой клиент бэкенда здесь не создается:
+        это делает `start()`, который вызывается из хука запуска диспетчера в `main.py`.
+        Экземпляр приложения создает `core.container.Container`.
+        @param backend [in] Бэкенд модели; `None` — по настройке `ANALYSIS_BACKEND`.
+        @param preprocessor [in] Цепочка очистки расшифровок; `None` — без очистки.
+        @param tonality_scorer [in] Словарный классификатор для упрощенного пути;
+               `None` — упрощенный путь не используется.
+        """
 
-        Клиент создается один раз при старте приложения, что обеспечивает эффективность.
+        self.backend = backend or create_backend()
+        self.model = settings.ANALYSIS_MODEL or self.MODEL
+        self.preprocessor = preprocessor
+        self.tonality_scorer = tonality_scorer
 
-        """
+        self.cache = (
+            AnalysisCache(
+                max_entries=settings.CACHE_MAX_ENTRIES,
+                ttl_seconds=settings.CACHE_TTL_SECONDS,
+                db_path=settings.CACHE_DB_PATH,
+            )
+            if settings.CACHE_ENABLED
+            else None
+        )
 
-        self.client = AsyncOpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=settings.OPENROUTER_API_KEY.get_secret_value(),
-            default_headers={
-                "HTTP-Referer": "https://github.com/crissyro/Call-rating-AI-bot",
-                "X-Title": "Call rating AI bot",
-            },
+        self.resilience = ResilientCaller(
+            [self.model, *settings.FALLBACK_MODELS],
+            max_attempts=settings.RETRY_MAX_ATTEMPTS,
+            base_delay=settings.RETRY_BASE_DELAY,
+            max_delay=settings.RETRY_MAX_DELAY,
+            failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=settings.BREAKER_RESET_SECONDS,
+            hedge_enabled=settings.HEDGE_ENABLED,
+            hedge_delay=settings.HEDGE_DELAY,
+            hedge_min_delay=settings.HEDGE_MIN_DELAY,
+        )
+
+        self.long_threshold = settings.LONG_TRANSCRIPT_THRESHOLD
+        self.chunk_tokens = settings.CHUNK_MAX_TOKENS
+        self.chunk_concurrency = settings.CHUNK_CONCURRENCY
+
+        self.batcher = (
+            MicroBatcher(
+                self._analyze_batch,
+                max_size=settings.MICROBATCH_MAX_SIZE,
+                max_wait=settings.MICROBATCH_MAX_WAIT,
+                max_weight=settings.MICROBATCH_MAX_TOKENS,
+                max_concurrency=settings.MICROBATCH_MAX_CONCURRENCY or math.inf,
+            )
+            if settings.MICROBATCH_ENABLED
+            else None
         )
-        logger.info("Async client for OpenRouter initialized successfully.")
 
-    async def analyze_call(self, transcript: str) -> str:
+    async def start(self) -> None:
+        """!
+        @brief Создает сетевые клиенты бэкенда модели.
+        @details См. `OpenAIBackend.start`: клиент создается один раз при старте
+                 приложения и закрывается в `close()`.
+        """
+
+        await self.backend.start()
+
+    async def warm_up(self) -> None:
+        """!
+        @brief Заранее устанавливает соединение с API модели.
+        @details Ошибки прогрева только логируются (см. `OpenAIBackend.warm_up`).
+        """
+
+        await self.backend.warm_up()
+
+    async def close(self) -> None:
         """!
-        @brief Анализирует расшифровку звонка и возвращает отформатированный результат.
+        @brief Дожидается пакетных запросов и закрывает бэкенд и дисковый уровень кэша.
+        @details Вызывается из хука остановки диспетчера в `main.py`.
+        """
+
+        if self.batcher is not None:
+            await self.batcher.close()
+        await self.backend.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    async def analyze_call(self, transcript: str) -> AnalysisResult:
+        """!
+        @brief Анализирует расшифровку звонка и возвращает структурированный результат.
         @details
         Это основной рабочий метод класса. Он выполняет следующие шаги:
-        1.  Формирует детальный системный промпт (`system_prompt`), который инструктирует
-            модель выдать ответ в строго заданном формате Markdown. Это критически
-            важно для получения предсказуемого и структурированного результата.
-        2.  Выполняет асинхронный API-запрос к модели `google/gemini-flash-1.5`, которая
-            является быстрым и мощным решением, доступным на OpenRouter.
-        3.  Обрабатывает успешный ответ, извлекая из него текст.
-        4.  Перехватывает любые исключения во время API-вызова (например, сетевые ошибки,
-            проблемы с ключом), логирует их и возвращает пользователю вежливое
-            сообщение об ошибке.
+        1.  Проверяет кэш результатов. При попадании ответ возвращается сразу,
+            без обращения к модели.
+        2.  Использует системный промпт `SYSTEM_PROMPT`, который инструктирует
+            модель выдать ответ в виде JSON-объекта, а также `RESPONSE_SCHEMA`
+            (в зависимости от `RESPONSE_FORMAT`). Это критически важно для получения
+            предсказуемого и структурированного результата.
+        3.  Выполняет асинхронный API-запрос к модели (по умолчанию
+            `google/gemini-flash-1.5`, быстрое и мощное решение, доступное на
+            OpenRouter). Для длинной расшифровки перед этим выполняется этап "map"
+            (см. `_prepare_messages`), а короткая может быть отправлена одним
+            пакетом с другими (см. `_analyze_batch`).
+        4.  Разбирает ответ в `AnalysisResult` (при необходимости — с ремонтом,
+            см. `_parse`) и сохраняет его в кэше.
+        5.  Перехватывает исключения, оставшиеся после повторов и переключения на
+            резервные модели (см. `ResilientCaller`), например ошибки ключа или
+            недоступность всех моделей, логирует их и возвращает неудачный результат
+            (`AnalysisResult.failed`). Неудачные результаты никогда не попадают в кэш.
+
+        Длина расшифровки, источник и время получения результата, а также ошибки
+        по типам учитываются в метриках (`core.metrics`).
 
         @param transcript [in] Текст расшифровки телефонного разговора для анализа.
-        @return Отформатированная строка с тональностью и рекомендациями, готовая
-                к отправке пользователю, либо сообщение об ошибке.
+        @return AnalysisResult: тональность и рекомендации либо описание ошибки.
+        """
+
+        started = time.perf_counter()
+        TRANSCRIPT_LENGTH.observe(len(transcript))
+
+        try:
+            transcript = await self._preprocess(transcript)
+            model = self._route(transcript)
+            cache_key = self._cache_key(transcript, model)
+            cached = await self._cached(cache_key)
+            if cached is not None:
+                _observe_analysis("cache", started)
+                return cached
+
+            outcome = await self._batched(transcript, model)
+            if outcome is None:
+                outcome = await self._analyze(transcript, model)
+            result, tokens = outcome
+
+        except Exception as e:
+            logger.error(
+                "An error occurred during %s API call: %s",
+                self.backend.name,
+                e,
+                exc_info=True,
+            )
+            ERRORS.labels("analysis", type(e).__name__).inc()
+            _observe_analysis("failed", started)
+            return AnalysisResult.failed(type(e).__name__)
+
+        await self._store(cache_key, result, time.perf_counter() - started, tokens)
+        _observe_analysis("model", started)
+        return result
+
+    def stream_call(self, transcript: str) -> "AnalysisStream":
+        """!
+        @brief Потоковый вариант `analyze_call`: выдает ответ модели по частям.
+        @details
+        Возвращает объект `AnalysisStream`, по которому можно итерироваться через
+        `async for`: он отдает фрагменты сырого JSON-ответа модели (`stream=True`)
+        по мере их поступления. Это позволяет показать пользователю начало анализа
+        через 1–2 секунды вместо ожидания полного ответа (см. `formatter.render_partial`).
+        После завершения итерации в `AnalysisStream.result` находится разобранный
+        `AnalysisResult`.
+
+        Если результат уже есть в кэше, поток не отдает ни одного фрагмента, а
+        результат сразу доступен. Для длинной расшифровки этап "map" выполняется
+        без потоковой выдачи, а потоково отдается только итоговый этап "reduce".
+        Полностью полученный ответ сохраняется в кэше так же, как в `analyze_call`.
+        Открытие потока повторяется и переключается на резервные модели так же,
+        как обычный запрос, но без хеджирования; обрыв уже начатого потока
+        не повторяется.
+        В отличие от `analyze_call`, ошибки API не перехватываются: вызывающий код
+        должен сам решить, переключиться ли на обычный (непотоковый) режим.
+
+        @param transcript [in] Текст расшифровки телефонного разговора для анализа.
+        @return AnalysisStream: асинхронный итератор фрагментов ответа модели.
+        """
+
+        stream = AnalysisStream()
+        stream.source = self._stream(transcript, stream)
+        return stream
+
+    async def _stream(
+        self, transcript: str, sink: "AnalysisStream"
+    ) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        TRANSCRIPT_LENGTH.observe(len(transcript))
+        transcript = await self._preprocess(transcript)
+
+        model = self._route(transcript)
+        cache_key = self._cache_key(transcript, model)
+        cached = await self._cached(cache_key)
+        if cached is not None:
+            sink.result = cached
+            _observe_analysis("cache", started)
+            return
+
+        first_token_at = None
+        parts = []
+
+        messages, map_tokens = await self._prepare_messages(transcript, model)
+        stream = await self.resilience.call(
+            lambda model: self.backend.stream(
+                model,
+                messages,
+                temperature=self.TEMPERATURE,
+                max_tokens=self.MAX_TOKENS,
+                response_format=self._response_format(),
+            ),
+            hedge=False,
+            preferred=model,
+        )
+        try:
+            async for delta in stream:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    logger.info(
+                        "First streamed token from %s after %.2fs",
+                        self.backend.name,
+                        first_token_at - started,
+                    )
+                parts.append(delta)
+                yield delta
+        finally:
+            await stream.aclose()
+
+        result_text = "".join(parts).strip()
+        logger.info(
+            "Successfully streamed analysis from %s. Result length: %d",
+            self.backend.name,
+            len(result_text),
+        )
+
+        sink.result, repair_tokens = await self._parse(messages, result_text, model)
+        await self._store(
+            cache_key,
+            sink.result,
+            time.perf_counter() - started,
+            map_tokens + repair_tokens,
+        )
+        _observe_analysis("stream", started)
+
+    async def _preprocess(self, transcript: str) -> str:
+        """!
+        @brief Очищает расшифровку перед анализом, если это включено в настройках.
+        @details См. `services.preprocessing`. Если после очистки не осталось текста,
+                 возвращается исходная расшифровка.
+        @param transcript [in] Исходный текст расшифровки.
+        @return Текст, который будет отправлен модели.
+        """
+
+        if self.preprocessor is None or not settings.PREPROCESS_ENABLED:
+            return transcript
+        cleaned, _ = await self.preprocessor.run(transcript)
+        return cleaned or transcript
+
+    def _route(self, transcript: str) -> str | None:
+        """!
+        @brief Выбирает модель для расшифровки по локальной оценке тональности.
+        @details Если упрощенный путь включен и словарный классификатор уверен
+                 в тональности не меньше `TONALITY_FAST_THRESHOLD`, возвращается
+                 `TONALITY_FAST_MODEL`. Нейтральные диалоги так не направляются
+                 никогда (см. `ToneEstimate`).
+        @param transcript [in] Текст расшифровки.
+        @return Имя модели для первой попытки или `None` для обычного порядка моделей.
         """
 
-        system_prompt = (
-            "Ты — опытный ИИ-аналитик колл-центра. Твоя задача — анализировать расшифровки "
-            "телефонных разговоров. Внимательно изучи предоставленный диалог. "
-            "Твой ответ должен быть четким, структурированным и на русском языке. "
-            "Предоставь ответ СТРОГО в следующем формате Markdown, без лишних вступлений и заключений:\n\n"
-            "**Тональность:** [здесь одно слово: Позитивная, Нейтральная или Негативная]\n\n"
-            "**Рекомендации:**\n"
-            "1. [здесь первая краткая и конкретная рекомендация по улучшению диалога]\n"
-            "2. [здесь вторая краткая и конкретная рекомендация]"
+        if self.tonality_scorer is None or not settings.TONALITY_FAST_PATH:
+            return None
+        estimate = self.tonality_scorer.score(transcript)
+        if estimate.confidence < settings.TONALITY_FAST_THRESHOLD:
+            return None
+        FAST_PATH.labels(estimate.tonality.name.lower()).inc()
+        return settings.TONALITY_FAST_MODEL
+
+    async def _analyze(
+        self, transcript: str, model: str | None = None
+    ) -> tuple[AnalysisResult, int]:
+        """!
+        @brief Анализирует одну расшифровку отдельным запросом к модели.
+        @param transcript [in] Очищенный текст расшифровки.
+        @param model [in] Модель для первой попытки запросов или `None`.
+        @return Кортеж из результата и числа токенов, потраченных на все запросы.
+        """
+
+        messages, map_tokens = await self._prepare_messages(transcript, model)
+        result_text, tokens = await self._complete(
+            messages, structured=True, model=model
         )
+        result, repair_tokens = await self._parse(messages, result_text, model)
+        logger.info(
+            "Successfully received analysis from %s. Result length: %d",
+            self.backend.name,
+            len(result_text),
+        )
+        return result, map_tokens + tokens + repair_tokens
+
+    async def _batched(
+        self, transcript: str, model: str | None = None
+    ) -> tuple[AnalysisResult, int] | None:
+        """!
+        @brief Отправляет короткую расшифровку в пакетный запрос, если он включен.
+        @param transcript [in] Очищенный текст расшифровки.
+        @param model [in] Модель для первой попытки запросов или `None`.
+        @return Результат и доля токенов пакета или `None`, если расшифровку
+                нужно проанализировать отдельно.
+        """
+
+        if self.batcher is None:
+            return None
+        tokens = estimate_tokens(transcript)
+        if tokens > settings.MICROBATCH_MAX_ITEM_TOKENS:
+            return None
+        outcome = await self.batcher.submit(model, transcript, tokens)
+        if outcome is None:
+            MICROBATCH_FALLBACKS.inc()
+        return outcome
+
+    async def _analyze_batch(
+        self, model: Hashable, transcripts: list[str]
+    ) -> list[tuple[AnalysisResult, int] | None]:
+        """!
+        @brief Анализирует несколько расшифровок одним запросом к модели.
+        @details Функция `flush` для `MicroBatcher`. Расшифровки передаются
+                 модели JSON-массивом с номерами (`BATCH_PROMPT`), а ответ
+                 разбирается `parse_batch_output`. Пакет из одной расшифровки
+                 анализируется обычным запросом. Токены пакета делятся между
+                 расшифровками поровну.
+        @param model [in] Модель для первой попытки запроса или `None`.
+        @param transcripts [in] Очищенные тексты расшифровок.
+        @return Результат и доля токенов для каждой расшифровки; `None` — результата
+                для расшифровки в ответе нет, и ее нужно проанализировать отдельно.
+        """
 
+        if len(transcripts) == 1:
+            return [await self._analyze(transcripts[0], model)]
+
+        payload = json.dumps(
+            [
+                {"id": index, "transcript": transcript}
+                for index, transcript in enumerate(transcripts, start=1)
+            ],
+            ensure_ascii=False,
+        )
+        result_text, tokens = await self._complete(
+            [
+                {"role": "system", "content": BATCH_PROMPT},
+                {"role": "user", "content": payload},
+            ],
+            max_tokens=self.MAX_TOKENS * len(transcripts),
+            structured=True,
+            model=model,
+            schema=BATCH_RESPONSE_SCHEMA,
+        )
         try:
-            response = await self.client.chat.completions.create(
-                model="google/gemini-flash-1.5",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": transcript},
-                ],
-                temperature=0.4,
-                max_tokens=500,
-                timeout=40.0,
+            results = parse_batch_output(result_text)
+        except MalformedOutputError:
+            logger.warning(
+                "Malformed batch output for %d transcripts", len(transcripts)
             )
+            results = {}
+
+        logger.info(
+            "Received batch analysis from %s: %d of %d transcripts",
+            self.backend.name,
+            len(results),
+            len(transcripts),
+        )
+        share = tokens // len(transcripts)
+        return [
+            (results[index], share) if index in results else None
+            for index in range(1, len(transcripts) + 1)
+        ]
+
+    async def _prepare_messages(
+        self, transcript: str, model: str | None = None
+    ) -> tuple[list[dict], int]:
+        """!
+        @brief Формирует сообщения для итогового запроса к модели.
+        @details Короткая расшифровка передается модели как есть. Длинная делится
+                 на фрагменты, каждый фрагмент анализируется отдельным запросом
+                 (этап "map"), а итоговым запросом становится сводка частичных
+                 анализов (этап "reduce").
+        @param transcript [in] Текст расшифровки.
+        @param model [in] Модель для первой попытки запросов или `None`.
+        @return Кортеж из списка сообщений и числа токенов, потраченных на этап "map".
+        """
+
+        if estimate_tokens(transcript) <= self.long_threshold:
+            return self._messages(transcript), 0
+
+        chunks = split_transcript(transcript, self.chunk_tokens)
+        semaphore = asyncio.Semaphore(self.chunk_concurrency)
+        logger.info("Long transcript split into %d chunks for map-reduce", len(chunks))
+
+        async def analyze_chunk(index: int, chunk: str) -> tuple[str, int]:
+            async with semaphore:
+                return await self._complete(
+                    [
+                        {
+                            "role": "system",
+                            "content": CHUNK_PROMPT.format(
+                                index=index, total=len(chunks)
+                            ),
+                        },
+                        {"role": "user", "content": chunk},
+                    ],
+                    max_tokens=self.CHUNK_MAX_TOKENS,
+                    model=model,
+                )
+
+        async with asyncio.TaskGroup() as group:
+            tasks = [
+                group.create_task(analyze_chunk(index, chunk))
+                for index, chunk in enumerate(chunks, start=1)
+            ]
+
+        partials = [task.result() for task in tasks]
+        summary = REDUCE_PREFACE + "\n\n".join(
+            f"Фрагмент {index}:\n{text}"
+            for index, (text, _) in enumerate(partials, start=1)
+        )
+        return self._messages(summary), sum(tokens for _, tokens in partials)
+
+    async def _complete(
+        self,
+        messages: list[dict],
+        max_tokens: int | None = None,
+        structured: bool = False,
+        model: str | None = None,
+        schema: dict = RESPONSE_SCHEMA,
+    ) -> tuple[str, int]:
+        completion = await self.resilience.call(
+            lambda model: self.backend.complete(
+                model,
+                messages,
+                temperature=self.TEMPERATURE,
+                max_tokens=max_tokens or self.MAX_TOKENS,
+                response_format=self._response_format(schema) if structured else None,
+            ),
+            preferred=model,
+        )
+        if completion.total_tokens:
+            TOKENS.labels("prompt").inc(completion.prompt_tokens)
+            TOKENS.labels("completion").inc(completion.completion_tokens)
+        return completion.text, completion.total_tokens
+
+    async def _parse(
+        self, messages: list[dict], text: str, model: str | None = None
+    ) -> tuple[AnalysisResult, int]:
+        """!
+        @brief Разбирает ответ модели, при необходимости запрашивая исправление.
+        @details Сначала выполняется локальный разбор с дешевым ремонтом
+                 (`AnalysisResult.from_model_output`). Если он не удался, модели
+                 один раз отправляется исходный диалог, ее ответ и просьба
+                 вернуть корректный JSON.
+        @param messages [in] Сообщения исходного запроса.
+        @param text [in] Ответ модели.
+        @param model [in] Модель для первой попытки исправления или `None`.
+        @return Кортеж из результата и числа токенов, потраченных на исправление.
+        @throw MalformedOutputError Если и исправленный ответ не удалось разобрать.
+        """
+
+        try:
+            return AnalysisResult.from_model_output(text), 0
+        except MalformedOutputError:
+            logger.warning("Malformed analysis output, asking the model to repair it")
+
+        repaired, tokens = await self._complete(
+            messages
+            + [
+                {"role": "assistant", "content": text},
+                {"role": "user", "content": REPAIR_PROMPT},
+            ],
+            structured=True,
+            model=model,
+        )
+        return AnalysisResult.from_model_output(repaired), tokens
 
-            result_text = response.choices[0].message.content.strip()
-            logger.info(
-                f"Successfully received analysis from OpenRouter. Result length: {len(result_text)}"
+    @staticmethod
+    def _response_format(schema: dict = RESPONSE_SCHEMA) -> dict | None:
+        if settings.RESPONSE_FORMAT == "json_schema":
+            return {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": (
+                        "call_analysis"
+                        if schema is RESPONSE_SCHEMA
+                        else "call_analysis_batch"
+                    ),
+                    "strict": True,
+                    "schema": schema,
+                },
+            }
+        if settings.RESPONSE_FORMAT == "json_object":
+            return {"type": "json_object"}
+        return None
+
+    async def _store(
+        self,
+        cache_key: str | None,
+        result: AnalysisResult,
+        cost_seconds: float,
+        tokens: int,
+    ) -> None:
+        if cache_key is not None and result.ok:
+            await self.cache.set(
+                cache_key, result.to_json(), cost_seconds=cost_seconds, tokens=tokens
             )
 
-            return result_text
+    def _cache_key(self, transcript: str, model: str | None = None) -> str | None:
+        if self.cache is None:
+            return None
+        return AnalysisCache.make_key(
+            transcript,
+            model=model or self.model,
+            system_prompt=SYSTEM_PROMPT,
+            temperature=self.TEMPERATURE,
+            max_tokens=self.MAX_TOKENS,
+        )
 
+    async def _cached(self, cache_key: str | None) -> AnalysisResult | None:
+        if cache_key is None:
+            return None
+        try:
+            cached = await self.cache.get(cache_key)
         except Exception as e:
-            logger.error(
-                f"An error occurred during OpenRouter API call: {e}", exc_info=True
-            )
-            return (
-                "⚠️ **Ошибка анализа**\n\n"
-                "Не удалось связаться с аналитическим сервисом. Пожалуйста, попробуйте снова."
-            )
+            # Сбой кэша не должен лишать пользователя анализа: идем к модели.
+            logger.warning("Analysis cache lookup failed: %s", e)
+            ERRORS.labels("cache", type(e).__name__).inc()
+            return None
+        if cached is None:
+            return None
+        logger.info(
+            "Analysis served from cache. Hit ratio: %.2f", self.cache.stats.hit_ratio
+        )
+        return AnalysisResult.from_json(cached)
 
+    @staticmethod
+    def _messages(transcript: str) -> list[dict]:
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": transcript},
+        ]
 
-##
-# @var analyzer
-# @brief Единый экземпляр (синглтон) класса `CallAnalyzer`.
-# @details Этот объект создается один раз при импорте модуля. Все остальные части
-#          приложения (например, хендлеры в `analysis.py`) должны импортировать
-#          и использовать этот готовый экземпляр. Это обеспечивает эффективность
-#          (клиент API и его TCP-соединение создаются только один раз) и предоставляет
-#          единую точку доступа к сервису анализа.
-analyzer = CallAnalyzer()
+
+def _observe_analysis(source: str, started: float) -> None:
+    ANALYSES.labels(source).inc()
+    ANALYSIS_DURATION.labels(source).observe(time.perf_counter() - started)
+
+
+class AnalysisStream:
+    """!
+    @class AnalysisStream
+    @brief Потоковый ответ модели, возвращаемый `CallAnalyzer.stream_call`.
+    @details Итерация отдает фрагменты сырого ответа модели. После ее завершения
+             поле `result` содержит разобранный `AnalysisResult`.
+    """
+
+    def __init__(self):
+        self.source: AsyncIterator[str] | None = None
+        self.result: AnalysisResult | None = None
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self.source
@@ -0,0 +1,405 @@
+##
+# @file backends.py
+# @author Roman Moroz
+# @brief Сменные бэкенды моделей для `CallAnalyzer`.
+# @details `CallAnalyzer` формирует промпты, разбирает ответы и повторяет запросы,
+#          но сам запрос к модели выполняет бэкенд. Этот модуль содержит две
+#          реализации с одинаковым интерфейсом (`start`, `warm_up`, `close`,
+#          `complete`, `stream`):
+#          - `OpenAIBackend` — любой OpenAI-совместимый Chat Completions API:
+#            OpenRouter (по умолчанию) или локальный сервер (vLLM, llama.cpp,
+#            Ollama и т.п.);
+#          - `FakeBackend` — детерминированная модель без сети для тестов
+#            и бенчмарков: тональность определяется словарным классификатором,
+#            а задержка задается моделью "фиксированная часть + входные токены +
+#            выходные токены".
+#
+#          Бэкенд выбирается настройкой `ANALYSIS_BACKEND` (см. `create_backend`).
+
+import asyncio
+import json
+import logging
+import time
+
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+from config.config import settings
+from services.chunking import estimate_tokens
+from services.transport import build_http_client, build_timeout
+
+logger = logging.getLogger("call_assessment_bot")
+
+##
+# @var OPENROUTER_HEADERS
+# @brief Заголовки, по которым OpenRouter показывает приложение в своей статистике.
+OPENROUTER_HEADERS = {
+    "HTTP-Referer": "https://github.com/crissyro/Call-rating-AI-bot",
+    "X-Title": "Call rating AI bot",
+}
+
+##
+# @var FAKE_RECOMMENDATIONS
+# @brief Рекомендации, которые возвращает `FakeBackend`.
+FAKE_RECOMMENDATIONS = (
+    "Оператору стоит назвать свое имя в начале разговора.",
+    "В конце разговора стоит уточнить, остались ли у клиента вопросы.",
+)
+
+
+@dataclass(frozen=True, slots=True)
+class Completion:
+    """!
+    @class Completion
+    @brief Ответ модели на один запрос.
+    """
+
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        """!
+        @brief Всего токенов, израсходованных запросом.
+        """
+
+        return self.prompt_tokens + self.completion_tokens
+
+
+class OpenAIBackend:
+    """!
+    @class OpenAIBackend
+    @brief Бэкенд для OpenAI-совместимого Chat Completions API.
+    @details
+    Использует асинхронный клиент `AsyncOpenAI` поверх `httpx.AsyncClient`
+    из `build_http_client()` с HTTP/2 и пулом keep-alive соединений. Клиент
+    создается в `start()` и закрывается в `close()`. Встроенные повторы клиента
+    отключены: их выполняет `ResilientCaller` в `CallAnalyzer`.
+
+    Через OpenRouter доступен широкий спектр моделей от разных провайдеров
+    (Google, Anthropic и др.) без гео-блокировок, поэтому он используется по
+    умолчанию. Локальный сервер подключается тем же классом с другим `base_url`.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        *,
+        name: str = "openai",
+        headers: dict | None = None,
+    ):
+        """!
+        @brief Конструктор бэкенда. Сетевой клиент здесь не создается.
+        @param base_url [in] Базовый адрес API, например `http://localhost:8000/v1`.
+        @param api_key [in] Ключ API; локальные серверы обычно принимают любой.
+        @param name [in] Имя бэкенда для логов.
+        @param headers [in] Дополнительные заголовки каждого запроса.
+        """
+
+        self.base_url = base_url
+        self.name = name
+        self.client = None
+        self._api_key = api_key
+        self._headers = headers or {}
+        self._http_client = None
+
+    async def start(self) -> None:
+        """!
+        @brief Создает сетевые клиенты.
+        """
+
+        if self.client is not None:
+            return
+
+        from openai import AsyncOpenAI
+
+        self._http_client = build_http_client()
+        self.client = AsyncOpenAI(
+            base_url=self.base_url,
+            api_key=self._api_key,
+            default_headers=self._headers,
+            http_client=self._http_client,
+            timeout=build_timeout(),
+            max_retries=0,
+        )
+        logger.info("Async client for %s initialized successfully.", self.name)
+
+    async def warm_up(self) -> None:
+        """!
+        @brief Заранее устанавливает соединение с API.
+        @details Отправляет легкий HEAD-запрос к базовому URL API. Код ответа не важен:
+                 цель запроса — выполнить DNS-разрешение, TCP- и TLS-рукопожатие и
+                 оставить готовое соединение в пуле. Ошибки прогрева только логируются.
+        """
+
+        started = time.perf_counter()
+        try:
+            response = await self._http_client.head(self.base_url)
+        except Exception as e:
+            logger.warning("%s warm-up request failed: %s", self.name, e)
+            return
+
+        logger.info(
+            "%s connection warmed up in %.2fs (%s)",
+            self.name,
+            time.perf_counter() - started,
+            response.http_version,
+        )
+
+    async def close(self) -> None:
+        """!
+        @brief Закрывает сетевые клиенты.
+        """
+
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+            self._http_client = None
+            logger.info("Async client for %s closed.", self.name)
+
+    async def complete(
+        self,
+        model: str,
+        messages: list[dict],
+        *,
+        temperature: float,
+        max_tokens: int,
+        response_format: dict | None = None,
+    ) -> Completion:
+        """!
+        @brief Выполняет один запрос к модели.
+        @param model [in] Имя модели.
+        @param messages [in] Сообщения в формате Chat Completions.
+        @param temperature [in] Температура генерации.
+        @param max_tokens [in] Ограничение длины ответа.
+        @param response_format [in] Параметр `response_format` или `None`.
+        @return Completion: текст ответа и израсходованные токены.
+        """
+
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **({"response_format": response_format} if response_format else {}),
+        )
+        usage = getattr(response, "usage", None)
+        return Completion(
+            response.choices[0].message.content.strip(),
+            usage.prompt_tokens if usage else 0,
+            usage.completion_tokens if usage else 0,
+        )
+
+    async def stream(
+        self,
+        model: str,
+        messages: list[dict],
+        *,
+        temperature: float,
+        max_tokens: int,
+        response_format: dict | None = None,
+    ) -> "CompletionStream":
+        """!
+        @brief Открывает потоковый ответ модели (`stream=True`).
+        @details Параметры совпадают с `complete`. Открытие потока можно повторять
+                 как обычный запрос; после открытия поток нужно закрыть через
+                 `aclose()`.
+        @return CompletionStream: асинхронный итератор фрагментов текста ответа.
+        """
+
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            **({"response_format": response_format} if response_format else {}),
+        )
+        return CompletionStream(_openai_deltas(response), response.close)
+
+
+async def _openai_deltas(response) -> AsyncIterator[str]:
+    async for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+class CompletionStream:
+    """!
+    @class CompletionStream
+    @brief Потоковый ответ модели: фрагменты текста и функция закрытия соединения.
+    """
+
+    def __init__(self, deltas: AsyncIterator[str], close=None):
+        self._deltas = deltas
+        self._close = close
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._deltas
+
+    async def aclose(self) -> None:
+        """!
+        @brief Прерывает поток и освобождает соединение.
+        """
+
+        await self._deltas.aclose()
+        if self._close is not None:
+            await self._close()
+
+
+class FakeBackend:
+    """!
+    @class FakeBackend
+    @brief Детерминированная модель без сети для тестов и бенчмарков.
+    @details
+    На запрос со структурированным ответом возвращает JSON формата `SYSTEM_PROMPT`:
+    тональность по встроенному словарю `LexiconScorer` и две постоянные
+    рекомендации. Если сообщение пользователя — JSON-массив объектов с `id`
+    (пакетный запрос `services.microbatch`), ответ содержит результат для каждого
+    элемента. На запрос без структурированного ответа (этап "map") возвращается
+    короткое текстовое описание фрагмента.
+
+    Задержка запроса равна `latency + prompt_tokens / prefill_rate +
+    completion_tokens / decode_rate`; нулевая скорость исключает слагаемое.
+    Счетчики `requests`, `prompt_tokens` и `completion_tokens` накапливаются
+    за все время работы.
+    """
+
+    def __init__(
+        self,
+        *,
+        latency: float = 0.0,
+        prefill_rate: float = 0.0,
+        decode_rate: float = 0.0,
+    ):
+        """!
+        @brief Конструктор бэкенда.
+        @param latency [in] Фиксированная часть задержки запроса, в секундах.
+        @param prefill_rate [in] Скорость обработки входных токенов, токенов в секунду.
+        @param decode_rate [in] Скорость генерации выходных токенов, токенов в секунду.
+        """
+
+        from services.tonality import LexiconScorer
+
+        self.name = "fake"
+        self.latency = latency
+        self.prefill_rate = prefill_rate
+        self.decode_rate = decode_rate
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._scorer = LexiconScorer.from_file(None)
+
+    async def start(self) -> None:
+        pass
+
+    async def warm_up(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def complete(
+        self,
+        model: str,
+        messages: list[dict],
+        *,
+        temperature: float,
+        max_tokens: int,
+        response_format: dict | None = None,
+    ) -> Completion:
+        """!
+        @brief Возвращает детерминированный ответ после смоделированной задержки.
+        """
+
+        text = self._answer(messages[-1]["content"], response_format is not None)
+        prompt = sum(estimate_tokens(message["content"]) for message in messages)
+        completion = min(estimate_tokens(text), max_tokens)
+        self.requests += 1
+        self.prompt_tokens += prompt
+        self.completion_tokens += completion
+
+        delay = self.latency
+        if self.prefill_rate:
+            delay += prompt / self.prefill_rate
+        if self.decode_rate:
+            delay += completion / self.decode_rate
+        if delay:
+            await asyncio.sleep(delay)
+        return Completion(text, prompt, completion)
+
+    async def stream(self, model: str, messages: list[dict], **options):
+        """!
+        @brief Потоковый вариант `complete`: ответ отдается одним фрагментом.
+        """
+
+        completion = await self.complete(model, messages, **options)
+
+        async def deltas() -> AsyncIterator[str]:
+            yield completion.text
+
+        return CompletionStream(deltas())
+
+    def _answer(self, content: str, structured: bool) -> str:
+        if not structured:
+            tonality = self._scorer.score(content).tonality.value
+            return f"Тональность фрагмента: {tonality}."
+
+        items = _batch_items(content)
+        if items is None:
+            return json.dumps(self._result(content), ensure_ascii=False)
+        results = [
+            {"id": item["id"], **self._result(str(item.get("transcript", "")))}
+            for item in items
+        ]
+        return json.dumps({"results": results}, ensure_ascii=False)
+
+    def _result(self, transcript: str) -> dict:
+        return {
+            "tonality": self._scorer.score(transcript).tonality.value,
+            "recommendations": list(FAKE_RECOMMENDATIONS),
+        }
+
+
+def _batch_items(content: str) -> list[dict] | None:
+    if not content.startswith("["):
+        return None
+    try:
+        items = json.loads(content)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(items, list) or not all(
+        isinstance(item, dict) and "id" in item for item in items
+    ):
+        return None
+    return items
+
+
+def create_backend() -> OpenAIBackend | FakeBackend:
+    """!
+    @brief Создает бэкенд модели по настройке `ANALYSIS_BACKEND`.
+    @details
+    - `openrouter` — OpenRouter по адресу `OPENROUTER_BASE_URL` с ключом
+      `OPENROUTER_API_KEY`;
+    - `openai` — OpenAI-совместимый сервер по адресу `OPENAI_BASE_URL` с ключом
+      `OPENAI_API_KEY`;
+    - `fake` — `FakeBackend` с задержкой `FAKE_BACKEND_LATENCY`.
+    """
+
+    if settings.ANALYSIS_BACKEND == "fake":
+        return FakeBackend(latency=settings.FAKE_BACKEND_LATENCY)
+    if settings.ANALYSIS_BACKEND == "openai":
+        api_key = settings.OPENAI_API_KEY
+        return OpenAIBackend(
+            settings.OPENAI_BASE_URL,
+            api_key.get_secret_value() if api_key else "not-needed",
+            name="OpenAI-compatible server",
+        )
+    return OpenAIBackend(
+        settings.OPENROUTER_BASE_URL,
+        settings.OPENROUTER_API_KEY.get_secret_value(),
+        name="OpenRouter",
+        headers=OPENROUTER_HEADERS,
+    )
@@ -0,0 +1,315 @@
+##
+# @file batch.py
+# @author Roman Moroz
+# @brief Пакетный анализ расшифровок из загруженных документов.
+# @details Этот модуль умеет потоково читать файлы `.txt`, `.jsonl`, `.csv` и `.zip`
+#          с множеством расшифровок, анализировать их с ограниченным параллелизмом
+#          и записывать результаты в один CSV- или JSONL-файл. Файлы читаются
+#          построчно, поэтому в памяти одновременно находятся только те расшифровки,
+#          которые анализируются прямо сейчас. Размер распакованных файлов архива
+#          ограничен, чтобы "zip-бомба" не исчерпала память.
+
+import asyncio
+import csv
+import io
+import json
+import zipfile
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Iterator, TextIO
+
+from services.models import AnalysisResult
+
+##
+# @var SUPPORTED_EXTENSIONS
+# @brief Расширения файлов, которые принимаются для пакетного анализа.
+SUPPORTED_EXTENSIONS = (".txt", ".jsonl", ".csv", ".zip")
+
+##
+# @var TXT_SEPARATOR
+# @brief Строка-разделитель расшифровок в текстовом файле.
+TXT_SEPARATOR = "---"
+
+_TRANSCRIPT_FIELDS = ("transcript", "text", "dialog")
+
+
+@dataclass
+class BatchItem:
+    """!
+    @class BatchItem
+    @brief Одна расшифровка из загруженного файла.
+    @details Если запись не удалось разобрать, `transcript` пуст, а в `error`
+             записана причина, чтобы ошибка попала в итоговый отчет.
+    """
+
+    call_id: str
+    transcript: str
+    error: str | None = None
+
+
+@dataclass
+class BatchResult:
+    """!
+    @class BatchResult
+    @brief Результат анализа одной расшифровки в пакетном режиме.
+    """
+
+    call_id: str
+    tonality: str = ""
+    recommendations: tuple[str, ...] = ()
+    error: str | None = None
+
+
+def iter_transcripts(
+    path: Path,
+    filename: str,
+    *,
+    max_member_size: int,
+    max_unpacked_size: int,
+) -> Iterator[BatchItem]:
+    """!
+    @brief Потоково извлекает расшифровки из файла.
+    @details
+    Формат определяется по расширению исходного имени файла:
+    - <b>.txt</b> — расшифровки разделены строкой `---`;
+    - <b>.jsonl</b> — по одному JSON-объекту на строку с полем `transcript`
+      (или `text`) и необязательным полем `id`;
+    - <b>.csv</b> — таблица с заголовком и колонкой `transcript` (или `text`);
+    - <b>.zip</b> — архив, каждый `.txt` внутри которого считается одной
+      расшифровкой, а `.jsonl` и `.csv` разбираются по правилам выше.
+
+    Разбор синхронный и читает файл с диска, поэтому из асинхронного кода
+    итератор нужно продвигать в отдельном потоке (так делает `run_batch`).
+    @param path [in] Путь к скачанному файлу.
+    @param filename [in] Исходное имя файла, отправленного пользователем.
+    @param max_member_size [in] Наибольший распакованный размер файла в архиве;
+           файл больше попадает в отчет как ошибка.
+    @param max_unpacked_size [in] Наибольший суммарный распакованный размер архива.
+    @return Итератор объектов `BatchItem`.
+    @throw ValueError Если расширение файла не поддерживается или архив
+           распаковывается в слишком большой объем.
+    """
+
+    extension = Path(filename).suffix.lower()
+
+    if extension == ".zip":
+        yield from _iter_zip(path, max_member_size, max_unpacked_size)
+        return
+
+    with open(path, encoding="utf-8-sig", errors="replace", newline="") as stream:
+        yield from _iter_stream(stream, extension, Path(filename).stem)
+
+
+def _iter_stream(stream: TextIO, extension: str, prefix: str) -> Iterator[BatchItem]:
+    if extension == ".txt":
+        yield from _iter_txt(stream, prefix)
+    elif extension == ".jsonl":
+        yield from _iter_jsonl(stream, prefix)
+    elif extension == ".csv":
+        yield from _iter_csv(stream, prefix)
+    else:
+        raise ValueError(f"Unsupported batch file type: {extension}")
+
+
+def _iter_txt(stream: TextIO, prefix: str) -> Iterator[BatchItem]:
+    lines: list[str] = []
+    index = 0
+    for line in stream:
+        if line.strip() == TXT_SEPARATOR:
+            if any(part.strip() for part in lines):
+                index += 1
+                yield BatchItem(f"{prefix}-{index}", "".join(lines).strip())
+            lines = []
+        else:
+            lines.append(line)
+
+    if any(part.strip() for part in lines):
+        yield BatchItem(f"{prefix}-{index + 1}", "".join(lines).strip())
+
+
+def _iter_jsonl(stream: TextIO, prefix: str) -> Iterator[BatchItem]:
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield BatchItem(f"{prefix}-{line_number}", "", f"invalid JSON: {e.msg}")
+            continue
+        if not isinstance(record, dict):
+            yield BatchItem(f"{prefix}-{line_number}", "", "record is not an object")
+            continue
+        yield _item_from_record(record, f"{prefix}-{line_number}")
+
+
+def _iter_csv(stream: TextIO, prefix: str) -> Iterator[BatchItem]:
+    for row_number, row in enumerate(csv.DictReader(stream), start=1):
+        yield _item_from_record(row, f"{prefix}-{row_number}")
+
+
+def _item_from_record(record: dict, default_id: str) -> BatchItem:
+    call_id = str(record.get("id") or default_id)
+    for field in _TRANSCRIPT_FIELDS:
+        value = record.get(field)
+        if isinstance(value, str) and value.strip():
+            return BatchItem(call_id, value.strip())
+    return BatchItem(call_id, "", "no transcript field")
+
+
+def _iter_zip(
+    path: Path, max_member_size: int, max_unpacked_size: int
+) -> Iterator[BatchItem]:
+    with zipfile.ZipFile(path) as archive:
+        members = [
+            member
+            for member in archive.infolist()
+            if not member.is_dir()
+            and Path(member.filename).suffix.lower() in (".txt", ".jsonl", ".csv")
+        ]
+        # `ZipExtFile` не отдает больше `file_size` байт, поэтому заявленные
+        # в архиве размеры ограничивают и фактический объем распаковки.
+        unpacked = sum(
+            member.file_size
+            for member in members
+            if member.file_size <= max_member_size
+        )
+        if unpacked > max_unpacked_size:
+            raise ValueError(
+                f"archive unpacks to more than {max_unpacked_size // (1024 * 1024)} MB"
+            )
+
+        for member in members:
+            name = Path(member.filename)
+            extension = name.suffix.lower()
+            if member.file_size > max_member_size:
+                yield BatchItem(
+                    str(name.with_suffix("")),
+                    "",
+                    f"file is larger than {max_member_size // (1024 * 1024)} MB",
+                )
+                continue
+
+            with archive.open(member) as raw:
+                stream = io.TextIOWrapper(
+                    raw, encoding="utf-8-sig", errors="replace", newline=""
+                )
+                if extension == ".txt":
+                    yield BatchItem(str(name.with_suffix("")), stream.read().strip())
+                else:
+                    yield from _iter_stream(stream, extension, name.stem)
+
+
+async def run_batch(
+    items: Iterator[BatchItem],
+    analyze: Callable[[str], Awaitable[AnalysisResult]],
+    concurrency: int,
+) -> AsyncIterator[BatchResult]:
+    """!
+    @brief Анализирует расшифровки с ограниченным параллелизмом.
+    @details Из итератора одновременно извлекается не больше `concurrency`
+             расшифровок: следующая читается из файла только после завершения одной
+             из текущих задач. Результаты отдаются в порядке завершения.
+             Итератор продвигается в отдельном потоке, чтобы разбор файла
+             не блокировал цикл событий.
+    @param items [in] Итератор расшифровок, например из `iter_transcripts`.
+    @param analyze [in] Асинхронная функция анализа одной расшифровки.
+    @param concurrency [in] Максимальное число одновременно анализируемых расшифровок.
+    @return Асинхронный итератор результатов.
+    """
+
+    async def process(item: BatchItem) -> BatchResult:
+        if item.error:
+            return BatchResult(item.call_id, error=item.error)
+        if len(item.transcript.split()) < 10:
+            return BatchResult(item.call_id, error="transcript is too short")
+        try:
+            result = await analyze(item.transcript)
+        except Exception as e:
+            return BatchResult(item.call_id, error=str(e) or type(e).__name__)
+
+        if not result.ok:
+            return BatchResult(item.call_id, error=f"analysis failed: {result.error}")
+        return BatchResult(item.call_id, result.tonality.value, result.recommendations)
+
+    pending: set[asyncio.Task] = set()
+    exhausted = False
+
+    try:
+        while pending or not exhausted:
+            while not exhausted and len(pending) < concurrency:
+                item = await asyncio.to_thread(next, items, None)
+                if item is None:
+                    exhausted = True
+                    break
+                pending.add(asyncio.create_task(process(item)))
+
+            if not pending:
+                break
+
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class ResultWriter:
+    """!
+    @class ResultWriter
+    @brief Построчно записывает результаты пакетного анализа в CSV или JSONL.
+    """
+
+    def __init__(self, path: Path, fmt: str):
+        """!
+        @brief Конструктор. Открывает файл результатов на запись.
+        @param path [in] Путь к файлу результатов.
+        @param fmt [in] Формат: `csv` или `jsonl`.
+        """
+
+        self.path = path
+        self.fmt = fmt
+        self.written = 0
+        self.errors = 0
+        self._stream = open(path, "w", encoding="utf-8", newline="")
+        self._csv = None
+        if fmt == "csv":
+            self._csv = csv.writer(self._stream)
+            self._csv.writerow(["id", "tonality", "recommendations", "error"])
+
+    def write(self, result: BatchResult) -> None:
+        """!
+        @brief Записывает один результат.
+        """
+
+        self.written += 1
+        if result.error:
+            self.errors += 1
+
+        if self._csv is not None:
+            self._csv.writerow(
+                [
+                    result.call_id,
+                    result.tonality,
+                    " | ".join(result.recommendations),
+                    result.error or "",
+                ]
+            )
+        else:
+            record = {
+                "id": result.call_id,
+                "tonality": result.tonality,
+                "recommendations": list(result.recommendations),
+                "error": result.error,
+            }
+            self._stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        """!
+        @brief Закрывает файл результатов.
+        """
+
+        self._stream.close()
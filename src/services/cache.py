@@ -0,0 +1,254 @@
+##
+# @file cache.py
+# @author Roman Moroz
+# @brief Кэш результатов анализа звонков.
+# @details Этот модуль содержит класс `AnalysisCache`, который избавляет бота от
+#          повторных обращений к модели для одной и той же расшифровки. Кэш состоит
+#          из двух уровней: быстрого LRU-кэша в памяти с ограниченным временем жизни
+#          записей и необязательного дискового уровня на SQLite, который переживает
+#          перезапуски приложения.
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+logger = logging.getLogger("call_assessment_bot")
+
+##
+# @var CACHE_KEY_VERSION
+# @brief Версия схемы ключа кэша.
+# @details Увеличивается при изменении способа нормализации или формата хранимых
+#          значений, чтобы старые записи на диске перестали совпадать с новыми ключами.
+CACHE_KEY_VERSION = 2
+
+
+@dataclass
+class CacheStats:
+    """!
+    @class CacheStats
+    @brief Счетчики эффективности кэша.
+    @details Помимо попаданий и промахов, накапливает оценку сэкономленного времени
+             и токенов: при каждом попадании к ним прибавляется стоимость исходного
+             запроса к модели, сохраненная вместе с записью. Счетчики экспортируются
+             в метрики `bot_cache_*` (см. `core.container.Container.analyzer`).
+    """
+
+    hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    saved_seconds: float = 0.0
+    saved_tokens: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        """!
+        @brief Доля запросов к кэшу, завершившихся попаданием.
+        @return Число от 0 до 1.
+        """
+
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+@dataclass
+class _Entry:
+    value: str
+    expires_at: float
+    cost_seconds: float
+    tokens: int
+
+
+class AnalysisCache:
+    """!
+    @class AnalysisCache
+    @brief Двухуровневый кэш результатов анализа с вытеснением по LRU и TTL.
+    @details
+    Ключ записи — хэш нормализованной расшифровки вместе со всеми параметрами,
+    влияющими на ответ модели (модель, системный промпт, температура, лимит токенов).
+    Поэтому смена промпта или модели автоматически делает старые записи недоступными.
+
+    Уровень в памяти реализован на `OrderedDict`: обращение к записи переносит ее
+    в конец, а при переполнении вытесняется самая давно использованная запись.
+    Дисковый уровень хранится в SQLite; все операции с ним выполняются в отдельном
+    потоке через `asyncio.to_thread`, чтобы не блокировать цикл событий.
+    """
+
+    def __init__(
+        self, max_entries: int, ttl_seconds: float, db_path: str | None = None
+    ):
+        """!
+        @brief Конструктор кэша.
+        @param max_entries [in] Максимальное число записей в памяти.
+        @param ttl_seconds [in] Время жизни записи в секундах.
+        @param db_path [in] Путь к файлу SQLite для дискового уровня или `None`.
+        """
+
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stats = CacheStats()
+
+        self._memory: OrderedDict[str, _Entry] = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+
+        if db_path:
+            self._db = self._open_db(Path(db_path))
+
+    @staticmethod
+    def _open_db(path: Path) -> sqlite3.Connection:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " cost_seconds REAL NOT NULL,"
+            " tokens INTEGER NOT NULL)"
+        )
+        db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_analysis_cache_expires"
+            " ON analysis_cache (expires_at)"
+        )
+        return db
+
+    @staticmethod
+    def make_key(
+        transcript: str,
+        *,
+        model: str,
+        system_prompt: str,
+        temperature: float,
+        max_tokens: int,
+    ) -> str:
+        """!
+        @brief Вычисляет ключ кэша для расшифровки и параметров запроса.
+        @details Текст приводится к форме NFC, а все последовательности пробельных
+                 символов схлопываются в один пробел. Благодаря этому пересланное
+                 сообщение с другими переносами строк попадает в ту же запись.
+        @return Шестнадцатеричная строка SHA-256.
+        """
+
+        normalized = " ".join(unicodedata.normalize("NFC", transcript).split())
+        payload = json.dumps(
+            [CACHE_KEY_VERSION, model, system_prompt, temperature, max_tokens],
+            ensure_ascii=False,
+        )
+        digest = hashlib.sha256(payload.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(normalized.encode("utf-8"))
+        return digest.hexdigest()
+
+    async def get(self, key: str) -> str | None:
+        """!
+        @brief Возвращает сохраненный результат или `None`, если записи нет.
+        @details Сначала проверяется уровень в памяти, затем дисковый уровень.
+                 Найденная на диске запись поднимается в память.
+        @param key [in] Ключ, полученный из `make_key`.
+        """
+
+        now = time.time()
+        entry = self._memory.get(key)
+
+        if entry is not None and entry.expires_at <= now:
+            del self._memory[key]
+            self.stats.expirations += 1
+            entry = None
+        elif entry is not None:
+            self._memory.move_to_end(key)
+
+        if entry is None and self._db is not None:
+            entry = await asyncio.to_thread(self._db_get, key, now)
+            if entry is not None:
+                self.stats.disk_hits += 1
+                self._remember(key, entry)
+
+        if entry is None:
+            self.stats.misses += 1
+            return None
+
+        self.stats.hits += 1
+        self.stats.saved_seconds += entry.cost_seconds
+        self.stats.saved_tokens += entry.tokens
+        return entry.value
+
+    async def set(
+        self, key: str, value: str, *, cost_seconds: float = 0.0, tokens: int = 0
+    ) -> None:
+        """!
+        @brief Сохраняет результат анализа в кэше.
+        @param key [in] Ключ, полученный из `make_key`.
+        @param value [in] Сериализованный результат анализа (`AnalysisResult.to_json`).
+               Неудачные результаты сохранять нельзя.
+        @param cost_seconds [in] Время, затраченное на получение результата от модели.
+        @param tokens [in] Количество токенов, израсходованных на запрос.
+        """
+
+        entry = _Entry(value, time.time() + self.ttl_seconds, cost_seconds, tokens)
+        self._remember(key, entry)
+        self.stats.stores += 1
+
+        if self._db is not None:
+            try:
+                await asyncio.to_thread(self._db_set, key, entry)
+            except sqlite3.Error as e:
+                logger.warning("Failed to persist cache entry: %s", e)
+
+    def _remember(self, key: str, entry: _Entry) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats.evictions += 1
+
+    def _db_get(self, key: str, now: float) -> _Entry | None:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, expires_at, cost_seconds, tokens"
+                " FROM analysis_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._db.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+                self.stats.expirations += 1
+                return None
+            return _Entry(*row)
+
+    def _db_set(self, key: str, entry: _Entry) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO analysis_cache"
+                " (key, value, expires_at, cost_seconds, tokens)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, entry.value, entry.expires_at, entry.cost_seconds, entry.tokens),
+            )
+            if self.stats.stores % 256 == 0:
+                self._db.execute(
+                    "DELETE FROM analysis_cache WHERE expires_at <= ?", (time.time(),)
+                )
+
+    def close(self) -> None:
+        """!
+        @brief Закрывает соединение с дисковым уровнем кэша.
+        """
+
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
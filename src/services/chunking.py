@@ -0,0 +1,114 @@
+##
+# @file chunking.py
+# @author Roman Moroz
+# @brief Разбиение длинных расшифровок на фрагменты для поэтапного анализа.
+# @details Этот модуль содержит функции, которые делят расшифровку на реплики
+#          собеседников и упаковывают их во фрагменты ограниченного размера.
+#          Размер измеряется приблизительным числом токенов, которое оценивается
+#          локально, без обращения к токенизатору модели.
+
+import re
+
+##
+# @var _TOKEN_RE
+# @brief Регулярное выражение для грубого подсчета токенов: слова и знаки препинания.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+##
+# @var _SPEAKER_RE
+# @brief Регулярное выражение, распознающее начало новой реплики.
+# @details Реплика начинается со строки вида `Оператор: ...`, `Клиент - ...`
+#          или `[00:01:15] Менеджер: ...`.
+_SPEAKER_RE = re.compile(r"^\s*(?:\[[\d:.,\s]+\]\s*)?[\w .\-]{1,40}?\s*[:—-]\s")
+
+##
+# @var _SENTENCE_RE
+# @brief Регулярное выражение для разбиения слишком длинной реплики на предложения.
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """!
+    @brief Приблизительно оценивает число токенов в тексте.
+    @details Считает слова и знаки препинания. Для русского текста BPE-токенизаторы
+             обычно дают больше токенов, чем слов, поэтому к числу слов применяется
+             поправочный коэффициент.
+    @param text [in] Произвольный текст.
+    @return Оценка числа токенов.
+    """
+
+    return int(len(_TOKEN_RE.findall(text)) * 1.5)
+
+
+def split_turns(text: str) -> list[str]:
+    """!
+    @brief Делит расшифровку на реплики собеседников.
+    @details Строка, начинающаяся с метки говорящего, открывает новую реплику;
+             остальные строки присоединяются к текущей. Если меток нет совсем,
+             каждая непустая строка считается отдельной репликой.
+    @param text [in] Текст расшифровки.
+    @return Список реплик в исходном порядке.
+    """
+
+    turns: list[str] = []
+    current: list[str] = []
+
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        if current and _SPEAKER_RE.match(line):
+            turns.append("\n".join(current))
+            current = []
+        current.append(line)
+
+    if current:
+        turns.append("\n".join(current))
+
+    if len(turns) == 1 and "\n" in turns[0] and not _SPEAKER_RE.match(turns[0]):
+        return [line for line in turns[0].splitlines() if line.strip()]
+    return turns
+
+
+def split_transcript(text: str, max_tokens: int) -> list[str]:
+    """!
+    @brief Упаковывает реплики расшифровки во фрагменты не длиннее `max_tokens`.
+    @details Реплики добавляются во фрагмент жадно, пока не будет превышен бюджет.
+             Реплика, которая сама по себе превышает бюджет, делится по предложениям,
+             а в крайнем случае — по словам.
+    @param text [in] Текст расшифровки.
+    @param max_tokens [in] Максимальный размер фрагмента в оценочных токенах.
+    @return Список фрагментов в исходном порядке.
+    """
+
+    chunks: list[str] = []
+    current: list[str] = []
+    current_tokens = 0
+
+    for piece in _pieces(split_turns(text), max_tokens):
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _pieces(turns: list[str], max_tokens: int):
+    for turn in turns:
+        if estimate_tokens(turn) <= max_tokens:
+            yield turn
+            continue
+
+        for sentence in _SENTENCE_RE.split(turn):
+            if estimate_tokens(sentence) <= max_tokens:
+                yield sentence
+                continue
+
+            words = sentence.split()
+            step = max(1, int(max_tokens / 1.5))
+            for start in range(0, len(words), step):
+                yield " ".join(words[start : start + step])
@@ -0,0 +1,173 @@
+##
+# @file formatter.py
+# @author Roman Moroz
+# @brief Отображение результатов анализа в виде сообщений Telegram.
+# @details Этот модуль превращает `AnalysisResult` в Markdown-текст, который видит
+#          пользователь. Кроме того, он умеет показывать незавершенный JSON-ответ
+#          модели в потоковом режиме: из уже полученной части извлекаются
+#          тональность и полностью пришедшие рекомендации.
+
+import re
+import time
+
+from services.models import AnalysisResult
+from services.results_store import StatsSummary, StoredResult
+from services.tonality import ToneEstimate
+
+##
+# @var ERROR_TEXT
+# @brief Сообщение, которое видит пользователь при неудачном анализе.
+ERROR_TEXT = (
+    "⚠️ **Ошибка анализа**\n\n"
+    "Не удалось связаться с аналитическим сервисом. Пожалуйста, попробуйте снова."
+)
+
+##
+# @var READY_TEXT
+# @brief Приглашение прислать следующий диалог в конце сообщения с результатом.
+READY_TEXT = "Готов к анализу следующего диалога!"
+
+##
+# @var STATS_DAILY_ROWS
+# @brief Сколько последних дней показывать в разбивке статистики по дням.
+STATS_DAILY_ROWS = 7
+
+_MARKDOWN_SPECIAL_RE = re.compile(r"([_*`\[])")
+_PARTIAL_TONALITY_RE = re.compile(r'"tonality"\s*:\s*"([^"]+)"')
+_PARTIAL_RECOMMENDATIONS_RE = re.compile(r'"recommendations"\s*:\s*\[(.*)', re.DOTALL)
+_PARTIAL_STRING_RE = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+
+def render_markdown(result: AnalysisResult) -> str:
+    """!
+    @brief Формирует итоговое сообщение с результатом анализа.
+    @details Формат совпадает с тем, который раньше генерировала сама модель:
+             строка тональности и нумерованный список рекомендаций. Текст
+             рекомендаций экранируется, чтобы символы разметки из ответа модели
+             не ломали Markdown.
+    @param result [in] Результат анализа.
+    @return Текст для отправки с `parse_mode="Markdown"`.
+    """
+
+    if not result.ok:
+        return ERROR_TEXT
+
+    lines = [f"**Тональность:** {result.tonality.value}", "", "**Рекомендации:**"]
+    lines += [
+        f"{index}. {_escape(text)}"
+        for index, text in enumerate(result.recommendations, start=1)
+    ]
+    return "\n".join(lines)
+
+
+def render_reply(result: AnalysisResult) -> str:
+    """!
+    @brief Формирует итоговый ответ пользователю: результат и приглашение к следующему диалогу.
+    @details Приглашение раньше отправлялось отдельным сообщением; теперь оно входит
+             в ту же правку, что и результат, и не тратит лимит сообщений Telegram.
+    @param result [in] Результат анализа.
+    @return Текст для отправки с `parse_mode="Markdown"`.
+    """
+
+    return f"{render_markdown(result)}\n\n{READY_TEXT}"
+
+
+def render_partial(raw: str) -> str:
+    """!
+    @brief Формирует промежуточный текст из незавершенного JSON-ответа модели.
+    @details Разбор выполняется регулярными выражениями, а не JSON-парсером, так как
+             ответ обрывается на произвольном символе. Рекомендация показывается
+             только после того, как ее строка закрыта кавычкой.
+    @param raw [in] Уже полученная часть ответа модели.
+    @return Текст без Markdown-разметки или пустая строка, если показывать пока нечего.
+    """
+
+    match = _PARTIAL_TONALITY_RE.search(raw)
+    if not match:
+        return ""
+
+    lines = [f"Тональность: {match.group(1)}"]
+    recommendations = _PARTIAL_RECOMMENDATIONS_RE.search(raw)
+    if recommendations:
+        lines += ["", "Рекомендации:"]
+        lines += [
+            f"{index}. {_unescape(text)}"
+            for index, text in enumerate(
+                _PARTIAL_STRING_RE.findall(recommendations.group(1)), start=1
+            )
+        ]
+    return "\n".join(lines)
+
+
+def render_preliminary(estimate: ToneEstimate) -> str:
+    """!
+    @brief Формирует строку с предварительной (локальной) оценкой тональности.
+    @param estimate [in] Результат `LexiconScorer.score`.
+    @return Текст без Markdown-разметки.
+    """
+
+    return (
+        f"Предварительная тональность: {estimate.tonality.value} "
+        f"(уверенность {estimate.confidence:.0%})"
+    )
+
+
+def render_stats(summary: StatsSummary, title: str) -> str:
+    """!
+    @brief Формирует сообщение со статистикой анализов за период.
+    @details Помимо итогов за период показывает число анализов по последним
+             `STATS_DAILY_ROWS` дням, в которые были анализы.
+    @param summary [in] Результат `ResultsStore.stats`.
+    @param title [in] Заголовок, например "Ваша статистика".
+    @return Текст для отправки с `parse_mode="Markdown"`.
+    """
+
+    lines = [f"**{title} за {summary.days} дн.**", ""]
+    if not summary.total:
+        lines.append("Анализов за этот период нет.")
+        return "\n".join(lines)
+
+    lines.append(f"Всего анализов: {summary.total}")
+    for tonality, count in summary.tonalities.items():
+        lines.append(f"{tonality.value}: {count} ({count / summary.total:.0%})")
+    if summary.failed:
+        lines.append(f"Ошибки: {summary.failed} ({summary.failed / summary.total:.0%})")
+    lines.append(f"Среднее время ответа: {summary.average_latency:.1f} с")
+
+    lines += ["", "**По дням:**"]
+    lines += [f"{day}: {count}" for day, count in summary.daily[-STATS_DAILY_ROWS:]]
+    return "\n".join(lines)
+
+
+def render_history(results: list[StoredResult]) -> str:
+    """!
+    @brief Формирует сообщение со списком последних анализов пользователя.
+    @details Для каждого анализа показываются время (UTC), тональность и первая
+             рекомендация.
+    @param results [in] Результат `ResultsStore.history`, от новых к старым.
+    @return Текст для отправки с `parse_mode="Markdown"`.
+    """
+
+    if not results:
+        return "История пуста: вы еще не отправляли диалоги на анализ."
+
+    lines = ["**Последние анализы:**", ""]
+    for item in results:
+        moment = time.strftime("%Y-%m-%d %H:%M", time.gmtime(item.created_at))
+        result = item.result
+        if not result.ok:
+            lines.append(f"{moment} — ошибка анализа")
+            continue
+        line = f"{moment} — **{result.tonality.value}**"
+        if result.recommendations:
+            line += f": {_escape(result.recommendations[0])}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def _escape(text: str) -> str:
+    return _MARKDOWN_SPECIAL_RE.sub(r"\\\1", text)
+
+
+def _unescape(text: str) -> str:
+    return text.replace('\\"', '"').replace("\\n", " ").replace("\\\\", "\\")
@@ -0,0 +1,481 @@
+##
+# @file job_queue.py
+# @author Roman Moroz
+# @brief Надежная очередь задач анализа между процессом бота и рабочими процессами.
+# @details В режиме `ANALYSIS_MODE=queue` хендлер не анализирует расшифровку сам,
+#          а только кладет задачу в очередь; ее выполняют отдельные рабочие процессы
+#          (`worker.py`). Очередь переживает перезапуск как бота, так и воркеров.
+#          Этот модуль содержит две реализации с одинаковым интерфейсом:
+#          `SQLiteJobQueue` (по умолчанию, для одной машины) и `RedisJobQueue`
+#          (для нескольких машин).
+#
+#          Обе реализации устроены одинаково. У каждой задачи есть момент
+#          `visible_at`, начиная с которого ее можно взять в работу. Взятие задачи
+#          (`claim`) атомарно сдвигает этот момент на `visibility_timeout` вперед
+#          и выдает воркеру новый идентификатор аренды. Пока воркер работает, он
+#          продлевает аренду (`touch`); если он упал, аренда истекает и задачу берет
+#          другой воркер. Завершить, отложить или похоронить задачу может только
+#          текущий арендатор — опоздавший воркер со старой арендой ничего не изменит.
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+from dataclasses import dataclass
+from pathlib import Path
+
+from config.config import settings
+from services.scheduler import QueueFullError
+
+logger = logging.getLogger("call_assessment_bot")
+
+
+@dataclass(frozen=True, slots=True)
+class Job:
+    """!
+    @class Job
+    @brief Задача анализа одной расшифровки, взятая воркером из очереди.
+    @details `message_id` — сообщение "Диалог в очереди...", которое воркер заменит
+             результатом. `attempts` — номер текущей попытки (начиная с 1),
+             `lease` — идентификатор аренды, выданный при взятии задачи.
+    """
+
+    id: str
+    chat_id: int
+    message_id: int
+    user_id: int
+    transcript: str
+    attempts: int
+    lease: str
+    enqueued_at: float
+
+
+class SQLiteJobQueue:
+    """!
+    @class SQLiteJobQueue
+    @brief Очередь задач в файле SQLite.
+    @details
+    Подходит для бота и воркеров на одной машине: SQLite в режиме WAL позволяет
+    нескольким процессам безопасно работать с одним файлом. Задача берется одним
+    оператором `UPDATE ... RETURNING`, поэтому две копии воркера не могут получить
+    одну задачу. Как и дисковый кэш, все запросы выполняются в отдельном потоке
+    через `asyncio.to_thread`.
+    """
+
+    def __init__(self, path: str, *, visibility_timeout: float, max_size: int):
+        """!
+        @brief Конструктор очереди. Создает файл и таблицу, если их еще нет.
+        @param path [in] Путь к файлу SQLite.
+        @param visibility_timeout [in] Срок аренды задачи, в секундах.
+        @param max_size [in] Максимальное число задач в очереди (включая выполняемые).
+        """
+
+        self.visibility_timeout = visibility_timeout
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " chat_id INTEGER NOT NULL,"
+            " message_id INTEGER NOT NULL,"
+            " user_id INTEGER NOT NULL,"
+            " transcript TEXT NOT NULL,"
+            " state TEXT NOT NULL DEFAULT 'queued',"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " lease TEXT,"
+            " visible_at REAL NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " error TEXT)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_analysis_jobs_visible"
+            " ON analysis_jobs (state, visible_at)"
+        )
+
+    async def put(
+        self, *, chat_id: int, message_id: int, user_id: int, transcript: str
+    ) -> str:
+        """!
+        @brief Добавляет задачу в очередь.
+        @return Идентификатор задачи.
+        @throws QueueFullError Если в очереди уже `max_size` задач.
+        """
+
+        return await asyncio.to_thread(
+            self._put, chat_id, message_id, user_id, transcript
+        )
+
+    async def claim(self) -> Job | None:
+        """!
+        @brief Берет в работу самую старую доступную задачу.
+        @details Доступны новые задачи, отложенные задачи, срок которых наступил,
+                 и задачи, аренда которых истекла (их воркер, вероятно, упал).
+        @return Задача или `None`, если брать нечего.
+        """
+
+        return await asyncio.to_thread(self._claim)
+
+    async def touch(self, job: Job) -> bool:
+        """!
+        @brief Продлевает аренду задачи еще на `visibility_timeout`.
+        @return `False`, если аренда уже перешла к другому воркеру.
+        """
+
+        return await self._update(
+            job, "visible_at = ?", (time.time() + self.visibility_timeout,)
+        )
+
+    async def complete(self, job: Job) -> bool:
+        """!
+        @brief Удаляет выполненную задачу из очереди.
+        @return `False`, если аренда уже перешла к другому воркеру.
+        """
+
+        return await asyncio.to_thread(
+            self._execute,
+            "DELETE FROM analysis_jobs WHERE id = ? AND lease = ?",
+            (int(job.id), job.lease),
+        )
+
+    async def retry(self, job: Job, delay: float, error: str) -> bool:
+        """!
+        @brief Возвращает задачу в очередь для повторной попытки через `delay` секунд.
+        @return `False`, если аренда уже перешла к другому воркеру.
+        """
+
+        return await self._update(
+            job, "lease = NULL, visible_at = ?, error = ?", (time.time() + delay, error)
+        )
+
+    async def bury(self, job: Job, error: str) -> bool:
+        """!
+        @brief Переводит задачу, исчерпавшую попытки, в список неудачных.
+        @details Такие задачи остаются в таблице со статусом `dead` для разбора.
+        @return `False`, если аренда уже перешла к другому воркеру.
+        """
+
+        return await self._update(job, "state = 'dead', error = ?", (error,))
+
+    async def depth(self) -> int:
+        """!
+        @brief Возвращает число задач в очереди, включая выполняемые.
+        """
+
+        return await asyncio.to_thread(self._depth)
+
+    def close(self) -> None:
+        """!
+        @brief Закрывает соединение с файлом очереди.
+        """
+
+        with self._lock:
+            self._db.close()
+
+    async def _update(self, job: Job, assignments: str, params: tuple) -> bool:
+        return await asyncio.to_thread(
+            self._execute,
+            f"UPDATE analysis_jobs SET {assignments}"
+            " WHERE id = ? AND lease = ? AND state = 'queued'",
+            (*params, int(job.id), job.lease),
+        )
+
+    def _execute(self, sql: str, params: tuple) -> bool:
+        with self._lock:
+            return self._db.execute(sql, params).rowcount > 0
+
+    def _depth(self) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM analysis_jobs WHERE state = 'queued'"
+            ).fetchone()[0]
+
+    def _put(self, chat_id: int, message_id: int, user_id: int, transcript: str):
+        depth = self._depth()
+        if depth >= self.max_size:
+            raise QueueFullError(depth)
+
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO analysis_jobs"
+                " (chat_id, message_id, user_id, transcript, visible_at, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (chat_id, message_id, user_id, transcript, now, now),
+            )
+        return str(cursor.lastrowid)
+
+    def _claim(self) -> Job | None:
+        now = time.time()
+        lease = uuid.uuid4().hex
+        with self._lock:
+            row = self._db.execute(
+                "UPDATE analysis_jobs"
+                " SET lease = ?, visible_at = ?, attempts = attempts + 1"
+                " WHERE id = ("
+                "  SELECT id FROM analysis_jobs"
+                "  WHERE state = 'queued' AND visible_at <= ?"
+                "  ORDER BY visible_at, id LIMIT 1)"
+                " RETURNING id, chat_id, message_id, user_id, transcript, attempts,"
+                " created_at",
+                (lease, now + self.visibility_timeout, now),
+            ).fetchone()
+        if row is None:
+            return None
+        job_id, chat_id, message_id, user_id, transcript, attempts, created_at = row
+        return Job(
+            str(job_id),
+            chat_id,
+            message_id,
+            user_id,
+            transcript,
+            attempts,
+            lease,
+            created_at,
+        )
+
+
+class RedisJobQueue:
+    """!
+    @class RedisJobQueue
+    @brief Очередь задач в Redis для воркеров на нескольких машинах.
+    @details
+    Поля задачи хранятся в хэше `<prefix>:job:<id>`, а порядок выдачи — в одном
+    упорядоченном множестве `<prefix>:ready`, где оценка элемента равна `visible_at`.
+    Добавление задачи и операции с арендой выполняются в транзакциях
+    `WATCH`/`MULTI` без Lua-скриптов, поэтому вместо Redis подходит любой
+    совместимый сервер или локальная замена (например, `fakeredis` в тестах),
+    переданная через параметр `client`.
+    Похороненные задачи перемещаются в список `<prefix>:dead`.
+
+    Требует пакета `redis` (`pip install redis`).
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        visibility_timeout: float,
+        max_size: int,
+        prefix: str = "call_bot:jobs",
+        client=None,
+    ):
+        """!
+        @brief Конструктор очереди.
+        @param url [in] Адрес сервера, например `redis://localhost:6379/0`.
+        @param visibility_timeout [in] Срок аренды задачи, в секундах.
+        @param max_size [in] Максимальное число задач в очереди (включая выполняемые).
+        @param prefix [in] Префикс ключей, чтобы несколько ботов могли делить один сервер.
+        @param client [in] Готовый асинхронный клиент с `decode_responses=True`
+               вместо подключения по `url`.
+        """
+
+        if client is None:
+            try:
+                from redis.asyncio import Redis
+            except ImportError as e:
+                raise RuntimeError(
+                    "JOB_QUEUE_BACKEND=redis requires the 'redis' package"
+                ) from e
+            client = Redis.from_url(url, decode_responses=True)
+
+        self.redis = client
+        self.visibility_timeout = visibility_timeout
+        self.max_size = max_size
+        self.prefix = prefix
+        self._ready = f"{prefix}:ready"
+
+    async def put(
+        self, *, chat_id: int, message_id: int, user_id: int, transcript: str
+    ) -> str:
+        """!
+        @brief Добавляет задачу в очередь.
+        @return Идентификатор задачи.
+        @throws QueueFullError Если в очереди уже `max_size` задач.
+        """
+
+        from redis.exceptions import WatchError
+
+        job_id = str(await self.redis.incr(f"{self.prefix}:seq"))
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    # Проверка размера и вставка в одной транзакции: параллельные
+                    # `put` не переполнят очередь сверх `max_size`.
+                    await pipe.watch(self._ready)
+                    depth = await pipe.zcard(self._ready)
+                    if depth >= self.max_size:
+                        await pipe.unwatch()
+                        raise QueueFullError(depth)
+                    now = time.time()
+                    pipe.multi()
+                    pipe.hset(
+                        self._key(job_id),
+                        mapping={
+                            "chat_id": chat_id,
+                            "message_id": message_id,
+                            "user_id": user_id,
+                            "transcript": transcript,
+                            "attempts": 0,
+                            "lease": "",
+                            "created_at": now,
+                        },
+                    )
+                    pipe.zadd(self._ready, {job_id: now})
+                    await pipe.execute()
+                    return job_id
+                except WatchError:
+                    continue
+
+    async def claim(self) -> Job | None:
+        """!
+        @brief Берет в работу самую старую доступную задачу.
+        @return Задача или `None`, если брать нечего.
+        """
+
+        from redis.exceptions import WatchError
+
+        lease = uuid.uuid4().hex
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(self._ready)
+                    now = time.time()
+                    ids = await pipe.zrangebyscore(
+                        self._ready, "-inf", now, start=0, num=1
+                    )
+                    if not ids:
+                        await pipe.unwatch()
+                        return None
+                    job_id = ids[0]
+                    pipe.multi()
+                    pipe.zadd(self._ready, {job_id: now + self.visibility_timeout})
+                    pipe.hset(self._key(job_id), "lease", lease)
+                    pipe.hincrby(self._key(job_id), "attempts", 1)
+                    pipe.hgetall(self._key(job_id))
+                    *_, fields = await pipe.execute()
+                    break
+                except WatchError:
+                    continue
+
+        return Job(
+            job_id,
+            int(fields["chat_id"]),
+            int(fields["message_id"]),
+            int(fields["user_id"]),
+            fields["transcript"],
+            int(fields["attempts"]),
+            lease,
+            float(fields["created_at"]),
+        )
+
+    async def touch(self, job: Job) -> bool:
+        """!
+        @brief Продлевает аренду задачи еще на `visibility_timeout`.
+        @return `False`, если аренда уже перешла к другому воркеру.
+        """
+
+        return await self._if_leased(
+            job,
+            lambda pipe: pipe.zadd(
+                self._ready, {job.id: time.time() + self.visibility_timeout}
+            ),
+        )
+
+    async def complete(self, job: Job) -> bool:
+        """!
+        @brief Удаляет выполненную задачу из очереди.
+        @return `False`, если аренда уже перешла к другому воркеру.
+        """
+
+        def remove(pipe):
+            pipe.zrem(self._ready, job.id)
+            pipe.delete(self._key(job.id))
+
+        return await self._if_leased(job, remove)
+
+    async def retry(self, job: Job, delay: float, error: str) -> bool:
+        """!
+        @brief Возвращает задачу в очередь для повторной попытки через `delay` секунд.
+        @return `False`, если аренда уже перешла к другому воркеру.
+        """
+
+        def postpone(pipe):
+            pipe.hset(self._key(job.id), mapping={"lease": "", "error": error})
+            pipe.zadd(self._ready, {job.id: time.time() + delay})
+
+        return await self._if_leased(job, postpone)
+
+    async def bury(self, job: Job, error: str) -> bool:
+        """!
+        @brief Переводит задачу, исчерпавшую попытки, в список `<prefix>:dead`.
+        @return `False`, если аренда уже перешла к другому воркеру.
+        """
+
+        def move(pipe):
+            pipe.zrem(self._ready, job.id)
+            pipe.hset(self._key(job.id), "error", error)
+            pipe.rpush(f"{self.prefix}:dead", job.id)
+
+        return await self._if_leased(job, move)
+
+    async def depth(self) -> int:
+        """!
+        @brief Возвращает число задач в очереди, включая выполняемые.
+        """
+
+        return await self.redis.zcard(self._ready)
+
+    def close(self) -> None:
+        """!
+        @brief Ничего не делает: соединения закрываются вместе с циклом событий.
+        @details Метод нужен для совместимости с `SQLiteJobQueue`.
+        """
+
+    async def _if_leased(self, job: Job, operations) -> bool:
+        from redis.exceptions import WatchError
+
+        key = self._key(job.id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    if await pipe.hget(key, "lease") != job.lease:
+                        await pipe.unwatch()
+                        return False
+                    pipe.multi()
+                    operations(pipe)
+                    await pipe.execute()
+                    return True
+                except WatchError:
+                    continue
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}"
+
+
+def create_job_queue() -> SQLiteJobQueue | RedisJobQueue:
+    """!
+    @brief Создает очередь задач по настройкам `JOB_QUEUE_*`.
+    """
+
+    if settings.JOB_QUEUE_BACKEND == "redis":
+        return RedisJobQueue(
+            settings.JOB_QUEUE_REDIS_URL,
+            visibility_timeout=settings.JOB_VISIBILITY_TIMEOUT,
+            max_size=settings.JOB_QUEUE_MAX_SIZE,
+        )
+    return SQLiteJobQueue(
+        settings.JOB_QUEUE_PATH,
+        visibility_timeout=settings.JOB_VISIBILITY_TIMEOUT,
+        max_size=settings.JOB_QUEUE_MAX_SIZE,
+    )
@@ -0,0 +1,256 @@
+##
+# @file microbatch.py
+# @author Roman Moroz
+# @brief Объединение одновременных запросов к модели в пакеты.
+# @details Когда одновременно анализируется много коротких расшифровок, основную
+#          часть стоимости и задержки составляют накладные расходы отдельного
+#          запроса и системный промпт, повторяемый в каждом запросе. `MicroBatcher`
+#          собирает запросы, пришедшие почти одновременно, в один пакет не дольше
+#          `max_wait` секунд или до `max_size` элементов и передает пакет функции
+#          `flush`. Эта функция (в `CallAnalyzer` — один запрос к модели со всеми
+#          расшифровками) возвращает результат для каждого элемента, и он
+#          передается ожидающему вызывающему коду.
+#
+#          Размер пакета и время ожидания подстраиваются под нагрузку:
+#          - пока запросы приходят реже, чем раз в `max_wait`, пакет отправляется
+#            сразу, и одиночный запрос не ждет попутчиков;
+#          - под нагрузкой пакет ждет ровно столько, сколько нужно, чтобы
+#            набрать текущий предельный размер при наблюдаемой частоте запросов,
+#            но не дольше `max_wait`;
+#          - если одновременно выполняется `max_concurrency` пакетов (сервер
+#            модели занят), готовый пакет ждет свободного места и продолжает
+#            принимать запросы, поэтому пакеты растут вместе с нагрузкой;
+#          - если в ответе на пакет не хватило результатов или пакетный запрос
+#            завершился ошибкой, предельный размер уменьшается вдвое, а после
+#            каждого удачного пакета снова растет на единицу.
+
+import asyncio
+import logging
+import math
+import time
+
+from collections import deque
+from typing import Awaitable, Callable, Hashable
+
+from core.metrics import MICROBATCH_SIZE, MICROBATCH_WAIT
+
+logger = logging.getLogger("call_assessment_bot")
+
+##
+# @var ARRIVAL_SMOOTHING
+# @brief Вес нового интервала между запросами в экспоненциальном среднем.
+ARRIVAL_SMOOTHING = 0.2
+
+
+class _Batch:
+    __slots__ = ("items", "futures", "arrivals", "weight", "timer", "queued", "started")
+
+    def __init__(self):
+        self.items: list = []
+        self.futures: list[asyncio.Future] = []
+        self.arrivals: list[float] = []
+        self.weight = 0.0
+        self.timer: asyncio.TimerHandle | None = None
+        self.queued = False
+        self.started = False
+
+
+class MicroBatcher:
+    """!
+    @class MicroBatcher
+    @brief Собирает одновременные запросы в пакеты с адаптивным размером.
+    @details
+    Запросы с разными ключами (например, для разных моделей) никогда не попадают
+    в один пакет. Функция `flush(key, items)` возвращает список результатов той же
+    длины, что и `items`; `None` на месте результата означает, что элемент нужно
+    обработать отдельно, и вызывающий код получает `None`. Если `flush` для пакета
+    из нескольких элементов завершился исключением, все элементы тоже получают
+    `None` и обрабатываются отдельно; исключение для пакета из одного элемента
+    передается вызывающему коду.
+
+    Пакет отправляется отдельной задачей, поэтому отмена одного вызывающего
+    не прерывает запрос для остальных.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[Hashable, list], Awaitable[list]],
+        *,
+        max_size: int,
+        max_wait: float,
+        max_weight: float = math.inf,
+        max_concurrency: float = math.inf,
+    ):
+        """!
+        @brief Конструктор.
+        @param flush [in] Асинхронная функция обработки пакета.
+        @param max_size [in] Наибольшее число элементов в пакете.
+        @param max_wait [in] Наибольшее ожидание попутных элементов, в секундах.
+        @param max_weight [in] Наибольший суммарный вес элементов пакета
+               (в `CallAnalyzer` — оценочные токены расшифровок).
+        @param max_concurrency [in] Наибольшее число одновременно выполняемых пакетов.
+        """
+
+        self.flush = flush
+        self.max_size = max(1, max_size)
+        self.max_wait = max_wait
+        self.max_weight = max_weight
+        self.max_concurrency = max_concurrency
+        self.limit = self.max_size
+
+        self._batches: dict[Hashable, _Batch] = {}
+        self._queue: deque[tuple[Hashable, _Batch]] = deque()
+        self._running = 0
+        self._tasks: set[asyncio.Task] = set()
+        self._interval: float | None = None
+        self._last_arrival: float | None = None
+
+    async def submit(self, key: Hashable, item, weight: float = 1.0):
+        """!
+        @brief Добавляет элемент в пакет и ждет его результата.
+        @param key [in] Ключ пакета.
+        @param item [in] Элемент, который будет передан в `flush`.
+        @param weight [in] Вес элемента для ограничения `max_weight`.
+        @return Результат элемента из `flush` или `None`, если элемент нужно
+                обработать отдельно.
+        """
+
+        now = time.monotonic()
+        self._observe_arrival(now)
+
+        batch = self._batches.get(key)
+        if batch is not None and batch.weight + weight > self.max_weight:
+            self._dispatch(key, batch, full=True)
+            batch = None
+
+        immediate = False
+        if batch is None:
+            batch = self._batches[key] = _Batch()
+            delay = self._wait_time()
+            if delay > 0:
+                batch.timer = asyncio.get_running_loop().call_later(
+                    delay, self._dispatch, key, batch
+                )
+            else:
+                immediate = True
+
+        future = asyncio.get_running_loop().create_future()
+        batch.items.append(item)
+        batch.futures.append(future)
+        batch.arrivals.append(now)
+        batch.weight += weight
+        if len(batch.items) >= self.limit:
+            self._dispatch(key, batch, full=True)
+        elif immediate:
+            self._dispatch(key, batch)
+        return await future
+
+    async def close(self) -> None:
+        """!
+        @brief Отправляет накопленные пакеты и ждет завершения всех пакетов.
+        """
+
+        for key, batch in list(self._batches.items()):
+            self._dispatch(key, batch, full=True)
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _observe_arrival(self, now: float) -> None:
+        if self._last_arrival is not None:
+            gap = now - self._last_arrival
+            if self._interval is None:
+                self._interval = gap
+            else:
+                self._interval += ARRIVAL_SMOOTHING * (gap - self._interval)
+        self._last_arrival = now
+
+    def _wait_time(self) -> float:
+        if self._interval is None or self.limit <= 1:
+            return 0.0
+        if self._interval >= self.max_wait:
+            # За время ожидания вряд ли придет еще хотя бы один запрос.
+            return 0.0
+        return min(self.max_wait, self._interval * (self.limit - 1))
+
+    def _dispatch(self, key: Hashable, batch: _Batch, full: bool = False) -> None:
+        if batch.started:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+            batch.timer = None
+        if self._running < self.max_concurrency:
+            self._close(key, batch)
+            self._start(key, batch)
+            return
+        # Все места заняты: пакет ждет своей очереди и, если он не заполнен,
+        # продолжает принимать запросы.
+        if full:
+            self._close(key, batch)
+        if not batch.queued:
+            batch.queued = True
+            self._queue.append((key, batch))
+
+    def _close(self, key: Hashable, batch: _Batch) -> None:
+        if self._batches.get(key) is batch:
+            del self._batches[key]
+
+    def _start(self, key: Hashable, batch: _Batch) -> None:
+        batch.started = True
+        self._running += 1
+
+        now = time.monotonic()
+        MICROBATCH_SIZE.observe(len(batch.items))
+        for arrived in batch.arrivals:
+            MICROBATCH_WAIT.observe(now - arrived)
+
+        task = asyncio.create_task(self._run(key, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _start_next(self) -> None:
+        while self._queue and self._running < self.max_concurrency:
+            key, batch = self._queue.popleft()
+            if not batch.started:
+                self._close(key, batch)
+                self._start(key, batch)
+
+    async def _run(self, key: Hashable, batch: _Batch) -> None:
+        size = len(batch.items)
+        try:
+            results = await self.flush(key, batch.items)
+        except Exception as e:
+            self._adapt(size, failed=size > 1)
+            if size > 1:
+                logger.warning(
+                    "Batch of %d failed, batch limit is now %d: %s", size, self.limit, e
+                )
+            for future in batch.futures:
+                if future.done():
+                    continue
+                if size > 1:
+                    future.set_result(None)
+                else:
+                    future.set_exception(e)
+            return
+        finally:
+            self._running -= 1
+            self._start_next()
+
+        missing = sum(result is None for result in results)
+        self._adapt(size, failed=missing > 0)
+        if missing:
+            logger.warning(
+                "Batch of %d lacked %d results, batch limit is now %d",
+                size,
+                missing,
+                self.limit,
+            )
+        for future, result in zip(batch.futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _adapt(self, size: int, failed: bool) -> None:
+        if failed:
+            self.limit = max(1, min(self.limit, size) // 2)
+        else:
+            self.limit = min(self.max_size, self.limit + 1)
@@ -0,0 +1,216 @@
+##
+# @file models.py
+# @author Roman Moroz
+# @brief Типизированная модель результата анализа звонка.
+# @details Этот модуль описывает компактный объект `AnalysisResult`, в который
+#          разбирается JSON-ответ модели. Благодаря ему остальные части бота
+#          (кэш, пакетная обработка, статистика) работают со структурированными
+#          данными, а не с Markdown-текстом. Отображение результата пользователю
+#          вынесено в модуль `formatter`.
+
+import json
+import re
+
+from dataclasses import dataclass
+from enum import Enum
+
+##
+# @var MAX_RECOMMENDATIONS
+# @brief Максимальное число рекомендаций, сохраняемых в результате.
+MAX_RECOMMENDATIONS = 5
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+_MD_TONALITY_RE = re.compile(r"Тональность:\**\s*\**\s*([А-Яа-яЁё]+)")
+_MD_RECOMMENDATION_RE = re.compile(r"^\s*\d+[.)]\s*(.+?)\s*$", re.MULTILINE)
+
+
+class MalformedOutputError(ValueError):
+    """!
+    @class MalformedOutputError
+    @brief Исключение: ответ модели не удалось разобрать в `AnalysisResult`.
+    """
+
+
+class Tonality(str, Enum):
+    """!
+    @class Tonality
+    @brief Тональность диалога.
+    @details Значения перечисления совпадают с текстом, который видит пользователь.
+    """
+
+    POSITIVE = "Позитивная"
+    NEUTRAL = "Нейтральная"
+    NEGATIVE = "Негативная"
+
+    @classmethod
+    def parse(cls, value) -> "Tonality | None":
+        """!
+        @brief Нестрого разбирает тональность из ответа модели.
+        @details Регистр не важен; принимаются также английские названия и формы
+                 вроде "позитивный" или "негатив".
+        @param value [in] Значение из ответа модели.
+        @return Элемент перечисления или `None`, если распознать не удалось.
+        """
+
+        if not isinstance(value, str):
+            return None
+        normalized = value.strip().strip(".*").lower()
+        for prefix, tonality in _TONALITY_PREFIXES:
+            if normalized.startswith(prefix):
+                return tonality
+        return None
+
+
+_TONALITY_PREFIXES = (
+    ("позитив", Tonality.POSITIVE),
+    ("positive", Tonality.POSITIVE),
+    ("нейтрал", Tonality.NEUTRAL),
+    ("neutral", Tonality.NEUTRAL),
+    ("негатив", Tonality.NEGATIVE),
+    ("negative", Tonality.NEGATIVE),
+)
+
+
+@dataclass(frozen=True, slots=True)
+class AnalysisResult:
+    """!
+    @class AnalysisResult
+    @brief Результат анализа одной расшифровки.
+    @details Неудачный анализ представляется тем же типом: в этом случае
+             `tonality` равна `None`, а в `error` записано краткое описание причины.
+             Так `CallAnalyzer.analyze_call` по-прежнему никогда не выбрасывает
+             исключений наружу.
+    """
+
+    tonality: Tonality | None
+    recommendations: tuple[str, ...] = ()
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        """!
+        @brief Признак успешного анализа.
+        """
+
+        return self.error is None and self.tonality is not None
+
+    @classmethod
+    def failed(cls, error: str) -> "AnalysisResult":
+        """!
+        @brief Создает результат неудачного анализа.
+        @param error [in] Краткое описание причины (для логов и отчетов).
+        """
+
+        return cls(tonality=None, error=error)
+
+    def to_dict(self) -> dict:
+        """!
+        @brief Преобразует результат в словарь для JSON-сериализации.
+        """
+
+        return {
+            "tonality": self.tonality.value if self.tonality else None,
+            "recommendations": list(self.recommendations),
+            "error": self.error,
+        }
+
+    def to_json(self) -> str:
+        """!
+        @brief Компактная JSON-строка результата (используется кэшем).
+        """
+
+        return json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, text: str) -> "AnalysisResult":
+        """!
+        @brief Восстанавливает результат из строки, созданной `to_json`.
+        """
+
+        data = json.loads(text)
+        return cls(
+            tonality=Tonality.parse(data.get("tonality")),
+            recommendations=tuple(data.get("recommendations") or ()),
+            error=data.get("error"),
+        )
+
+    @classmethod
+    def from_model_output(cls, text: str) -> "AnalysisResult":
+        """!
+        @brief Разбирает ответ модели в результат анализа.
+        @details
+        Основной путь — JSON вида `{"tonality": ..., "recommendations": [...]}`.
+        Перед разбором выполняется дешевый ремонт: удаляются обрамляющие
+        ```` ``` ```` и лишний текст вокруг объекта. Если JSON так и не найден,
+        делается попытка разобрать прежний Markdown-формат ответа.
+        @param text [in] Текст ответа модели.
+        @return Успешный `AnalysisResult`.
+        @throw MalformedOutputError Если извлечь тональность и рекомендации не удалось.
+        """
+
+        data = _extract_json(text)
+        if data is not None:
+            tonality, recommendations = _fields(data)
+        else:
+            match = _MD_TONALITY_RE.search(text)
+            tonality = Tonality.parse(match.group(1)) if match else None
+            recommendations = _clean_recommendations(
+                _MD_RECOMMENDATION_RE.findall(text)
+            )
+
+        if tonality is None or not recommendations:
+            raise MalformedOutputError(f"Cannot parse model output: {text[:200]!r}")
+        return cls(tonality, recommendations)
+
+
+def parse_batch_output(text: str) -> dict[int, AnalysisResult]:
+    """!
+    @brief Разбирает ответ модели на пакетный запрос (см. `services.microbatch`).
+    @details Ожидается JSON вида `{"results": [{"id": 1, "tonality": ...,
+             "recommendations": [...]}, ...]}`. Элементы без корректного `id`,
+             тональности или рекомендаций пропускаются: вызывающий код
+             проанализирует такие расшифровки отдельными запросами.
+    @param text [in] Текст ответа модели.
+    @return Словарь "id расшифровки → результат" для разобранных элементов.
+    @throw MalformedOutputError Если в ответе нет списка `results`.
+    """
+
+    data = _extract_json(text)
+    items = data.get("results") if data is not None else None
+    if not isinstance(items, list):
+        raise MalformedOutputError(f"Cannot parse batch output: {text[:200]!r}")
+
+    results = {}
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get("id"), int):
+            continue
+        tonality, recommendations = _fields(item)
+        if tonality is not None and recommendations:
+            results[item["id"]] = AnalysisResult(tonality, recommendations)
+    return results
+
+
+def _fields(data: dict) -> tuple[Tonality | None, tuple[str, ...]]:
+    return (
+        Tonality.parse(data.get("tonality")),
+        _clean_recommendations(data.get("recommendations")),
+    )
+
+
+def _extract_json(text: str) -> dict | None:
+    candidate = _FENCE_RE.sub("", text.strip())
+    start, end = candidate.find("{"), candidate.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(candidate[start : end + 1])
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _clean_recommendations(value) -> tuple[str, ...]:
+    if not isinstance(value, (list, tuple)):
+        return ()
+    cleaned = (str(item).strip().strip("*").strip() for item in value)
+    return tuple(item for item in cleaned if item)[:MAX_RECOMMENDATIONS]
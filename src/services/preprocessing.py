@@ -0,0 +1,270 @@
+##
+# @file preprocessing.py
+# @author Roman Moroz
+# @brief Очистка расшифровок перед отправкой в модель.
+# @details Расшифровки из системы распознавания речи содержат временные метки,
+#          повторяющиеся метки говорящих, слова-паразиты ("ээ", "ну", "как бы"),
+#          заикания и продублированные строки. Модели все это не нужно, а платим
+#          мы за каждый входной токен и за время до первого токена ответа.
+#          Этот модуль содержит класс `TranscriptPreprocessor` — настраиваемую
+#          цепочку этапов очистки, каждый из которых измеряется отдельно.
+
+import asyncio
+import logging
+import re
+import time
+
+from dataclasses import dataclass, field
+
+from core.metrics import PREPROCESS_DURATION, PREPROCESS_TOKENS
+from services.chunking import estimate_tokens
+
+logger = logging.getLogger("call_assessment_bot")
+
+##
+# @var STAGES
+# @brief Все этапы очистки в порядке их выполнения.
+STAGES = ("timestamps", "fillers", "repeats", "speakers", "whitespace", "truncate")
+
+##
+# @var FILLERS
+# @brief Слова-паразиты и междометия, которые удаляются из реплик.
+FILLERS = (
+    r"э{2,}",
+    r"э+м+",
+    r"м{2,}",
+    r"а{3,}",
+    r"ну",
+    r"как бы",
+    r"типа",
+    r"короче",
+    r"это самое",
+    r"так сказать",
+    r"в общем-то",
+)
+
+##
+# @var TRUNCATION_MARK
+# @brief Строка, которая заменяет вырезанную середину слишком длинной расшифровки.
+TRUNCATION_MARK = "[…часть разговора пропущена…]"
+
+_TIME = r"\d{1,2}:\d{2}(?::\d{2})?(?:[.,]\d{1,3})?"
+_TIMESTAMP_RE = re.compile(
+    rf"[\[(]{_TIME}(?:\s*(?:-->|–|-)\s*{_TIME})?[\])]"
+    rf"|^[ \t]*{_TIME}(?:\s*(?:-->|–|-)\s*{_TIME})?[ \t]*",
+    re.MULTILINE,
+)
+_SRT_INDEX_RE = re.compile(r"^[ \t]*\d+[ \t]*$", re.MULTILINE)
+# Двоеточие перед цифрой — это время ("приеду в 10:30"), а не метка говорящего.
+_SPEAKER_RE = re.compile(
+    r"^[ \t]*(?:\[(?P<tag>[^\]\n]{1,30})\]|(?P<name>[^\W\d_][\w .]{0,30}?))"
+    r"[ \t]*:(?!\d)[ \t]*"
+)
+_FILLER_RE = re.compile(
+    r",?[ \t]*\b(?:" + "|".join(FILLERS) + r")\b[ \t]*,?", re.IGNORECASE
+)
+_STUTTER_RE = re.compile(r"\b(\w+)(?:[ \t]+\1\b)+", re.IGNORECASE)
+_SPACES_RE = re.compile(r"[ \t\u00a0\u200b]+")
+_SPACE_BEFORE_PUNCT_RE = re.compile(r" +(?=[,.!?;:…])")
+_REPEATED_PUNCT_RE = re.compile(r"([,;])(?:\s*[,;])+")
+
+
+@dataclass
+class PreprocessStats:
+    """!
+    @class PreprocessStats
+    @brief Результат измерения очистки одной расшифровки.
+    @details `durations` хранит время каждого выполненного этапа в секундах.
+    """
+
+    chars_before: int = 0
+    chars_after: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+    durations: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def tokens_saved(self) -> int:
+        """!
+        @brief Сколько оценочных токенов сэкономила очистка.
+        """
+
+        return self.tokens_before - self.tokens_after
+
+    @property
+    def seconds(self) -> float:
+        """!
+        @brief Суммарное время всех этапов, в секундах.
+        """
+
+        return sum(self.durations.values())
+
+
+class TranscriptPreprocessor:
+    """!
+    @class TranscriptPreprocessor
+    @brief Цепочка этапов очистки расшифровки.
+    @details
+    Доступные этапы (выполняются в порядке `STAGES`):
+    - `timestamps` — удаляет временные метки в скобках (`[00:01:15]`) и в начале
+      строки (`00:00:01,000 --> 00:00:03,500`), а также номера субтитров; время
+      внутри реплики ("приеду в 10:30") не трогается;
+    - `fillers` — удаляет слова-паразиты из `FILLERS` вместе с окружающими запятыми;
+    - `repeats` — схлопывает заикания ("я я я") и одинаковые соседние строки;
+    - `speakers` — приводит метки говорящих к виду `Оператор: ...` и склеивает
+      подряд идущие реплики одного говорящего в одну. Меткой считается любое
+      начало строки до 30 символов перед двоеточием, начинающееся с буквы
+      ("Итого: 500 рублей" тоже станет репликой "Итого"), кроме времени вида `10:30`;
+    - `whitespace` — нормализует пробелы и удаляет пустые строки;
+    - `truncate` — если задан бюджет токенов, вырезает середину расшифровки,
+      сохраняя начало и конец разговора так, чтобы вместе с пометкой
+      `TRUNCATION_MARK` они уложились в бюджет.
+
+    Каждый этап — это предкомпилированное регулярное выражение, применяемое ко
+    всему тексту за один проход, или один проход по строкам, поэтому время
+    очистки растет линейно с длиной текста. Длинные расшифровки (больше
+    `offload_chars` символов) очищаются в отдельном потоке, чтобы не блокировать
+    цикл событий.
+    """
+
+    def __init__(
+        self,
+        stages: list[str] | tuple[str, ...] = STAGES,
+        *,
+        token_budget: int = 0,
+        offload_chars: int = 200_000,
+    ):
+        """!
+        @brief Конструктор цепочки.
+        @param stages [in] Имена включенных этапов (порядок выполнения задает `STAGES`).
+        @param token_budget [in] Бюджет оценочных токенов для этапа `truncate`; 0 — без обрезки.
+        @param offload_chars [in] Длина текста, начиная с которой очистка выполняется в потоке.
+        """
+
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            raise ValueError(f"Unknown preprocessing stages: {sorted(unknown)}")
+
+        self.stages = [stage for stage in STAGES if stage in stages]
+        self.token_budget = token_budget
+        self.offload_chars = offload_chars
+
+    async def run(self, text: str) -> tuple[str, PreprocessStats]:
+        """!
+        @brief Очищает расшифровку, при необходимости в отдельном потоке.
+        @details Записывает время этапов и число сэкономленных токенов в метрики
+                 и в лог.
+        @param text [in] Исходный текст расшифровки.
+        @return Очищенный текст и статистика очистки.
+        """
+
+        if len(text) >= self.offload_chars:
+            cleaned, stats = await asyncio.to_thread(self.process, text)
+        else:
+            cleaned, stats = self.process(text)
+
+        for stage, seconds in stats.durations.items():
+            PREPROCESS_DURATION.labels(stage).observe(seconds)
+        PREPROCESS_TOKENS.labels("before").inc(stats.tokens_before)
+        PREPROCESS_TOKENS.labels("after").inc(stats.tokens_after)
+        logger.info(
+            "Preprocessing saved %d of %d tokens (%.0f%%) in %.1f ms",
+            stats.tokens_saved,
+            stats.tokens_before,
+            100 * stats.tokens_saved / stats.tokens_before
+            if stats.tokens_before
+            else 0,
+            stats.seconds * 1000,
+        )
+        return cleaned, stats
+
+    def process(self, text: str) -> tuple[str, PreprocessStats]:
+        """!
+        @brief Синхронно очищает расшифровку.
+        @param text [in] Исходный текст расшифровки.
+        @return Очищенный текст и статистика очистки.
+        """
+
+        stats = PreprocessStats(
+            chars_before=len(text), tokens_before=estimate_tokens(text)
+        )
+        for stage in self.stages:
+            started = time.perf_counter()
+            text = getattr(self, f"_{stage}")(text)
+            stats.durations[stage] = time.perf_counter() - started
+
+        stats.chars_after = len(text)
+        stats.tokens_after = estimate_tokens(text)
+        return text, stats
+
+    @staticmethod
+    def _timestamps(text: str) -> str:
+        return _SRT_INDEX_RE.sub("", _TIMESTAMP_RE.sub("", text))
+
+    @staticmethod
+    def _speakers(text: str) -> str:
+        lines: list[str] = []
+        speaker = None
+        for line in text.splitlines():
+            match = _SPEAKER_RE.match(line)
+            if match is None:
+                if line.strip():
+                    lines.append(line)
+                continue
+
+            label = (match["tag"] or match["name"]).strip().capitalize()
+            body = line[match.end() :]
+            if label == speaker and lines:
+                lines[-1] += " " + body
+            else:
+                lines.append(f"{label}: {body}")
+                speaker = label
+        return "\n".join(lines)
+
+    @staticmethod
+    def _fillers(text: str) -> str:
+        return _FILLER_RE.sub(" ", text)
+
+    @staticmethod
+    def _repeats(text: str) -> str:
+        text = _STUTTER_RE.sub(r"\1", text)
+        lines: list[str] = []
+        previous = None
+        for line in text.splitlines():
+            key = " ".join(line.split()).casefold()
+            if key and key == previous:
+                continue
+            lines.append(line)
+            previous = key
+        return "\n".join(lines)
+
+    @staticmethod
+    def _whitespace(text: str) -> str:
+        text = _SPACES_RE.sub(" ", text)
+        text = _SPACE_BEFORE_PUNCT_RE.sub("", text)
+        text = _REPEATED_PUNCT_RE.sub(r"\1", text)
+        return "\n".join(
+            line.strip(" ,") for line in text.splitlines() if line.strip(" ,")
+        )
+
+    def _truncate(self, text: str) -> str:
+        if not self.token_budget or estimate_tokens(text) <= self.token_budget:
+            return text
+
+        # Оценка округляется вниз, поэтому на каждую строку закладывается лишний
+        # токен: тогда и оценка всего результата не превысит бюджет.
+        lines = text.splitlines()
+        costs = [estimate_tokens(line) + 1 for line in lines]
+        budget = max(0, self.token_budget - estimate_tokens(TRUNCATION_MARK) - 1)
+        head_budget = budget * 2 // 3
+        tail_budget = budget - head_budget
+
+        head = 0
+        while head < len(lines) and costs[head] <= head_budget:
+            head_budget -= costs[head]
+            head += 1
+        tail = len(lines)
+        while tail > head and costs[tail - 1] <= tail_budget:
+            tail_budget -= costs[tail - 1]
+            tail -= 1
+        return "\n".join(lines[:head] + [TRUNCATION_MARK] + lines[tail:])
@@ -0,0 +1,530 @@
+##
+# @file resilience.py
+# @author Roman Moroz
+# @brief Устойчивый вызов модели: повторы, автоматический выключатель и хеджирование.
+# @details Этот модуль содержит класс `ResilientCaller`, через который `CallAnalyzer`
+#          отправляет все запросы к OpenRouter. Временная ошибка (429, 502, обрыв
+#          соединения) больше не превращается сразу в "Ошибку анализа": запрос
+#          повторяется с экспоненциальной задержкой, при необходимости на резервной
+#          модели. Для каждой модели ведется статистика задержек и ошибок, которая
+#          определяет порядок выбора моделей и момент отправки хеджированного запроса.
+
+import asyncio
+import logging
+import random
+import time
+
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, TypeVar
+
+import httpx
+
+from openai import APIConnectionError, APIStatusError
+
+from core.metrics import ERRORS, OPENROUTER_DURATION
+
+logger = logging.getLogger("call_assessment_bot")
+
+T = TypeVar("T")
+
+##
+# @var RETRYABLE_STATUS_CODES
+# @brief HTTP-коды ответа, при которых запрос имеет смысл повторить.
+# @details Кроме перечисленных, повторяются все ответы с кодом 5xx.
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 425, 429})
+
+##
+# @var STATS_WINDOW
+# @brief Число последних запросов, по которым считаются задержки и доля ошибок модели.
+STATS_WINDOW = 200
+
+##
+# @var MIN_LATENCY_SAMPLES
+# @brief Минимальное число замеров, после которого перцентили задержки считаются надежными.
+MIN_LATENCY_SAMPLES = 20
+
+##
+# @var DEGRADED_ERROR_RATE
+# @brief Доля ошибок, начиная с которой модель считается деградировавшей.
+# @details Деградировавшая модель перемещается в конец списка кандидатов.
+DEGRADED_ERROR_RATE = 0.5
+
+
+class CircuitOpenError(RuntimeError):
+    """!
+    @class CircuitOpenError
+    @brief Исключение: все модели временно исключены автоматическим выключателем.
+    @details Запрос завершается сразу, не дожидаясь таймаута заведомо
+             недоступного провайдера.
+    """
+
+    def __init__(self, retry_in: float):
+        super().__init__(f"All models are unavailable, retry in {retry_in:.0f}s")
+        self.retry_in = retry_in
+
+
+@dataclass
+class ModelStats:
+    """!
+    @class ModelStats
+    @brief Статистика запросов к одной модели по скользящему окну.
+    """
+
+    requests: int = 0
+    failures: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    latencies: deque = field(default_factory=lambda: deque(maxlen=STATS_WINDOW))
+    outcomes: deque = field(default_factory=lambda: deque(maxlen=STATS_WINDOW))
+
+    def record(self, ok: bool, latency: float | None = None) -> None:
+        """!
+        @brief Учитывает завершившийся запрос.
+        @param ok [in] Признак успешного ответа.
+        @param latency [in] Время ответа в секундах (только для успешных запросов).
+        """
+
+        self.outcomes.append(ok)
+        if not ok:
+            self.failures += 1
+        elif latency is not None:
+            self.latencies.append(latency)
+
+    @property
+    def error_rate(self) -> float:
+        """!
+        @brief Доля ошибок среди последних запросов.
+        """
+
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def quantile(self, q: float) -> float | None:
+        """!
+        @brief Квантиль задержки успешных ответов.
+        @param q [in] Уровень квантиля от 0 до 1, например 0.95.
+        @return Задержка в секундах или `None`, если замеров пока мало.
+        """
+
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """!
+    @class CircuitBreaker
+    @brief Автоматический выключатель для одной модели.
+    @details
+    После `failure_threshold` ошибок подряд выключатель размыкается, и модель
+    не получает запросов `reset_timeout` секунд. Затем пропускается один пробный
+    запрос: при успехе выключатель замыкается, при ошибке снова размыкается.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        """!
+        @brief Конструктор выключателя.
+        @param failure_threshold [in] Число ошибок подряд до размыкания.
+        @param reset_timeout [in] Время в секундах до пробного запроса.
+        """
+
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        """!
+        @brief Состояние выключателя: `closed`, `open` или `half_open`.
+        """
+
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    @property
+    def available(self) -> bool:
+        """!
+        @brief Можно ли отправить модели запрос прямо сейчас.
+        """
+
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._probing)
+
+    def retry_in(self) -> float:
+        """!
+        @brief Сколько секунд осталось до пробного запроса.
+        """
+
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def on_start(self) -> None:
+        """!
+        @brief Отмечает начало запроса; в полуоткрытом состоянии он становится пробным.
+        """
+
+        if self.state == "half_open":
+            self._probing = True
+
+    def on_success(self) -> None:
+        """!
+        @brief Учитывает успешный ответ и замыкает выключатель.
+        """
+
+        if self.opened_at is not None:
+            logger.info("Circuit breaker closed after a successful probe")
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def on_failure(self) -> None:
+        """!
+        @brief Учитывает ошибку и при необходимости размыкает выключатель.
+        """
+
+        self.failures += 1
+        self._probing = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """!
+        @brief Снимает отметку пробного запроса, завершившегося без вердикта.
+        @details Вызывается, когда запрос отменен (например, проиграл хеджирование)
+                 или завершился ошибкой, не связанной с доступностью модели.
+        """
+
+        self._probing = False
+
+
+class ResilientCaller:
+    """!
+    @class ResilientCaller
+    @brief Выполняет запрос к модели с повторами, переключением моделей и хеджированием.
+    @details
+    Запрос передается в виде функции, принимающей имя модели, поэтому класс
+    не зависит от конкретного клиента API. Для каждой попытки выбирается список
+    доступных моделей: в порядке из настроек, но модели с разомкнутым выключателем
+    пропускаются, а деградировавшие и уже ошибившиеся в этом запросе уходят в конец.
+
+    При временной ошибке запрос повторяется после задержки с экспоненциальным
+    ростом и случайным разбросом (full jitter), не больше `max_delay`. Модель,
+    ответившая с заголовком `Retry-After`, не получает запросов (в том числе
+    хеджированных) раньше указанного срока: повтор сразу уходит на резервную
+    модель, а если повторять можно только на ней, запрос ждет весь срок.
+    Если же этот срок больше `max_delay`, запрос завершается полученной ошибкой.
+
+    Если хеджирование включено и доступна резервная модель, то через время,
+    равное 95-му перцентилю задержки основной модели, тот же запрос отправляется
+    резервной модели с наименьшей задержкой. Используется первый успешный ответ,
+    второй запрос отменяется.
+    """
+
+    def __init__(
+        self,
+        models: list[str],
+        *,
+        max_attempts: int,
+        base_delay: float,
+        max_delay: float,
+        failure_threshold: int,
+        reset_timeout: float,
+        hedge_enabled: bool = False,
+        hedge_delay: float = 6.0,
+        hedge_min_delay: float = 1.5,
+        hedge_quantile: float = 0.95,
+    ):
+        """!
+        @brief Конструктор.
+        @param models [in] Модели в порядке предпочтения; первая — основная.
+        @param max_attempts [in] Максимальное число попыток (включая первую).
+        @param base_delay [in] Базовая задержка отката в секундах.
+        @param max_delay [in] Максимальная задержка между попытками в секундах.
+               Если сервер просит подождать дольше, запрос не повторяется.
+        @param failure_threshold [in] Число ошибок подряд до размыкания выключателя.
+        @param reset_timeout [in] Время до пробного запроса к исключенной модели.
+        @param hedge_enabled [in] Включает хеджированные запросы.
+        @param hedge_delay [in] Задержка хеджирования, пока статистики мало.
+        @param hedge_min_delay [in] Нижняя граница задержки хеджирования.
+        @param hedge_quantile [in] Квантиль задержки, после которого запрос хеджируется.
+        """
+
+        self.models = list(dict.fromkeys(models))
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_enabled = hedge_enabled and len(self.models) > 1
+        self.hedge_delay = hedge_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_quantile = hedge_quantile
+
+        self.stats = {model: ModelStats() for model in self.models}
+        self.breakers = {
+            model: CircuitBreaker(failure_threshold, reset_timeout)
+            for model in self.models
+        }
+
+    async def call(
+        self,
+        request: Callable[[str], Awaitable[T]],
+        *,
+        hedge: bool = True,
+        preferred: str | None = None,
+    ) -> T:
+        """!
+        @brief Выполняет запрос с повторами и переключением моделей.
+        @param request [in] Асинхронная функция, выполняющая запрос к указанной модели.
+        @param hedge [in] Разрешает хеджирование для этого запроса. Отключается для
+               потоковых запросов, где ответ начинает отдаваться сразу.
+        @param preferred [in] Модель, которую нужно попробовать раньше моделей
+               из настроек (например, более дешевая модель для простых случаев).
+               При ее сбое запрос переключается на модели из настроек.
+        @return Результат `request` для модели, ответившей первой.
+        @throw CircuitOpenError Если все модели исключены выключателем.
+        @throw Exception Последняя ошибка, если она не временная, попытки исчерпаны
+               или сервер просит подождать дольше `max_delay`.
+        """
+
+        order = self.models
+        if preferred is not None and preferred != self.models[0]:
+            order = [preferred] + [model for model in self.models if model != preferred]
+            if preferred not in self.stats:
+                self.stats[preferred] = ModelStats()
+                self.breakers[preferred] = CircuitBreaker(
+                    self.breakers[self.models[0]].failure_threshold,
+                    self.breakers[self.models[0]].reset_timeout,
+                )
+        failed: list[str] = []
+        not_before: dict[str, float] = {}
+
+        for attempt in range(1, self.max_attempts + 1):
+            candidates = self._candidates(order, failed, not_before)
+            if not candidates:
+                raise CircuitOpenError(
+                    min(breaker.retry_in() for breaker in self.breakers.values())
+                )
+
+            primary = candidates[0]
+            backup = None
+            if hedge and self.hedge_enabled:
+                now = time.monotonic()
+                ready = [m for m in candidates[1:] if not_before.get(m, 0.0) <= now]
+                if ready:
+                    backup = self._hedge_target(ready)
+
+            try:
+                return await self._attempt(request, primary, backup)
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_attempts:
+                    raise
+                failed.append(primary)
+                wait = retry_after(e)
+                if wait is not None:
+                    not_before[primary] = time.monotonic() + wait
+                delay = self._backoff(attempt, order, failed, not_before)
+                if delay is None:
+                    logger.warning(
+                        "Request to %s failed (%s: %s), the server asked to wait"
+                        " more than %.0fs, giving up",
+                        primary,
+                        type(e).__name__,
+                        e,
+                        self.max_delay,
+                    )
+                    raise
+                logger.warning(
+                    "Request to %s failed (%s: %s), retry %d/%d in %.1fs",
+                    primary,
+                    type(e).__name__,
+                    e,
+                    attempt,
+                    self.max_attempts - 1,
+                    delay,
+                )
+                await asyncio.sleep(delay)
+
+        raise AssertionError("unreachable")
+
+    def _candidates(
+        self, order: list[str], failed: list[str], not_before: dict[str, float]
+    ) -> list[str]:
+        available = [model for model in order if self.breakers[model].available]
+        return sorted(
+            available,
+            key=lambda model: (
+                model in failed,
+                not_before.get(model, 0.0),
+                self.stats[model].error_rate >= DEGRADED_ERROR_RATE,
+                order.index(model),
+            ),
+        )
+
+    def _hedge_target(self, candidates: list[str]) -> str:
+        def latency(model: str) -> float:
+            value = self.stats[model].quantile(self.hedge_quantile)
+            return float("inf") if value is None else value
+
+        return min(candidates, key=latency)
+
+    def _hedge_after(self, model: str) -> float:
+        observed = self.stats[model].quantile(self.hedge_quantile)
+        delay = self.hedge_delay if observed is None else observed
+        return max(self.hedge_min_delay, delay)
+
+    def _backoff(
+        self,
+        attempt: int,
+        order: list[str],
+        failed: list[str],
+        not_before: dict[str, float],
+    ) -> float | None:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        candidates = self._candidates(order, failed, not_before)
+        if not candidates:
+            return delay
+        wait = not_before.get(candidates[0], 0.0) - time.monotonic()
+        if wait > self.max_delay:
+            return None
+        return max(delay, wait)
+
+    async def _attempt(
+        self,
+        request: Callable[[str], Awaitable[T]],
+        primary: str,
+        backup: str | None,
+    ) -> T:
+        if backup is None:
+            return await self._call_model(request, primary)
+
+        tasks = {asyncio.create_task(self._call_model(request, primary))}
+        hedge_task = None
+        error: BaseException | None = None
+
+        try:
+            done, tasks = await asyncio.wait(tasks, timeout=self._hedge_after(primary))
+            if not done:
+                logger.info(
+                    "%s is slow, hedging the request with %s after %.1fs",
+                    primary,
+                    backup,
+                    self._hedge_after(primary),
+                )
+                hedge_task = asyncio.create_task(self._call_model(request, backup))
+                self.stats[backup].hedges += 1
+                tasks.add(hedge_task)
+
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge_task:
+                            self.stats[backup].hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+                if not tasks:
+                    raise error
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _call_model(
+        self, request: Callable[[str], Awaitable[T]], model: str
+    ) -> T:
+        stats = self.stats[model]
+        breaker = self.breakers[model]
+
+        breaker.on_start()
+        stats.requests += 1
+        started = time.perf_counter()
+
+        try:
+            result = await request(model)
+        except asyncio.CancelledError:
+            breaker.release()
+            OPENROUTER_DURATION.labels(model, "cancelled").observe(
+                time.perf_counter() - started
+            )
+            raise
+        except Exception as e:
+            stats.record(False)
+            ERRORS.labels("openrouter", type(e).__name__).inc()
+            OPENROUTER_DURATION.labels(model, "error").observe(
+                time.perf_counter() - started
+            )
+            if is_retryable(e):
+                breaker.on_failure()
+                if breaker.state == "open":
+                    logger.warning(
+                        "Circuit breaker opened for %s after %d consecutive failures",
+                        model,
+                        breaker.failures,
+                    )
+            else:
+                breaker.release()
+            raise
+
+        latency = time.perf_counter() - started
+        stats.record(True, latency)
+        OPENROUTER_DURATION.labels(model, "ok").observe(latency)
+        breaker.on_success()
+        return result
+
+
+def is_retryable(error: BaseException) -> bool:
+    """!
+    @brief Проверяет, является ли ошибка временной, то есть стоит ли повторить запрос.
+    @details Временными считаются сетевые ошибки и таймауты, ответы 408, 409, 425,
+             429 и все ответы 5xx. Ошибки запроса (400, 401, 404) не повторяются.
+    """
+
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return isinstance(
+        error, (APIConnectionError, httpx.TransportError, asyncio.TimeoutError)
+    )
+
+
+def retry_after(error: BaseException) -> float | None:
+    """!
+    @brief Извлекает рекомендуемую задержку из заголовков ответа с ошибкой.
+    @details Поддерживаются `retry-after-ms` и `retry-after` в виде числа секунд
+             или HTTP-даты.
+    @return Задержка в секундах или `None`, если сервер ее не указал.
+    """
+
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+
+    if "retry-after-ms" in response.headers:
+        try:
+            return max(0.0, float(response.headers["retry-after-ms"]) / 1000)
+        except ValueError:
+            pass
+
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        moment = parsedate_to_datetime(value)
+        return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
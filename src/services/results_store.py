@@ -0,0 +1,377 @@
+##
+# @file results_store.py
+# @author Roman Moroz
+# @brief Хранилище результатов анализа и статистики по ним.
+# @details Раньше результат анализа существовал только в сообщении пользователя.
+#          Этот модуль сохраняет каждый результат в SQLite и поддерживает по ним
+#          агрегаты по пользователям и дням, на которых работают команды `/stats`
+#          и `/history`. Запись выполняется в фоне пачками, поэтому не добавляет
+#          задержки к ответу пользователю.
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from core.metrics import ERRORS, RESULTS_FLUSH
+from services.models import AnalysisResult, Tonality
+
+logger = logging.getLogger("call_assessment_bot")
+
+##
+# @var ALL_USERS
+# @brief Значение `user_id` строк `daily_stats` с итогами по всем пользователям.
+# @details Идентификаторы пользователей Telegram положительны, поэтому 0 свободен.
+ALL_USERS = 0
+
+_DAY = 24 * 60 * 60
+_TONALITIES = (Tonality.POSITIVE, Tonality.NEUTRAL, Tonality.NEGATIVE)
+
+
+@dataclass(frozen=True, slots=True)
+class StoredResult:
+    """!
+    @class StoredResult
+    @brief Один сохраненный анализ для команды `/history`.
+    """
+
+    created_at: float
+    result: AnalysisResult
+    latency: float
+
+
+@dataclass
+class StatsSummary:
+    """!
+    @class StatsSummary
+    @brief Сводная статистика анализов за период.
+    @details `daily` содержит пары (день в формате `YYYY-MM-DD`, число анализов)
+             в хронологическом порядке, только для дней с анализами.
+    """
+
+    days: int
+    total: int = 0
+    failed: int = 0
+    tonalities: dict[Tonality, int] = field(
+        default_factory=lambda: dict.fromkeys(Tonality, 0)
+    )
+    latency_sum: float = 0.0
+    daily: list[tuple[str, int]] = field(default_factory=list)
+
+    @property
+    def average_latency(self) -> float:
+        """!
+        @brief Среднее время от получения расшифровки до ответа, в секундах.
+        """
+
+        return self.latency_sum / self.total if self.total else 0.0
+
+
+class ResultsStore:
+    """!
+    @class ResultsStore
+    @brief Журнал результатов анализа в SQLite с агрегатами по дням.
+    @details
+    Хранилище состоит из двух таблиц:
+    - `analysis_results` — по строке на анализ (без текста расшифровки) с индексами
+      по пользователю, чату и времени; из нее `/history` читает последние записи
+      пользователя по индексу `(user_id, created_at)`;
+    - `daily_stats` — счетчики по паре (пользователь, день UTC): число анализов,
+      распределение тональностей, число ошибок и сумма задержек. Итоги по всем
+      пользователям хранятся там же под `user_id = ALL_USERS`. Счетчики
+      обновляются в той же транзакции, что и вставка результатов, поэтому
+      `/stats` читает не больше одной строки на день периода и не зависит ни
+      от размера журнала, ни от числа пользователей.
+
+    `record` не обращается к диску: результат кладется в очередь, а фоновая
+    задача записывает накопившиеся результаты одной транзакцией (групповая
+    фиксация) — когда набралось `batch_size` записей или прошло `flush_interval`
+    секунд с появления первой. Если диск не успевает и в очереди уже
+    `max_pending` результатов, новые результаты отбрасываются с предупреждением
+    в логе. При остановке (`close`) очередь дописывается до конца.
+
+    Файл можно разделять между несколькими процессами (воркеры вебхука и очереди):
+    SQLite в режиме WAL сериализует транзакции записи, а агрегаты обновляются
+    инкрементально через `INSERT ... ON CONFLICT DO UPDATE`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        max_pending: int = 10_000,
+    ):
+        """!
+        @brief Конструктор хранилища. Создает файл и таблицы, если их еще нет.
+        @param path [in] Путь к файлу SQLite.
+        @param batch_size [in] Максимальное число результатов в одной транзакции.
+        @param flush_interval [in] Максимальное время ожидания записи, в секундах.
+        @param max_pending [in] Максимальное число результатов, ожидающих записи.
+        """
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._queue: asyncio.Queue[tuple | None] = asyncio.Queue()
+        self._writer: asyncio.Task | None = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_results ("
+            " id INTEGER PRIMARY KEY,"
+            " user_id INTEGER NOT NULL,"
+            " chat_id INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " tonality TEXT,"
+            " recommendations TEXT NOT NULL,"
+            " error TEXT,"
+            " latency REAL NOT NULL,"
+            " transcript_chars INTEGER NOT NULL)"
+        )
+        for columns in ("user_id, created_at", "chat_id, created_at", "created_at"):
+            name = columns.replace(", ", "_")
+            self._db.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_analysis_results_{name}"
+                f" ON analysis_results ({columns})"
+            )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS daily_stats ("
+            " user_id INTEGER NOT NULL,"
+            " day TEXT NOT NULL,"
+            " total INTEGER NOT NULL,"
+            " positive INTEGER NOT NULL,"
+            " neutral INTEGER NOT NULL,"
+            " negative INTEGER NOT NULL,"
+            " failed INTEGER NOT NULL,"
+            " latency_sum REAL NOT NULL,"
+            " PRIMARY KEY (user_id, day)) WITHOUT ROWID"
+        )
+
+    @property
+    def pending(self) -> int:
+        """!
+        @brief Число результатов, ожидающих записи.
+        """
+
+        return self._queue.qsize()
+
+    async def start(self) -> None:
+        """!
+        @brief Запускает фоновую задачу записи.
+        """
+
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """!
+        @brief Дописывает все ожидающие результаты и закрывает файл.
+        """
+
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer is not None:
+            self._queue.put_nowait(None)
+            await self._writer
+        with self._lock:
+            self._db.close()
+
+    def record(
+        self,
+        *,
+        user_id: int,
+        chat_id: int,
+        result: AnalysisResult,
+        latency: float,
+        transcript_chars: int,
+        created_at: float | None = None,
+    ) -> None:
+        """!
+        @brief Ставит результат анализа в очередь на запись.
+        @details Не блокирует и не выбрасывает исключений: при переполнении очереди
+                 результат отбрасывается.
+        @param user_id [in] Пользователь, приславший расшифровку.
+        @param chat_id [in] Чат, в который отправлен ответ.
+        @param result [in] Результат анализа (в том числе неудачный).
+        @param latency [in] Время от получения расшифровки до ответа, в секундах.
+        @param transcript_chars [in] Длина расшифровки в символах.
+        @param created_at [in] Время анализа (Unix time); по умолчанию — текущее.
+        """
+
+        if self._closed:
+            return
+        if self._queue.qsize() >= self.max_pending:
+            logger.warning("Results store is falling behind, dropping a result")
+            ERRORS.labels("results_store", "QueueFull").inc()
+            return
+
+        self._queue.put_nowait(
+            (
+                user_id,
+                chat_id,
+                time.time() if created_at is None else created_at,
+                result.tonality.value if result.tonality else None,
+                json.dumps(list(result.recommendations), ensure_ascii=False),
+                result.error,
+                latency,
+                transcript_chars,
+            )
+        )
+
+    async def stats(self, user_id: int | None, days: int) -> StatsSummary:
+        """!
+        @brief Возвращает статистику за последние `days` дней (включая сегодня).
+        @param user_id [in] Пользователь или `None` для статистики по всем пользователям.
+        @param days [in] Длина периода в днях.
+        """
+
+        return await asyncio.to_thread(self._stats, user_id, days)
+
+    async def history(self, user_id: int, limit: int) -> list[StoredResult]:
+        """!
+        @brief Возвращает последние анализы пользователя, начиная с самого нового.
+        @param user_id [in] Пользователь.
+        @param limit [in] Максимальное число записей.
+        """
+
+        return await asyncio.to_thread(self._history, user_id, limit)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch = []
+            row = await self._queue.get()
+            deadline = loop.time() + self.flush_interval
+            while True:
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    break
+                if not self._queue.empty():
+                    row = self._queue.get_nowait()
+                    continue
+                try:
+                    row = await asyncio.wait_for(
+                        self._queue.get(), deadline - loop.time()
+                    )
+                except asyncio.TimeoutError:
+                    break
+
+            if batch:
+                await self._flush(batch)
+
+    async def _flush(self, batch: list[tuple]) -> None:
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except Exception as e:
+            logger.error("Failed to write %d analysis results: %s", len(batch), e)
+            ERRORS.labels("results_store", type(e).__name__).inc()
+            return
+        RESULTS_FLUSH.observe(time.perf_counter() - started)
+        logger.debug("Wrote %d analysis results", len(batch))
+
+    def _write(self, batch: list[tuple]) -> None:
+        totals: dict[tuple[int, str], list] = {}
+        for user_id, _, created_at, tonality, _, error, latency, _ in batch:
+            day = _day(created_at)
+            parsed = Tonality.parse(tonality)
+            if parsed is None or error is not None:
+                column = 4
+            else:
+                column = 1 + _TONALITIES.index(parsed)
+            for key in ((user_id, day), (ALL_USERS, day)):
+                counts = totals.setdefault(key, [0, 0, 0, 0, 0, 0.0])
+                counts[0] += 1
+                counts[column] += 1
+                counts[5] += latency
+
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany(
+                    "INSERT INTO analysis_results (user_id, chat_id, created_at,"
+                    " tonality, recommendations, error, latency, transcript_chars)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    batch,
+                )
+                self._db.executemany(
+                    "INSERT INTO daily_stats (user_id, day, total, positive, neutral,"
+                    " negative, failed, latency_sum) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (user_id, day) DO UPDATE SET"
+                    " total = total + excluded.total,"
+                    " positive = positive + excluded.positive,"
+                    " neutral = neutral + excluded.neutral,"
+                    " negative = negative + excluded.negative,"
+                    " failed = failed + excluded.failed,"
+                    " latency_sum = latency_sum + excluded.latency_sum",
+                    [(*key, *counts) for key, counts in totals.items()],
+                )
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _stats(self, user_id: int | None, days: int) -> StatsSummary:
+        since = _day(time.time() - (days - 1) * _DAY)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT day, total, positive, neutral, negative, failed, latency_sum"
+                " FROM daily_stats WHERE user_id = ? AND day >= ? ORDER BY day",
+                (ALL_USERS if user_id is None else user_id, since),
+            ).fetchall()
+
+        summary = StatsSummary(days)
+        for day, total, positive, neutral, negative, failed, latency_sum in rows:
+            summary.total += total
+            summary.failed += failed
+            summary.latency_sum += latency_sum
+            for tonality, count in zip(_TONALITIES, (positive, neutral, negative)):
+                summary.tonalities[tonality] += count
+            summary.daily.append((day, total))
+        return summary
+
+    def _history(self, user_id: int, limit: int) -> list[StoredResult]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT created_at, tonality, recommendations, error, latency"
+                " FROM analysis_results WHERE user_id = ?"
+                " ORDER BY created_at DESC LIMIT ?",
+                (user_id, limit),
+            ).fetchall()
+
+        return [
+            StoredResult(
+                created_at,
+                AnalysisResult(
+                    tonality=Tonality.parse(tonality),
+                    recommendations=tuple(json.loads(recommendations)),
+                    error=error,
+                ),
+                latency,
+            )
+            for created_at, tonality, recommendations, error, latency in rows
+        ]
+
+
+def _day(timestamp: float) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(timestamp))
@@ -0,0 +1,240 @@
+##
+# @file scheduler.py
+# @author Roman Moroz
+# @brief Планировщик задач анализа с ограничением параллелизма.
+# @details Этот модуль содержит класс `AnalysisScheduler`, который стоит между
+#          хендлерами и `CallAnalyzer`. Он ограничивает общее число одновременных
+#          запросов к модели, не дает одному пользователю занять все слоты
+#          и обслуживает очереди пользователей по кругу (round-robin), чтобы
+#          всплеск сообщений от одного человека не задерживал остальных.
+
+import asyncio
+import logging
+import time
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from core.metrics import QUEUE_WAIT
+
+logger = logging.getLogger("call_assessment_bot")
+
+
+class QueueFullError(Exception):
+    """!
+    @class QueueFullError
+    @brief Исключение, выбрасываемое, когда очередь планировщика заполнена.
+    @details Хендлер перехватывает его и сообщает пользователю, что нужно повторить
+             запрос позже, вместо того чтобы бесконечно накапливать задачи.
+    """
+
+    def __init__(self, depth: int):
+        super().__init__(f"Analysis queue is full ({depth} jobs waiting)")
+        self.depth = depth
+
+
+@dataclass
+class SchedulerStats:
+    """!
+    @class SchedulerStats
+    @brief Счетчики работы планировщика: принятые, отклоненные задачи и время ожидания.
+    """
+
+    submitted: int = 0
+    rejected: int = 0
+    started: int = 0
+    completed: int = 0
+    total_wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+
+    @property
+    def avg_wait_seconds(self) -> float:
+        """!
+        @brief Среднее время ожидания задачи в очереди, в секундах.
+        """
+
+        return self.total_wait_seconds / self.started if self.started else 0.0
+
+
+class ScheduledJob:
+    """!
+    @class ScheduledJob
+    @brief Задача, принятая планировщиком.
+    @details Объект можно ожидать через `await`, чтобы получить результат фабрики.
+             Поле `position` содержит примерную позицию в очереди на момент постановки
+             (0 — задача запущена сразу).
+    """
+
+    __slots__ = ("user_id", "factory", "limit", "future", "enqueued_at", "position")
+
+    def __init__(
+        self,
+        user_id: int,
+        factory: Callable[[], Awaitable[Any]],
+        limit: int | None = None,
+    ):
+        self.user_id = user_id
+        self.factory = factory
+        self.limit = limit
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        self.position = 0
+
+    def __await__(self):
+        return self.future.__await__()
+
+
+class AnalysisScheduler:
+    """!
+    @class AnalysisScheduler
+    @brief Справедливый планировщик задач анализа с ограниченной очередью.
+    @details
+    Каждый пользователь имеет собственную очередь задач. Диспетчеризация выполняется
+    по событиям (постановка задачи или завершение предыдущей), без фоновых воркеров:
+    пока есть свободные глобальные слоты, планировщик обходит пользователей по кругу
+    и запускает по одной задаче у тех, кто не превысил личный лимит одновременных
+    запросов. Общее число ожидающих задач ограничено, что дает обратное давление
+    (backpressure) вместо неограниченного роста очереди.
+    """
+
+    def __init__(self, max_concurrency: int, per_user_limit: int, max_queue_size: int):
+        """!
+        @brief Конструктор планировщика.
+        @param max_concurrency [in] Максимальное число одновременно выполняемых задач.
+        @param per_user_limit [in] Максимальное число одновременных задач одного пользователя.
+        @param max_queue_size [in] Максимальное число задач, ожидающих запуска.
+        """
+
+        self.max_concurrency = max_concurrency
+        self.per_user_limit = per_user_limit
+        self.max_queue_size = max_queue_size
+        self.stats = SchedulerStats()
+
+        self._pending: dict[int, deque[ScheduledJob]] = {}
+        self._rotation: deque[int] = deque()
+        self._in_flight: dict[int, int] = {}
+        self._running = 0
+        self._queued = 0
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def queue_depth(self) -> int:
+        """!
+        @brief Число задач, ожидающих запуска.
+        """
+
+        return self._queued
+
+    @property
+    def in_flight(self) -> int:
+        """!
+        @brief Число задач, выполняющихся в данный момент.
+        """
+
+        return self._running
+
+    def submit(
+        self,
+        user_id: int,
+        factory: Callable[[], Awaitable[Any]],
+        limit: int | None = None,
+    ) -> ScheduledJob:
+        """!
+        @brief Ставит задачу в очередь пользователя.
+        @param user_id [in] Идентификатор пользователя Telegram.
+        @param factory [in] Функция без аргументов, возвращающая корутину анализа.
+        @param limit [in] Лимит одновременных задач пользователя для этой задачи
+               вместо `per_user_limit` (например, для пакетной обработки).
+        @return ScheduledJob: объект, который можно ожидать для получения результата.
+        @throw QueueFullError Если очередь заполнена.
+        """
+
+        if self._queued >= self.max_queue_size:
+            self.stats.rejected += 1
+            raise QueueFullError(self._queued)
+
+        job = ScheduledJob(user_id, factory, limit)
+        queue = self._pending.get(user_id)
+        if queue is None:
+            queue = self._pending[user_id] = deque()
+            self._rotation.append(user_id)
+        queue.append(job)
+        self._queued += 1
+        self.stats.submitted += 1
+
+        self._dispatch()
+
+        if not job.future.done() and job in queue:
+            job.position = self._estimate_position(user_id, queue.index(job))
+        return job
+
+    def _estimate_position(self, user_id: int, index: int) -> int:
+        # При круговом обходе перед задачей с индексом `index` успеют запуститься
+        # не более `index + 1` задач каждого из остальных пользователей.
+        ahead = index
+        for other_id, queue in self._pending.items():
+            if other_id != user_id:
+                ahead += min(len(queue), index + 1)
+        return ahead + 1
+
+    def _dispatch(self) -> None:
+        skipped = 0
+        while self._running < self.max_concurrency and skipped < len(self._rotation):
+            user_id = self._rotation.popleft()
+            queue = self._pending[user_id]
+            limit = queue[0].limit or self.per_user_limit
+
+            if self._in_flight.get(user_id, 0) >= limit:
+                self._rotation.append(user_id)
+                skipped += 1
+                continue
+
+            job = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._rotation.append(user_id)
+            else:
+                del self._pending[user_id]
+            skipped = 0
+
+            if job.future.cancelled():
+                continue
+
+            self._start(job)
+
+    def _start(self, job: ScheduledJob) -> None:
+        wait = time.monotonic() - job.enqueued_at
+        self.stats.started += 1
+        self.stats.total_wait_seconds += wait
+        self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, wait)
+        QUEUE_WAIT.observe(wait)
+
+        self._running += 1
+        self._in_flight[job.user_id] = self._in_flight.get(job.user_id, 0) + 1
+
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: ScheduledJob) -> None:
+        try:
+            result = await job.factory()
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._running -= 1
+            self.stats.completed += 1
+            remaining = self._in_flight[job.user_id] - 1
+            if remaining:
+                self._in_flight[job.user_id] = remaining
+            else:
+                del self._in_flight[job.user_id]
+            self._dispatch()
@@ -0,0 +1,207 @@
+##
+# @file tonality.py
+# @author Roman Moroz
+# @brief Быстрая локальная оценка тональности расшифровки по словарю.
+# @details Этот модуль содержит класс `LexiconScorer`, который за микросекунды
+#          (для длинных расшифровок — за единицы миллисекунд) и без обращения
+#          к сети оценивает тональность русскоязычного диалога. Оценка используется
+#          как предварительная: пользователь видит ее сразу, пока модель готовит
+#          полный ответ, а для очевидных случаев запрос можно отправить более
+#          дешевой модели (см. `TONALITY_FAST_PATH`).
+
+import logging
+import re
+
+from dataclasses import dataclass
+from pathlib import Path
+
+from services.models import Tonality
+
+logger = logging.getLogger("call_assessment_bot")
+
+##
+# @var LEXICON
+# @brief Встроенный словарь: основа слова и ее вес.
+# @details Положительный вес — признак позитивной тональности, отрицательный —
+#          негативной. Основы подобраны под разговоры колл-центра; вежливые формулы,
+#          которые звучат почти в каждом звонке ("спасибо", "извините"), имеют малый вес.
+LEXICON = {
+    # Позитивные
+    "благодар": 1.0,
+    "спасиб": 0.4,
+    "отличн": 1.0,
+    "прекрасн": 1.0,
+    "замечательн": 1.0,
+    "великолепн": 1.0,
+    "превосходн": 1.0,
+    "хорош": 0.6,
+    "довол": 1.0,
+    "радует": 0.8,
+    "обрадова": 0.8,
+    "приятн": 0.8,
+    "вежлив": 0.8,
+    "удобн": 0.6,
+    "понравил": 1.0,
+    "нрав": 0.6,
+    "супер": 1.0,
+    "класс": 0.8,
+    "помогл": 0.8,
+    "решил": 0.3,
+    "решен": 0.4,
+    "оперативн": 0.8,
+    "быстро": 0.4,
+    "профессиональн": 0.8,
+    "внимательн": 0.6,
+    "идеальн": 1.0,
+    "восторг": 1.0,
+    # Негативные
+    "ужасн": -1.0,
+    "отвратительн": -1.0,
+    "кошмар": -1.0,
+    "безобраз": -1.0,
+    "возмут": -1.0,
+    "недовол": -1.0,
+    "жалоб": -0.8,
+    "претензи": -0.8,
+    "обман": -1.0,
+    "надоел": -1.0,
+    "беси": -1.0,
+    "раздража": -1.0,
+    "хамств": -1.0,
+    "хам": -0.8,
+    "груб": -0.8,
+    "плох": -0.8,
+    "разочарова": -1.0,
+    "некомпетентн": -1.0,
+    "издевательств": -1.0,
+    "позор": -1.0,
+    "требую": -0.8,
+    "в суд": -1.0,
+    "верните": -0.6,
+    "сломал": -0.6,
+    "задерж": -0.4,
+    "опозда": -0.4,
+    "проблем": -0.3,
+    "ошибк": -0.3,
+    "долго": -0.4,
+    "бесполезн": -1.0,
+    "отврат": -1.0,
+    "мошенни": -1.0,
+    "никогда": -0.4,
+    "хуже": -0.8,
+    "худш": -1.0,
+    "неудобн": -0.6,
+    "невозможн": -0.6,
+}
+
+##
+# @var NEGATIONS
+# @brief Слова, меняющие знак следующего оценочного слова ("не помогли").
+NEGATIONS = ("не", "ни", "нет", "без")
+
+##
+# @var NEGATION_FACTOR
+# @brief Множитель веса оценочного слова после отрицания.
+# @details Отрицание позитивного слова — явный негатив ("не помогли"),
+#          а отрицание негативного — лишь слабый позитив ("без проблем").
+NEGATION_FACTOR = {True: -0.8, False: -0.4}
+
+##
+# @var POLARITY_THRESHOLD
+# @brief Порог нормированной оценки, за которым тональность считается не нейтральной.
+POLARITY_THRESHOLD = 0.2
+
+##
+# @var SMOOTHING
+# @brief Сглаживание оценки: при малом числе совпадений она остается близкой к нулю.
+SMOOTHING = 1.0
+
+
+@dataclass(frozen=True, slots=True)
+class ToneEstimate:
+    """!
+    @class ToneEstimate
+    @brief Результат локальной оценки тональности.
+    @details `score` лежит в интервале (-1, 1): знак задает направление, модуль — силу.
+             `confidence` — эвристическая уверенность от 0 до 1; для нейтральной
+             тональности она не превышает 0.5, поэтому нейтральные диалоги никогда
+             не считаются очевидными.
+    """
+
+    tonality: Tonality
+    confidence: float
+    score: float
+    hits: int
+
+
+class LexiconScorer:
+    """!
+    @class LexiconScorer
+    @brief Оценивает тональность текста по словарю основ слов с учетом отрицаний.
+    @details
+    Все основы собираются в одно регулярное выражение, поэтому текст
+    просматривается за один проход внутри движка `re` (на C), а в Python
+    обрабатываются только найденные оценочные слова. Положительные и отрицательные
+    веса суммируются отдельно, а итоговая оценка равна
+    `(pos - neg) / (pos + neg + SMOOTHING)`.
+    """
+
+    def __init__(self, lexicon: dict[str, float]):
+        """!
+        @brief Конструктор. Компилирует словарь в регулярное выражение.
+        @param lexicon [in] Словарь "основа слова → вес".
+        """
+
+        self.lexicon = {stem.lower(): weight for stem, weight in lexicon.items()}
+        stems = sorted(self.lexicon, key=len, reverse=True)
+        self._pattern = re.compile(
+            r"(?:\b(?P<neg>"
+            + "|".join(NEGATIONS)
+            + r")\s+(?:\w+\s+)?)?\b(?P<stem>"
+            + "|".join(map(re.escape, stems))
+            + r")\w*"
+        )
+
+    @classmethod
+    def from_file(cls, path: str | None) -> "LexiconScorer":
+        """!
+        @brief Создает оценщик со встроенным словарем, дополненным словарем из файла.
+        @param path [in] Путь к TSV-файлу со строками `основа<TAB>вес` или `None`.
+        """
+
+        lexicon = dict(LEXICON)
+        if path:
+            for line in Path(path).read_text(encoding="utf-8").splitlines():
+                if not line.strip() or line.startswith("#"):
+                    continue
+                stem, weight = line.split("\t")
+                lexicon[stem.strip()] = float(weight)
+            logger.info("Loaded tonality lexicon with %d stems", len(lexicon))
+        return cls(lexicon)
+
+    def score(self, text: str) -> ToneEstimate:
+        """!
+        @brief Оценивает тональность текста.
+        @param text [in] Текст расшифровки.
+        @return ToneEstimate: тональность, уверенность, оценка и число совпадений.
+        """
+
+        positive = negative = 0.0
+        hits = 0
+        for match in self._pattern.finditer(text.lower()):
+            weight = self.lexicon[match["stem"]]
+            if match["neg"]:
+                weight *= NEGATION_FACTOR[weight > 0]
+            if weight > 0:
+                positive += weight
+            else:
+                negative -= weight
+            hits += 1
+
+        score = (positive - negative) / (positive + negative + SMOOTHING)
+        if score >= POLARITY_THRESHOLD:
+            return ToneEstimate(Tonality.POSITIVE, score, score, hits)
+        if score <= -POLARITY_THRESHOLD:
+            return ToneEstimate(Tonality.NEGATIVE, -score, score, hits)
+        confidence = 0.5 * (1 - abs(score) / POLARITY_THRESHOLD)
+        return ToneEstimate(Tonality.NEUTRAL, confidence, score, hits)
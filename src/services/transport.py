@@ -0,0 +1,54 @@
+##
+# @file transport.py
+# @author Roman Moroz
+# @brief Настройка HTTP-транспорта для запросов к OpenRouter.
+# @details Этот модуль создает явно сконфигурированный `httpx.AsyncClient`:
+#          с поддержкой HTTP/2, пулом соединений заданного размера, временем жизни
+#          простаивающих keep-alive соединений и раздельными таймаутами. Клиент
+#          передается в `AsyncOpenAI`, поэтому все запросы к модели используют
+#          одни и те же заранее установленные соединения.
+
+import httpx
+
+from config.config import settings
+
+
+def build_timeout() -> httpx.Timeout:
+    """!
+    @brief Создает набор таймаутов для запросов к модели из настроек приложения.
+    @details Таймаут установки соединения намеренно короче таймаута чтения:
+             недоступный сервер должен обнаруживаться быстро, а генерация
+             длинного ответа может занимать десятки секунд.
+    @return httpx.Timeout: таймауты соединения, чтения, записи и ожидания пула.
+    """
+
+    return httpx.Timeout(
+        settings.HTTP_READ_TIMEOUT,
+        connect=settings.HTTP_CONNECT_TIMEOUT,
+        pool=settings.HTTP_CONNECT_TIMEOUT,
+    )
+
+
+def build_http_client() -> httpx.AsyncClient:
+    """!
+    @brief Создает HTTP-клиент с пулом соединений для запросов к OpenRouter.
+    @details
+    - <b>HTTP/2:</b> все параллельные запросы мультиплексируются в одном
+      TCP/TLS-соединении, что экономит время на рукопожатиях.
+    - <b>Пул соединений:</b> ограничивает общее число соединений и число
+      простаивающих keep-alive соединений.
+    - <b>keepalive_expiry:</b> простаивающее соединение закрывается через
+      заданное время, чтобы не упираться в обрывы со стороны сервера.
+    @note Клиент нужно закрывать через `aclose()` при остановке приложения.
+    @return httpx.AsyncClient: настроенный асинхронный клиент.
+    """
+
+    return httpx.AsyncClient(
+        http2=settings.HTTP2_ENABLED,
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=build_timeout(),
+    )
@@ -0,0 +1,288 @@
+##
+# @file worker.py
+# @author Roman Moroz
+# @brief Точка входа рабочих процессов, выполняющих задачи анализа из очереди.
+# @details В режиме `ANALYSIS_MODE=queue` бот (`main.py`) только принимает сообщения
+#          и кладет задачи в очередь (`services.job_queue`). Этот скрипт запускает
+#          `JOB_WORKERS` процессов, каждый из которых одновременно выполняет до
+#          `JOB_WORKER_CONCURRENCY` задач: анализирует расшифровку через
+#          `CallAnalyzer` и заменяет сообщение "Диалог в очереди..." результатом.
+#          Воркеры можно запускать на нескольких машинах (с Redis в качестве очереди)
+#          и перезапускать в любой момент: незавершенные задачи упавшего воркера
+#          после истечения аренды выполнит другой.
+#
+#          Запуск из каталога `src/`: `python worker.py`
+
+import asyncio
+import logging
+import multiprocessing
+import signal
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from config.config import settings
+from core.container import container
+from core.logger import setup_logger
+from core.metrics import ERRORS, QUEUE_WAIT, start_metrics_server
+from main import create_bot
+from services.formatter import render_reply
+from services.job_queue import Job, create_job_queue
+from services.models import AnalysisResult
+
+logger = logging.getLogger("call_assessment_bot")
+
+
+class AnalysisWorker:
+    """!
+    @class AnalysisWorker
+    @brief Цикл выполнения задач анализа в одном рабочем процессе.
+    @details
+    Каждая из `concurrency` сопрограмм по кругу берет задачу из очереди,
+    выполняет ее и, если очередь пуста, ждет `poll_interval` секунд. Пока задача
+    выполняется, фоновая задача продлевает ее аренду.
+
+    Неудачный анализ (или ошибка Telegram) не теряется: задача возвращается
+    в очередь с удваивающейся задержкой, а после `max_attempts` попыток
+    пользователь получает сообщение об ошибке, и задача хоронится. Доставка
+    результата — "не менее одного раза": если воркер упал после ответа
+    пользователю, но до удаления задачи, ответ может прийти повторно; правка,
+    которая ничего не меняет, пропускается. Результат, который Telegram
+    не смог разобрать как Markdown, отправляется простым текстом.
+    """
+
+    def __init__(
+        self,
+        queue,
+        bot: Bot,
+        *,
+        concurrency: int,
+        poll_interval: float,
+        max_attempts: int,
+        retry_delay: float,
+    ):
+        """!
+        @brief Конструктор воркера.
+        @param queue [in] Очередь задач (`SQLiteJobQueue` или `RedisJobQueue`).
+        @param bot [in] Бот для отправки результатов пользователям.
+        """
+
+        self.queue = queue
+        self.bot = bot
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._stopping = asyncio.Event()
+
+    async def run(self) -> None:
+        """!
+        @brief Выполняет задачи, пока не будет вызван `stop()`.
+        @details После `stop()` новые задачи не берутся, а начатые доводятся до конца.
+        """
+
+        async with asyncio.TaskGroup() as group:
+            for _ in range(self.concurrency):
+                group.create_task(self._loop())
+
+    def stop(self) -> None:
+        """!
+        @brief Просит воркер завершиться после текущих задач.
+        """
+
+        self._stopping.set()
+
+    async def _loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                job = await self.queue.claim()
+            except Exception as e:
+                logger.error("Failed to claim a job: %s", e)
+                ERRORS.labels("job_queue", type(e).__name__).inc()
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._process(job)
+            except Exception as e:
+                # Задача осталась захваченной и вернется в очередь после
+                # JOB_VISIBILITY_TIMEOUT; воркер продолжает работу.
+                logger.error("Failed to settle job %s: %s", job.id, e)
+                ERRORS.labels("job_queue", type(e).__name__).inc()
+
+    async def _process(self, job: Job) -> None:
+        logger.info(
+            "Processing job %s for user %s, attempt %d",
+            job.id,
+            job.user_id,
+            job.attempts,
+        )
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            if job.attempts > self.max_attempts:
+                result = AnalysisResult.failed("too many attempts")
+            else:
+                if job.attempts == 1:
+                    QUEUE_WAIT.observe(max(0.0, time.time() - job.enqueued_at))
+                result = await container.analyzer.analyze_call(job.transcript)
+
+            if not result.ok and job.attempts < self.max_attempts:
+                await self._retry(job, result.error)
+                return
+
+            await self._reply(job, result)
+            if container.results_store is not None:
+                container.results_store.record(
+                    user_id=job.user_id,
+                    chat_id=job.chat_id,
+                    result=result,
+                    latency=max(0.0, time.time() - job.enqueued_at),
+                    transcript_chars=len(job.transcript),
+                )
+            if result.ok:
+                await self.queue.complete(job)
+            else:
+                logger.error("Job %s failed permanently: %s", job.id, result.error)
+                await self.queue.bury(job, result.error or "analysis failed")
+        except TelegramRetryAfter as e:
+            await self.queue.retry(job, e.retry_after, str(e))
+        except Exception as e:
+            logger.exception("Job %s failed: %s", job.id, e)
+            ERRORS.labels("worker", type(e).__name__).inc()
+            if job.attempts < self.max_attempts:
+                await self._retry(job, str(e) or type(e).__name__)
+            else:
+                await self.queue.bury(job, str(e) or type(e).__name__)
+        finally:
+            heartbeat.cancel()
+
+    async def _retry(self, job: Job, error: str | None) -> None:
+        delay = self.retry_delay * 2 ** (job.attempts - 1)
+        logger.warning("Job %s will be retried in %.0fs: %s", job.id, delay, error)
+        await self.queue.retry(job, delay, error or "analysis failed")
+
+    async def _reply(self, job: Job, result: AnalysisResult) -> None:
+        text = render_reply(result)
+        try:
+            await self.bot.edit_message_text(
+                text,
+                chat_id=job.chat_id,
+                message_id=job.message_id,
+                parse_mode="Markdown",
+            )
+        except TelegramBadRequest as e:
+            if "message is not modified" in e.message:
+                # Повторная доставка: сообщение уже содержит этот результат.
+                logger.debug("Skipping result edit for job %s: %s", job.id, e)
+            elif "can't parse entities" in e.message:
+                logger.warning(
+                    "Result of job %s is not valid Markdown, sending plain text: %s",
+                    job.id,
+                    e,
+                )
+                await self.bot.edit_message_text(
+                    text, chat_id=job.chat_id, message_id=job.message_id
+                )
+            else:
+                raise
+        logger.info("Finished job %s for user %s", job.id, job.user_id)
+
+    async def _heartbeat(self, job: Job) -> None:
+        interval = self.queue.visibility_timeout / 3
+        while True:
+            await asyncio.sleep(interval)
+            if not await self.queue.touch(job):
+                logger.warning("Lost the lease on job %s", job.id)
+                return
+
+
+async def run_worker(index: int = 0) -> None:
+    """!
+    @brief Запускает один рабочий процесс до получения SIGINT или SIGTERM.
+    @param index [in] Номер процесса; определяет порт метрик и имя файла логов.
+    """
+
+    setup_logger(f"worker-{index}")
+    queue = create_job_queue()
+    bot = create_bot(max(1, settings.JOB_WORKERS))
+    worker = AnalysisWorker(
+        queue,
+        bot,
+        concurrency=settings.JOB_WORKER_CONCURRENCY,
+        poll_interval=settings.JOB_POLL_INTERVAL,
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+        retry_delay=settings.JOB_RETRY_DELAY,
+    )
+
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, worker.stop)
+
+    await container.start()
+    metrics = None
+    if settings.METRICS_ENABLED:
+        metrics = await start_metrics_server(
+            settings.METRICS_HOST, settings.JOB_WORKER_METRICS_PORT + index
+        )
+
+    logger.info(
+        "Worker %d started with %d concurrent jobs",
+        index,
+        settings.JOB_WORKER_CONCURRENCY,
+    )
+    try:
+        await worker.run()
+    finally:
+        await container.close()
+        await bot.session.close()
+        queue.close()
+        if metrics is not None:
+            await metrics.cleanup()
+        logger.info("Worker %d stopped.", index)
+
+
+def _serve(index: int) -> None:
+    asyncio.run(run_worker(index))
+
+
+def main() -> None:
+    """!
+    @brief Запускает `JOB_WORKERS` рабочих процессов и ждет их завершения.
+    @details Как и воркеры вебхука, процессы создаются методом `spawn`. SIGTERM,
+             полученный главным процессом, передается всем воркерам, и они
+             завершаются после текущих задач.
+    """
+
+    if settings.JOB_WORKERS <= 1:
+        _serve(0)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=_serve, args=(index,), name=f"worker-{index}")
+        for index in range(settings.JOB_WORKERS)
+    ]
+    for worker in workers:
+        worker.start()
+
+    def forward(signum, frame):
+        for worker in workers:
+            worker.terminate()
+
+    signal.signal(signal.SIGTERM, forward)
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except (KeyboardInterrupt, SystemExit):
+        logging.getLogger("call_assessment_bot").info("Workers stopped manually.")
@@ -0,0 +1,45 @@
+##
+# @file conftest.py
+# @author Roman Moroz
+# @brief Общие фикстуры тестов.
+# @details Тесты запускаются из корня репозитория командой `pytest`. Модули бота
+#          импортируются из `src/`, а настройки читаются из окружения, которое
+#          каждый тест задает через фикстуру `configure`.
+
+import os
+import sys
+
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+os.environ.setdefault("BOT_TOKEN", "0:test")
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+os.environ.setdefault("RESULTS_ENABLED", "false")
+
+from config.config import get_settings  # noqa: E402
+
+
+@pytest.fixture
+def configure(monkeypatch):
+    """!
+    @brief Задает переменные окружения и перечитывает настройки.
+    @details По умолчанию анализ идет через `FakeBackend` без кэша и без
+             пакетных запросов; тест может переопределить любые настройки.
+    """
+
+    def apply(**env):
+        defaults = {
+            "ANALYSIS_BACKEND": "fake",
+            "CACHE_ENABLED": "false",
+            "MICROBATCH_ENABLED": "false",
+            "RETRY_BASE_DELAY": "0",
+        }
+        for name, value in {**defaults, **env}.items():
+            monkeypatch.setenv(name, str(value))
+        get_settings.cache_clear()
+        return get_settings()
+
+    yield apply
+    get_settings.cache_clear()
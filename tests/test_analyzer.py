@@ -0,0 +1,158 @@
+import asyncio
+import json
+
+from services.analyzer import CallAnalyzer
+from services.backends import Completion, FakeBackend
+from services.models import Tonality
+
+POSITIVE = "Клиент: спасибо большое, все отлично, я очень доволен обслуживанием"
+
+
+def transcripts(count: int) -> list[str]:
+    return [f"{POSITIVE}. Звонок номер {index}." for index in range(count)]
+
+
+class DroppingBackend(FakeBackend):
+    """!
+    @brief Отвечает на пакетный запрос без результата для первой расшифровки.
+    """
+
+    async def complete(self, model, messages, **options):
+        completion = await super().complete(model, messages, **options)
+        if not messages[-1]["content"].startswith("["):
+            return completion
+        answer = json.loads(completion.text)
+        answer["results"] = answer["results"][1:]
+        return Completion(
+            json.dumps(answer, ensure_ascii=False),
+            completion.prompt_tokens,
+            completion.completion_tokens,
+        )
+
+
+class FailingBatchBackend(FakeBackend):
+    """!
+    @brief Отвечает ошибкой на любой пакетный запрос.
+    """
+
+    async def complete(self, model, messages, **options):
+        if messages[-1]["content"].startswith("["):
+            self.requests += 1
+            raise RuntimeError("batch failed")
+        return await super().complete(model, messages, **options)
+
+
+def analyze_all(analyzer: CallAnalyzer, texts: list[str]):
+    async def scenario():
+        if analyzer.batcher is not None:
+            # Запросы приходят чаще, чем раз в MICROBATCH_MAX_WAIT.
+            analyzer.batcher._interval = 0.001
+        try:
+            return await asyncio.gather(*(analyzer.analyze_call(t) for t in texts))
+        finally:
+            await analyzer.close()
+
+    return asyncio.run(scenario())
+
+
+def test_fake_backend_analysis(configure):
+    configure()
+    backend = FakeBackend()
+    [result] = analyze_all(CallAnalyzer(backend=backend), [POSITIVE])
+
+    assert result.ok
+    assert result.tonality is Tonality.POSITIVE
+    assert len(result.recommendations) == 2
+    assert backend.requests == 1
+
+
+def test_repeated_transcript_is_served_from_cache(configure):
+    configure(CACHE_ENABLED="true")
+    backend = FakeBackend()
+    analyzer = CallAnalyzer(backend=backend)
+
+    async def scenario():
+        first = await analyzer.analyze_call(POSITIVE)
+        second = await analyzer.analyze_call(POSITIVE)
+        await analyzer.close()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert second == first
+    assert backend.requests == 1
+    assert analyzer.cache.stats.hits == 1
+    assert analyzer.cache.stats.saved_tokens > 0
+
+
+def test_disk_cache_hit_without_memory_tier(configure, tmp_path):
+    configure(
+        CACHE_ENABLED="true",
+        CACHE_MAX_ENTRIES="0",
+        CACHE_DB_PATH=str(tmp_path / "cache.sqlite3"),
+    )
+    backend = FakeBackend()
+    analyzer = CallAnalyzer(backend=backend)
+
+    async def scenario():
+        await analyzer.analyze_call(POSITIVE)
+        result = await analyzer.analyze_call(POSITIVE)
+        await analyzer.close()
+        return result
+
+    assert asyncio.run(scenario()).ok
+    assert backend.requests == 1
+    assert analyzer.cache.stats.disk_hits == 1
+
+
+def test_cache_failure_is_not_fatal(configure):
+    configure(CACHE_ENABLED="true")
+    backend = FakeBackend()
+    analyzer = CallAnalyzer(backend=backend)
+
+    async def broken_get(key):
+        raise OSError("disk is gone")
+
+    analyzer.cache.get = broken_get
+    [result] = analyze_all(analyzer, [POSITIVE])
+    assert result.ok
+    assert backend.requests == 1
+
+
+def test_concurrent_transcripts_are_batched(configure):
+    configure(MICROBATCH_ENABLED="true", MICROBATCH_MAX_SIZE="4")
+    backend = FakeBackend()
+    results = analyze_all(CallAnalyzer(backend=backend), transcripts(8))
+
+    assert all(result.ok for result in results)
+    assert {result.tonality for result in results} == {Tonality.POSITIVE}
+    assert backend.requests == 2
+
+
+def test_missing_batch_result_falls_back_to_single_request(configure):
+    configure(MICROBATCH_ENABLED="true", MICROBATCH_MAX_SIZE="4")
+    backend = DroppingBackend()
+    results = analyze_all(CallAnalyzer(backend=backend), transcripts(4))
+
+    assert all(result.ok for result in results)
+    # Один пакетный запрос и один отдельный для пропущенной расшифровки.
+    assert backend.requests == 2
+
+
+def test_failed_batch_falls_back_for_every_transcript(configure):
+    configure(
+        MICROBATCH_ENABLED="true", MICROBATCH_MAX_SIZE="4", RETRY_MAX_ATTEMPTS="1"
+    )
+    backend = FailingBatchBackend()
+    results = analyze_all(CallAnalyzer(backend=backend), transcripts(4))
+
+    assert all(result.ok for result in results)
+    assert backend.requests == 1 + 4
+
+
+def test_long_transcripts_bypass_the_batcher(configure):
+    configure(MICROBATCH_ENABLED="true", MICROBATCH_MAX_ITEM_TOKENS="5")
+    backend = FakeBackend()
+    results = analyze_all(CallAnalyzer(backend=backend), transcripts(3))
+
+    assert all(result.ok for result in results)
+    assert backend.requests == 3
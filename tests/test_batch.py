@@ -0,0 +1,129 @@
+import asyncio
+import itertools
+import json
+import zipfile
+
+import pytest
+
+from services.batch import BatchItem, iter_transcripts, run_batch
+
+LONG = "Клиент: добрый день, я хотел бы уточнить статус своего заказа, спасибо"
+LIMITS = {"max_member_size": 1024, "max_unpacked_size": 4096}
+
+
+def parse(path, filename=None, **limits):
+    return list(iter_transcripts(path, filename or path.name, **(LIMITS | limits)))
+
+
+def test_txt_transcripts_are_split_by_separator(tmp_path):
+    path = tmp_path / "calls.txt"
+    path.write_text("первый звонок\n---\n\n---\nвторой\nзвонок\n---\n", "utf-8")
+
+    assert parse(path) == [
+        BatchItem("calls-1", "первый звонок"),
+        BatchItem("calls-2", "второй\nзвонок"),
+    ]
+
+
+def test_jsonl_records_and_errors(tmp_path):
+    path = tmp_path / "calls.jsonl"
+    lines = [
+        json.dumps({"id": 7, "transcript": "первый"}, ensure_ascii=False),
+        "",
+        json.dumps({"text": "второй"}, ensure_ascii=False),
+        "{broken",
+        "[1, 2]",
+        json.dumps({"id": "x"}),
+    ]
+    path.write_text("\n".join(lines), "utf-8")
+
+    items = parse(path)
+    assert [(item.call_id, item.transcript) for item in items[:2]] == [
+        ("7", "первый"),
+        ("calls-3", "второй"),
+    ]
+    assert items[2].error.startswith("invalid JSON")
+    assert items[3].error == "record is not an object"
+    assert items[4] == BatchItem("x", "", "no transcript field")
+
+
+def test_csv_rows_use_the_transcript_column(tmp_path):
+    path = tmp_path / "upload.tmp"
+    path.write_text('id,transcript\nA1,первый звонок\n,"второй, с запятой"\n', "utf-8")
+
+    assert parse(path, "calls.csv") == [
+        BatchItem("A1", "первый звонок"),
+        BatchItem("calls-2", "второй, с запятой"),
+    ]
+
+
+def test_unsupported_extension_is_rejected(tmp_path):
+    path = tmp_path / "calls.docx"
+    path.write_bytes(b"")
+
+    with pytest.raises(ValueError):
+        parse(path)
+
+
+def test_zip_members_are_parsed_by_extension(tmp_path):
+    path = tmp_path / "calls.zip"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("day1/call.txt", "звонок из архива\n")
+        archive.writestr("day1/more.jsonl", '{"id": "j1", "text": "из jsonl"}\n')
+        archive.writestr("notes.md", "не расшифровка")
+        archive.writestr("empty/", "")
+
+    assert parse(path) == [
+        BatchItem("day1/call", "звонок из архива"),
+        BatchItem("j1", "из jsonl"),
+    ]
+
+
+def test_oversized_zip_member_is_reported(tmp_path):
+    path = tmp_path / "calls.zip"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("big.txt", "a" * (1024 * 1024 + 1))
+        archive.writestr("small.txt", "короткий")
+
+    # Слишком большой файл не учитывается в суммарном размере архива.
+    assert parse(path, max_member_size=1024 * 1024, max_unpacked_size=1024) == [
+        BatchItem("big", "", "file is larger than 1 MB"),
+        BatchItem("small", "короткий"),
+    ]
+
+
+def test_zip_bomb_is_rejected_before_unpacking(tmp_path):
+    path = tmp_path / "bomb.zip"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for index in range(5):
+            archive.writestr(f"part{index}.txt", "а" * 500)
+
+    # Пять файлов по 1000 байт (кириллица в UTF-8) больше 4096 байт в сумме.
+    with pytest.raises(ValueError, match="unpacks to more than"):
+        parse(path)
+
+
+def test_run_batch_leaves_extra_items_for_the_truncation_check(tmp_path):
+    path = tmp_path / "calls.txt"
+    path.write_text("\n---\n".join([LONG, "коротко", LONG, LONG, LONG]), "utf-8")
+
+    async def analyze(transcript):
+        raise RuntimeError("model is down")
+
+    async def scenario():
+        items = iter_transcripts(path, path.name, **LIMITS)
+        results = [
+            result
+            async for result in run_batch(
+                itertools.islice(items, 3), analyze, concurrency=2
+            )
+        ]
+        return results, next(items, None)
+
+    results, rest = asyncio.run(scenario())
+    assert sorted((r.call_id, r.error) for r in results) == [
+        ("calls-1", "model is down"),
+        ("calls-2", "transcript is too short"),
+        ("calls-3", "model is down"),
+    ]
+    assert rest is not None and rest.call_id == "calls-4"
@@ -0,0 +1,81 @@
+import asyncio
+
+from services.cache import AnalysisCache
+
+
+def test_memory_hit_and_miss():
+    cache = AnalysisCache(max_entries=4, ttl_seconds=60)
+
+    async def scenario():
+        assert await cache.get("a") is None
+        await cache.set("a", "value", cost_seconds=2.0, tokens=100)
+        return await cache.get("a")
+
+    assert asyncio.run(scenario()) == "value"
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+    assert cache.stats.saved_seconds == 2.0
+    assert cache.stats.saved_tokens == 100
+
+
+def test_expired_entry_is_a_miss():
+    cache = AnalysisCache(max_entries=4, ttl_seconds=0)
+
+    async def scenario():
+        await cache.set("a", "value")
+        return await cache.get("a")
+
+    assert asyncio.run(scenario()) is None
+    assert cache.stats.expirations == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AnalysisCache(max_entries=2, ttl_seconds=60)
+
+    async def scenario():
+        await cache.set("a", "1")
+        await cache.set("b", "2")
+        await cache.get("a")
+        await cache.set("c", "3")
+        return [await cache.get(key) for key in ("a", "b", "c")]
+
+    assert asyncio.run(scenario()) == ["1", None, "3"]
+    assert cache.stats.evictions == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+
+    async def store():
+        cache = AnalysisCache(max_entries=4, ttl_seconds=60, db_path=str(path))
+        await cache.set("a", "value", tokens=10)
+        cache.close()
+
+    async def load():
+        cache = AnalysisCache(max_entries=4, ttl_seconds=60, db_path=str(path))
+        try:
+            return await cache.get("a"), cache.stats
+        finally:
+            cache.close()
+
+    asyncio.run(store())
+    value, stats = asyncio.run(load())
+    assert value == "value"
+    assert stats.disk_hits == 1
+
+
+def test_disk_hit_without_memory_tier(tmp_path):
+    # Регрессия: при CACHE_MAX_ENTRIES=0 запись с диска сразу вытесняется
+    # из памяти, и попадание не должно падать с KeyError.
+    cache = AnalysisCache(
+        max_entries=0, ttl_seconds=60, db_path=str(tmp_path / "cache.sqlite3")
+    )
+
+    async def scenario():
+        await cache.set("a", "value")
+        return await cache.get("a")
+
+    try:
+        assert asyncio.run(scenario()) == "value"
+    finally:
+        cache.close()
+    assert cache.stats.disk_hits == 1
@@ -0,0 +1,198 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from services import job_queue
+from services.job_queue import RedisJobQueue, SQLiteJobQueue
+from services.scheduler import QueueFullError
+
+VISIBILITY_TIMEOUT = 30.0
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(job_queue, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def make_queue(request, tmp_path):
+    queues = []
+
+    def make(max_size: int = 10):
+        if request.param == "sqlite":
+            queue = SQLiteJobQueue(
+                str(tmp_path / "jobs.sqlite3"),
+                visibility_timeout=VISIBILITY_TIMEOUT,
+                max_size=max_size,
+            )
+        else:
+            queue = RedisJobQueue(
+                "redis://unused",
+                visibility_timeout=VISIBILITY_TIMEOUT,
+                max_size=max_size,
+                client=fakeredis.FakeAsyncRedis(decode_responses=True),
+            )
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.close()
+
+
+async def put(queue, user_id: int = 1) -> str:
+    return await queue.put(
+        chat_id=100 + user_id, message_id=7, user_id=user_id, transcript="текст"
+    )
+
+
+def test_claim_leases_the_oldest_job(make_queue, clock):
+    queue = make_queue()
+
+    async def scenario():
+        first = await put(queue, 1)
+        clock.now += 1
+        await put(queue, 2)
+        job = await queue.claim()
+        other = await queue.claim()
+        return first, job, other, await queue.claim(), await queue.depth()
+
+    first, job, other, nothing, depth = asyncio.run(scenario())
+    assert job.id == first
+    assert (job.chat_id, job.message_id, job.user_id) == (101, 7, 1)
+    assert (job.transcript, job.attempts) == ("текст", 1)
+    assert job.enqueued_at == clock.now - 1
+    assert other.user_id == 2 and other.lease != job.lease
+    assert nothing is None
+    assert depth == 2
+
+
+def test_expired_lease_goes_to_another_worker(make_queue, clock):
+    queue = make_queue()
+
+    async def scenario():
+        await put(queue)
+        stale = await queue.claim()
+        clock.now += VISIBILITY_TIMEOUT + 1
+        fresh = await queue.claim()
+        outcome = (
+            await queue.complete(stale),
+            await queue.touch(stale),
+            await queue.retry(stale, 0, "late"),
+            await queue.bury(stale, "late"),
+            await queue.complete(fresh),
+        )
+        return stale, fresh, outcome, await queue.depth()
+
+    stale, fresh, outcome, depth = asyncio.run(scenario())
+    assert fresh.id == stale.id
+    assert fresh.attempts == 2 and fresh.lease != stale.lease
+    assert outcome == (False, False, False, False, True)
+    assert depth == 0
+
+
+def test_touch_extends_the_lease(make_queue, clock):
+    queue = make_queue()
+
+    async def scenario():
+        await put(queue)
+        job = await queue.claim()
+        clock.now += VISIBILITY_TIMEOUT * 2 / 3
+        touched = await queue.touch(job)
+        clock.now += VISIBILITY_TIMEOUT * 2 / 3
+        hidden = await queue.claim()
+        clock.now += VISIBILITY_TIMEOUT
+        return touched, hidden, await queue.claim()
+
+    touched, hidden, expired = asyncio.run(scenario())
+    assert touched
+    assert hidden is None
+    assert expired is not None and expired.attempts == 2
+
+
+def test_retry_hides_the_job_for_the_delay(make_queue, clock):
+    queue = make_queue()
+
+    async def scenario():
+        await put(queue)
+        job = await queue.claim()
+        retried = await queue.retry(job, 60, "model is down")
+        clock.now += 59
+        early = await queue.claim()
+        clock.now += 1
+        return retried, early, await queue.claim()
+
+    retried, early, again = asyncio.run(scenario())
+    assert retried
+    assert early is None
+    assert again.attempts == 2
+
+
+def test_buried_job_leaves_the_queue(make_queue, clock):
+    queue = make_queue()
+
+    async def scenario():
+        await put(queue)
+        job = await queue.claim()
+        buried = await queue.bury(job, "too many attempts")
+        clock.now += VISIBILITY_TIMEOUT + 1
+        return job, buried, await queue.claim(), await queue.depth()
+
+    job, buried, claimed, depth = asyncio.run(scenario())
+    assert buried
+    assert claimed is None
+    assert depth == 0
+    if isinstance(queue, RedisJobQueue):
+        assert asyncio.run(queue.redis.lrange(f"{queue.prefix}:dead", 0, -1)) == [
+            job.id
+        ]
+    else:
+        assert queue._db.execute(
+            "SELECT state, error FROM analysis_jobs"
+        ).fetchall() == [("dead", "too many attempts")]
+
+
+def test_full_queue_rejects_jobs(make_queue, clock):
+    queue = make_queue(max_size=2)
+
+    async def scenario():
+        await put(queue, 1)
+        await put(queue, 2)
+        with pytest.raises(QueueFullError):
+            await put(queue, 3)
+        job = await queue.claim()
+        await queue.complete(job)
+        await put(queue, 3)
+        return await queue.depth()
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_concurrent_puts_do_not_overflow_redis_queue(clock):
+    queue = RedisJobQueue(
+        "redis://unused",
+        visibility_timeout=VISIBILITY_TIMEOUT,
+        max_size=1,
+        client=fakeredis.FakeAsyncRedis(decode_responses=True),
+    )
+
+    async def scenario():
+        results = await asyncio.gather(
+            *(put(queue, user_id) for user_id in range(3)), return_exceptions=True
+        )
+        return results, await queue.depth()
+
+    results, depth = asyncio.run(scenario())
+    assert depth == 1
+    assert sum(isinstance(result, QueueFullError) for result in results) == 2
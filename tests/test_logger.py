@@ -0,0 +1,33 @@
+import logging
+import queue
+import sys
+
+from core.logger import DeferredQueueHandler
+
+
+class Mutable:
+    def __init__(self):
+        self.state = "before"
+
+    def __str__(self) -> str:
+        return self.state
+
+
+def test_arguments_are_formatted_in_the_calling_thread():
+    records = queue.Queue()
+    handler = DeferredQueueHandler(records)
+    value = Mutable()
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = logging.LogRecord(
+            "test", logging.ERROR, __file__, 1, "state is %s", (value,), sys.exc_info()
+        )
+    handler.handle(record)
+    value.state = "after"
+
+    queued = records.get_nowait()
+    assert (queued.msg, queued.args) == ("state is before", None)
+    assert queued.getMessage() == "state is before"
+    # Трассировка остается для форматирования в потоке QueueListener.
+    assert queued.exc_info is not None and queued.exc_text is None
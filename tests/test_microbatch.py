@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from services.microbatch import MicroBatcher
+
+
+class Recorder:
+    def __init__(self, answer=None, error: Exception | None = None):
+        self.batches: list[list] = []
+        self.answer = answer or (lambda items: [item * 10 for item in items])
+        self.error = error
+
+    async def __call__(self, key, items):
+        self.batches.append(list(items))
+        await asyncio.sleep(0)
+        if self.error is not None:
+            raise self.error
+        return self.answer(items)
+
+
+def busy_batcher(flush, **options) -> MicroBatcher:
+    batcher = MicroBatcher(flush, **options)
+    # Запросы приходят чаще, чем раз в max_wait: пакет ждет попутчиков.
+    batcher._interval = 0.001
+    return batcher
+
+
+def test_idle_request_is_sent_immediately():
+    flush = Recorder()
+
+    async def scenario():
+        batcher = MicroBatcher(flush, max_size=8, max_wait=10.0)
+        return await asyncio.wait_for(batcher.submit("m", 1), timeout=1.0)
+
+    assert asyncio.run(scenario()) == 10
+    assert flush.batches == [[1]]
+
+
+def test_concurrent_requests_share_a_batch():
+    flush = Recorder()
+
+    async def scenario():
+        batcher = busy_batcher(flush, max_size=4, max_wait=0.05)
+        return await asyncio.gather(*(batcher.submit("m", i) for i in range(6)))
+
+    assert asyncio.run(scenario()) == [0, 10, 20, 30, 40, 50]
+    assert [len(batch) for batch in flush.batches] == [4, 2]
+
+
+def test_weight_limit_splits_batches():
+    flush = Recorder()
+
+    async def scenario():
+        batcher = busy_batcher(flush, max_size=8, max_wait=0.05, max_weight=10)
+        await asyncio.gather(*(batcher.submit("m", i, weight=4) for i in range(5)))
+
+    asyncio.run(scenario())
+    assert [len(batch) for batch in flush.batches] == [2, 2, 1]
+
+
+def test_missing_results_halve_the_limit():
+    flush = Recorder(answer=lambda items: [None] + [item for item in items[1:]])
+
+    async def scenario():
+        batcher = busy_batcher(flush, max_size=4, max_wait=0.05)
+        results = await asyncio.gather(*(batcher.submit("m", i) for i in range(4)))
+        return results, batcher.limit
+
+    results, limit = asyncio.run(scenario())
+    assert results == [None, 1, 2, 3]
+    assert limit == 2
+
+
+def test_failed_batch_falls_back_for_every_item():
+    flush = Recorder(error=RuntimeError("boom"))
+
+    async def scenario():
+        batcher = busy_batcher(flush, max_size=3, max_wait=0.05)
+        return await asyncio.gather(*(batcher.submit("m", i) for i in range(3)))
+
+    assert asyncio.run(scenario()) == [None, None, None]
+
+
+def test_failed_single_item_raises():
+    flush = Recorder(error=RuntimeError("boom"))
+
+    async def scenario():
+        batcher = MicroBatcher(flush, max_size=3, max_wait=0.05)
+        await batcher.submit("m", 1)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(scenario())
+
+
+def test_busy_server_lets_batches_grow():
+    async def scenario():
+        gate = asyncio.Event()
+        sizes = []
+
+        async def flush(key, items):
+            sizes.append(len(items))
+            await gate.wait()
+            return list(items)
+
+        batcher = MicroBatcher(flush, max_size=8, max_wait=0.05, max_concurrency=1)
+        first = asyncio.create_task(batcher.submit("m", 0))
+        await asyncio.sleep(0)
+        rest = [asyncio.create_task(batcher.submit("m", i)) for i in range(1, 5)]
+        await asyncio.sleep(0.01)
+        gate.set()
+        await asyncio.gather(first, *rest)
+        await batcher.close()
+        return sizes
+
+    assert asyncio.run(scenario()) == [1, 4]
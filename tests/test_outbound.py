@@ -0,0 +1,206 @@
+import asyncio
+import heapq
+import itertools
+
+import pytest
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText, GetMe, SendMessage
+
+from core import outbound
+from core.outbound import OutboundScheduler, TokenBucket
+
+
+class FakeClock:
+    """!
+    @brief Виртуальное время для планировщика.
+    @details `sleep` не ждет по-настоящему: `run` продвигает время до ближайшего
+             пробуждения, когда всем задачам больше нечего делать.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self._timers: list[tuple[float, int, asyncio.Future]] = []
+        self._order = itertools.count()
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float) -> None:
+        if delay <= 0:
+            await real_sleep(0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._timers, (self.now + delay, next(self._order), future))
+        await future
+
+    async def run(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        while not task.done():
+            for _ in range(20):
+                await real_sleep(0)
+            if task.done():
+                break
+            if not self._timers:
+                raise RuntimeError("nothing to wait for, the scenario is stuck")
+            wake_at, _, future = heapq.heappop(self._timers)
+            self.now = max(self.now, wake_at)
+            if not future.done():
+                future.set_result(None)
+        return task.result()
+
+
+real_sleep = asyncio.sleep
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(outbound, "time", clock)
+    monkeypatch.setattr(outbound.asyncio, "sleep", clock.sleep)
+    return clock
+
+
+class FakeSession:
+    """!
+    @brief Вместо Telegram записывает запросы и момент их отправки.
+    """
+
+    def __init__(self, clock: FakeClock, failures: dict | None = None):
+        self.clock = clock
+        self.failures = failures or {}
+        self.sent: list[tuple[float, object, str]] = []
+
+    async def __call__(self, bot, method):
+        await real_sleep(0)
+        name = getattr(method, "text", type(method).__name__)
+        self.sent.append(
+            (self.clock.now - 1000.0, getattr(method, "chat_id", None), name)
+        )
+        retry_after = self.failures.pop(name, None)
+        if retry_after is not None:
+            raise TelegramRetryAfter(method, "Too Many Requests", retry_after)
+        return name
+
+
+def make_scheduler(**options) -> OutboundScheduler:
+    defaults = {
+        "global_rate": 100.0,
+        "global_burst": 100,
+        "chat_rate": 1.0,
+        "chat_burst": 1,
+        "group_rate": 1 / 3,
+        "max_retries": 2,
+        "max_retry_after": 30.0,
+    }
+    return OutboundScheduler(**(defaults | options))
+
+
+def send(scheduler, session, chat_id, text):
+    return scheduler(session, None, SendMessage(chat_id=chat_id, text=text))
+
+
+def edit(scheduler, session, chat_id, message_id, text):
+    method = EditMessageText(chat_id=chat_id, message_id=message_id, text=text)
+    return scheduler(session, None, method)
+
+
+def test_token_bucket_allows_a_burst_then_spaces_requests():
+    bucket = TokenBucket(rate=2.0, burst=3)
+
+    assert [bucket.reserve(10.0) for _ in range(5)] == [0, 0, 0, 0.5, 1.0]
+    assert not bucket.idle(10.0)
+    assert bucket.idle(12.5)
+
+
+def test_requests_to_one_chat_are_spaced(clock):
+    scheduler = make_scheduler()
+    session = FakeSession(clock)
+
+    async def scenario():
+        return await asyncio.gather(
+            send(scheduler, session, 5, "a1"),
+            send(scheduler, session, 5, "a2"),
+            send(scheduler, session, -7, "g1"),
+            send(scheduler, session, -7, "g2"),
+            send(scheduler, session, 5, "a3"),
+            scheduler(session, None, GetMe()),
+        )
+
+    assert asyncio.run(clock.run(scenario())) == ["a1", "a2", "g1", "g2", "a3", "GetMe"]
+    times = {text: at for at, _, text in session.sent}
+    # Личный чат — раз в секунду, группа — раз в три; другие запросы не ждут.
+    assert [times["a1"], times["a2"], times["a3"]] == [0, 1, 2]
+    assert [times["g1"], times["g2"]] == [0, 3]
+    assert times["GetMe"] == 0
+
+
+def test_global_limit_spaces_requests_to_different_chats(clock):
+    scheduler = make_scheduler(global_rate=2.0, global_burst=1)
+    session = FakeSession(clock)
+
+    async def scenario():
+        await asyncio.gather(
+            *(send(scheduler, session, chat, "hi") for chat in (1, 2, 3))
+        )
+
+    asyncio.run(clock.run(scenario()))
+    assert [at for at, _, _ in session.sent] == [0, 0.5, 1.0]
+
+
+def test_queued_edits_are_coalesced(clock):
+    scheduler = make_scheduler()
+    session = FakeSession(clock)
+
+    async def scenario():
+        return await asyncio.gather(
+            send(scheduler, session, 5, "⏳"),
+            edit(scheduler, session, 5, 1, "10%"),
+            edit(scheduler, session, 5, 1, "50%"),
+            edit(scheduler, session, 5, 2, "другое сообщение"),
+            edit(scheduler, session, 5, 1, "готово"),
+        )
+
+    results = asyncio.run(clock.run(scenario()))
+    assert results == ["⏳", "готово", "готово", "другое сообщение", "готово"]
+    assert [text for _, _, text in session.sent] == [
+        "⏳",
+        "готово",
+        "другое сообщение",
+    ]
+
+
+def test_retry_after_pauses_only_its_chat(clock):
+    scheduler = make_scheduler()
+    session = FakeSession(clock, failures={"a1": 5})
+
+    async def scenario():
+        first = asyncio.ensure_future(send(scheduler, session, 5, "a1"))
+        await real_sleep(0)
+        return await asyncio.gather(
+            first,
+            send(scheduler, session, 5, "a2"),
+            send(scheduler, session, 6, "b1"),
+        )
+
+    assert asyncio.run(clock.run(scenario())) == ["a1", "a2", "b1"]
+    assert session.sent == [
+        (0, 5, "a1"),
+        (0, 6, "b1"),
+        (5, 5, "a1"),
+        (6, 5, "a2"),
+    ]
+
+
+def test_long_retry_after_is_raised(clock):
+    scheduler = make_scheduler(max_retry_after=10.0)
+    session = FakeSession(clock, failures={"a1": 60})
+
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(clock.run(send(scheduler, session, 5, "a1")))
+    assert len(session.sent) == 1
+    # Чат остается на паузе, даже если запрос не повторялся.
+    assert scheduler._chats[5].bucket.reserve(clock.now) == pytest.approx(60)
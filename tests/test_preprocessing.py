@@ -0,0 +1,122 @@
+import pytest
+
+from services.chunking import estimate_tokens
+from services.preprocessing import TRUNCATION_MARK, TranscriptPreprocessor
+
+STAGE_CASES = [
+    ("timestamps", "[00:01:15] Оператор: добрый день", " Оператор: добрый день"),
+    ("timestamps", "(12:05) да", " да"),
+    ("timestamps", "10:30 - 10:45 Клиент: да", "Клиент: да"),
+    (
+        "timestamps",
+        "1\n00:00:01,000 --> 00:00:03,500\nКлиент: алло",
+        "\n\nКлиент: алло",
+    ),
+    ("timestamps", "Клиент: приеду в 10:30", "Клиент: приеду в 10:30"),
+    (
+        "fillers",
+        "Клиент: ну, я как бы хотел, короче, узнать",
+        "Клиент:  я хотел  узнать",
+    ),
+    ("fillers", "Клиент: ээ это самое заказ", "Клиент:  заказ"),
+    ("fillers", "Клиент: нужно новое", "Клиент: нужно новое"),
+    ("repeats", "Клиент: я я я хотел", "Клиент: я хотел"),
+    (
+        "repeats",
+        "Оператор: алло\nОператор:  алло\nКлиент: да",
+        "Оператор: алло\nКлиент: да",
+    ),
+    ("repeats", "Клиент: да, да", "Клиент: да, да"),
+    (
+        "speakers",
+        "оператор: добрый день\nОператор: чем помочь?\nклиент: заказ",
+        "Оператор: добрый день чем помочь?\nКлиент: заказ",
+    ),
+    ("speakers", "[Speaker 1]: hi", "Speaker 1: hi"),
+    ("speakers", "просто строка\n\nКлиент: да", "просто строка\nКлиент: да"),
+    # Меткой говорящего считается любое короткое "слово:" в начале строки.
+    (
+        "speakers",
+        "Итого: 500 рублей\nитого: со скидкой",
+        "Итого: 500 рублей со скидкой",
+    ),
+    (
+        "whitespace",
+        "  Клиент:   да ,  конечно  \n\n\n ,, \nОператор: ок",
+        "Клиент: да, конечно\nОператор: ок",
+    ),
+    ("whitespace", "Клиент: да,, ,нет", "Клиент: да,нет"),
+]
+
+
+@pytest.mark.parametrize("stage, text, expected", STAGE_CASES)
+def test_stage(stage, text, expected):
+    cleaned, stats = TranscriptPreprocessor([stage]).process(text)
+
+    assert cleaned == expected
+    assert list(stats.durations) == [stage]
+
+
+def test_full_pipeline():
+    text = (
+        "[00:00:01] оператор: ээ, добрый день\n"
+        "[00:00:03] оператор: добрый день\n"
+        "[00:00:05] клиент: ну я я хотел,  как бы, узнать про заказ\n"
+    )
+    cleaned, stats = TranscriptPreprocessor().process(text)
+
+    assert cleaned == "Оператор: добрый день\nКлиент: я хотел узнать про заказ"
+    assert stats.tokens_saved > 0
+    assert stats.chars_after == len(cleaned)
+
+
+def test_unknown_stage_is_rejected():
+    with pytest.raises(ValueError):
+        TranscriptPreprocessor(["timestamps", "typos"])
+
+
+def lines(count: int) -> str:
+    return "\n".join(f"Оператор: реплика номер {i} про заказ" for i in range(count))
+
+
+@pytest.mark.parametrize("budget", [0, 1000])
+def test_short_transcript_is_not_truncated(budget):
+    text = lines(40)
+    assert (
+        TranscriptPreprocessor(["truncate"], token_budget=budget).process(text)[0]
+        == text
+    )
+
+
+def test_truncation_keeps_head_and_tail():
+    cleaned, _ = TranscriptPreprocessor(["truncate"], token_budget=100).process(
+        lines(40)
+    )
+    kept = cleaned.splitlines()
+
+    assert TRUNCATION_MARK in kept
+    mark = kept.index(TRUNCATION_MARK)
+    tail = len(kept) - mark - 1
+    assert kept[:mark] == lines(mark).splitlines()
+    assert kept[mark + 1 :] == lines(40).splitlines()[40 - tail :]
+    # Начало разговора получает две трети бюджета, конец — треть.
+    assert mark > tail > 0
+
+
+def test_time_in_a_line_is_not_a_speaker_label():
+    text = "Клиент: хорошо\nприеду в 10:30"
+    cleaned, _ = TranscriptPreprocessor(["speakers"]).process(text)
+    assert cleaned == text
+
+    cleaned, _ = TranscriptPreprocessor().process("Оператор: когда?\nприеду в 10:30")
+    assert cleaned == "Оператор: когда?\nприеду в 10:30"
+
+
+@pytest.mark.parametrize("budget", [30, 60, 100])
+def test_truncated_transcript_fits_the_budget(budget):
+    cleaned, _ = TranscriptPreprocessor(["truncate"], token_budget=budget).process(
+        lines(40)
+    )
+
+    assert TRUNCATION_MARK in cleaned
+    assert estimate_tokens(cleaned) <= budget
@@ -0,0 +1,269 @@
+import asyncio
+
+import httpx
+import pytest
+
+from openai import RateLimitError
+
+from services import resilience
+from services.resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+
+def make_caller(models=("a", "b"), **options) -> ResilientCaller:
+    defaults = {
+        "max_attempts": 3,
+        "base_delay": 0.0,
+        "max_delay": 0.0,
+        "failure_threshold": 2,
+        "reset_timeout": 30.0,
+    }
+    return ResilientCaller(list(models), **(defaults | options))
+
+
+def outage() -> Exception:
+    return httpx.ConnectError("connection refused")
+
+
+def test_breaker_opens_after_consecutive_failures(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(resilience, "time", clock)
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+
+    breaker.on_failure()
+    breaker.on_success()
+    breaker.on_failure()
+    breaker.on_failure()
+    assert breaker.state == "closed" and breaker.available
+
+    breaker.on_failure()
+    assert breaker.state == "open" and not breaker.available
+    clock.now += 10
+    assert breaker.retry_in() == 20
+
+
+def test_half_open_breaker_lets_one_probe_through(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(resilience, "time", clock)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.on_failure()
+
+    clock.now += 30
+    assert breaker.state == "half_open" and breaker.available
+    breaker.on_start()
+    assert not breaker.available
+
+    breaker.release()
+    assert breaker.available
+    breaker.on_start()
+    breaker.on_success()
+    assert breaker.state == "closed" and breaker.available
+
+
+def test_failed_probe_opens_the_breaker_again(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(resilience, "time", clock)
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(3):
+        breaker.on_failure()
+
+    clock.now += 31
+    breaker.on_start()
+    breaker.on_failure()
+    assert breaker.state == "open"
+    assert breaker.retry_in() == 30
+
+
+def test_call_fails_over_and_skips_an_open_breaker():
+    caller = make_caller(failure_threshold=1)
+    calls = []
+
+    async def request(model):
+        calls.append(model)
+        if model == "a":
+            raise outage()
+        return model
+
+    async def scenario():
+        return [await caller.call(request), await caller.call(request)]
+
+    assert asyncio.run(scenario()) == ["b", "b"]
+    assert calls == ["a", "b", "b"]
+    assert caller.breakers["a"].state == "open"
+
+
+def test_all_breakers_open_fails_fast():
+    caller = make_caller(failure_threshold=1, max_attempts=2)
+
+    async def request(model):
+        raise outage()
+
+    async def scenario():
+        with pytest.raises(httpx.ConnectError):
+            await caller.call(request)
+        await caller.call(request)
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(scenario())
+
+
+def test_client_errors_are_not_retried():
+    caller = make_caller()
+    calls = []
+
+    async def request(model):
+        calls.append(model)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        asyncio.run(caller.call(request))
+    assert calls == ["a"]
+    assert caller.breakers["a"].state == "closed"
+
+
+def hedged_caller() -> ResilientCaller:
+    return make_caller(
+        max_attempts=1, hedge_enabled=True, hedge_delay=0.01, hedge_min_delay=0.01
+    )
+
+
+def test_hedge_wins_when_the_primary_is_slow():
+    caller = hedged_caller()
+    cancelled = []
+
+    async def request(model):
+        try:
+            await asyncio.sleep(1.0 if model == "a" else 0)
+        except asyncio.CancelledError:
+            cancelled.append(model)
+            raise
+        return model
+
+    assert asyncio.run(caller.call(request)) == "b"
+    assert cancelled == ["a"]
+    assert (caller.stats["b"].hedges, caller.stats["b"].hedge_wins) == (1, 1)
+    assert caller.breakers["a"].state == "closed"
+
+
+def test_hedge_loses_when_the_primary_answers_first():
+    caller = hedged_caller()
+    cancelled = []
+
+    async def request(model):
+        try:
+            await asyncio.sleep(0.05 if model == "a" else 1.0)
+        except asyncio.CancelledError:
+            cancelled.append(model)
+            raise
+        return model
+
+    assert asyncio.run(caller.call(request)) == "a"
+    assert cancelled == ["b"]
+    assert (caller.stats["b"].hedges, caller.stats["b"].hedge_wins) == (1, 0)
+
+
+def test_fast_primary_is_not_hedged():
+    caller = hedged_caller()
+    calls = []
+
+    async def request(model):
+        calls.append(model)
+        return model
+
+    assert asyncio.run(caller.call(request, hedge=True)) == "a"
+    assert calls == ["a"]
+    assert caller.stats["b"].hedges == 0
+
+
+def rate_limited(seconds: float) -> Exception:
+    request = httpx.Request("POST", "https://openrouter.ai/api/v1/chat/completions")
+    response = httpx.Response(
+        429, headers={"retry-after": str(seconds)}, request=request
+    )
+    return RateLimitError("rate limited", response=response, body=None)
+
+
+def record_sleeps(monkeypatch) -> list[float]:
+    sleeps = []
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay):
+        sleeps.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(resilience.asyncio, "sleep", sleep)
+    return sleeps
+
+
+def test_long_retry_after_is_not_retried_early(monkeypatch):
+    sleeps = record_sleeps(monkeypatch)
+    caller = make_caller(models=["a"], max_delay=5.0, failure_threshold=10)
+    calls = []
+
+    async def request(model):
+        calls.append(model)
+        raise rate_limited(120)
+
+    with pytest.raises(Exception, match="rate limited"):
+        asyncio.run(caller.call(request))
+    assert calls == ["a"]
+    assert sleeps == []
+
+
+def test_long_retry_after_switches_to_the_fallback(monkeypatch):
+    sleeps = record_sleeps(monkeypatch)
+    caller = make_caller(max_delay=5.0, failure_threshold=10)
+    calls = []
+
+    async def request(model):
+        calls.append(model)
+        raise rate_limited(120)
+
+    with pytest.raises(Exception, match="rate limited"):
+        asyncio.run(caller.call(request))
+    # Обе модели попросили подождать 2 минуты: третьей попытки раньше нет.
+    assert calls == ["a", "b"]
+    assert all(delay <= 5.0 for delay in sleeps)
+
+
+def test_short_retry_after_is_waited_in_full(monkeypatch):
+    sleeps = record_sleeps(monkeypatch)
+    caller = make_caller(models=["a"], base_delay=0.1, max_delay=5.0)
+    calls = []
+
+    async def request(model):
+        calls.append(model)
+        if len(calls) == 1:
+            raise rate_limited(3)
+        return model
+
+    assert asyncio.run(caller.call(request)) == "a"
+    assert calls == ["a", "a"]
+    assert len(sleeps) == 1 and sleeps[0] >= 2.9
+
+
+def test_rate_limited_model_is_not_hedged(monkeypatch):
+    caller = make_caller(
+        max_delay=5.0, hedge_enabled=True, hedge_delay=0.01, hedge_min_delay=0.01
+    )
+    calls = []
+
+    async def request(model):
+        calls.append(model)
+        if model == "a":
+            raise rate_limited(3)
+        await asyncio.sleep(0.05)
+        return model
+
+    assert asyncio.run(caller.call(request)) == "b"
+    assert calls == ["a", "b"]
@@ -0,0 +1,195 @@
+import asyncio
+import sqlite3
+import time
+
+from types import SimpleNamespace
+
+import pytest
+
+from aiogram.filters import CommandObject
+
+from core.container import container
+from handlers.stats import cmd_stats
+from services.models import AnalysisResult, Tonality
+from services.results_store import ALL_USERS, ResultsStore
+
+DAY = 24 * 60 * 60
+POSITIVE = AnalysisResult(Tonality.POSITIVE, ("Поблагодарить клиента",))
+NEGATIVE = AnalysisResult(Tonality.NEGATIVE, ("Извиниться",))
+
+
+def record(store: ResultsStore, user_id: int, result=POSITIVE, **options) -> None:
+    store.record(
+        user_id=user_id,
+        chat_id=100 + user_id,
+        result=result,
+        latency=options.pop("latency", 2.0),
+        transcript_chars=500,
+        **options,
+    )
+
+
+def rows(path, query: str) -> list[tuple]:
+    with sqlite3.connect(path) as db:
+        return db.execute(query).fetchall()
+
+
+def test_results_are_written_in_batches(tmp_path, monkeypatch):
+    store = ResultsStore(str(tmp_path / "results.db"), batch_size=2, flush_interval=60)
+    batches = []
+    write = store._write
+    monkeypatch.setattr(
+        store, "_write", lambda batch: batches.append(len(batch)) or write(batch)
+    )
+
+    async def scenario():
+        await store.start()
+        for user_id in range(5):
+            record(store, user_id + 1)
+        await asyncio.sleep(0.05)
+        # Пятый результат ждет flush_interval и дописывается при остановке.
+        written = list(batches)
+        await store.close()
+        return written
+
+    assert asyncio.run(scenario()) == [2, 2]
+    assert batches == [2, 2, 1]
+    assert rows(tmp_path / "results.db", "SELECT COUNT(*) FROM analysis_results") == [
+        (5,)
+    ]
+
+
+def test_partial_batch_is_written_after_flush_interval(tmp_path):
+    path = tmp_path / "results.db"
+    store = ResultsStore(str(path), batch_size=100, flush_interval=0.01)
+
+    async def scenario():
+        await store.start()
+        record(store, 1)
+        await asyncio.sleep(0.2)
+        written = rows(path, "SELECT user_id FROM analysis_results")
+        await store.close()
+        return written
+
+    assert asyncio.run(scenario()) == [(1,)]
+
+
+def test_full_queue_drops_results(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"), max_pending=2)
+
+    async def scenario():
+        for user_id in range(3):
+            record(store, user_id + 1)
+        pending = store.pending
+        await store.close()
+        return pending
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_daily_stats_are_upserted_per_user_and_for_everyone(tmp_path):
+    path = tmp_path / "results.db"
+    now = time.time()
+
+    async def write(results):
+        store = ResultsStore(str(path), batch_size=2)
+        await store.start()
+        for user_id, result, created_at in results:
+            record(store, user_id, result, created_at=created_at)
+        await store.close()
+
+    asyncio.run(write([(1, POSITIVE, now), (2, NEGATIVE, now)]))
+    # Повторная запись в тот же день складывается с существующей строкой.
+    asyncio.run(
+        write(
+            [
+                (1, AnalysisResult.failed("timeout"), now),
+                (1, POSITIVE, now - DAY),
+                (1, NEGATIVE, now - 10 * DAY),
+            ]
+        )
+    )
+
+    today = time.strftime("%Y-%m-%d", time.gmtime(now))
+    assert rows(
+        path,
+        "SELECT user_id, total, positive, neutral, negative, failed, latency_sum"
+        f" FROM daily_stats WHERE day = '{today}' ORDER BY user_id",
+    ) == [
+        (ALL_USERS, 3, 1, 0, 1, 1, 6.0),
+        (1, 2, 1, 0, 0, 1, 4.0),
+        (2, 1, 0, 0, 1, 0, 2.0),
+    ]
+
+    async def read():
+        store = ResultsStore(str(path))
+        try:
+            return await store.stats(1, 7), await store.stats(None, 7)
+        finally:
+            await store.close()
+
+    personal, everyone = asyncio.run(read())
+    assert (personal.total, personal.failed, len(personal.daily)) == (3, 1, 2)
+    assert personal.tonalities[Tonality.POSITIVE] == 2
+    assert personal.tonalities[Tonality.NEGATIVE] == 0
+    assert personal.average_latency == 2.0
+    assert (everyone.total, everyone.tonalities[Tonality.NEGATIVE]) == (4, 1)
+
+
+class FakeMessage:
+    def __init__(self, user_id: int):
+        self.from_user = SimpleNamespace(id=user_id)
+        self.answers: list[str] = []
+
+    async def answer(self, text: str, **options) -> None:
+        self.answers.append(text)
+
+
+@pytest.fixture
+def stats_store(tmp_path, monkeypatch, configure):
+    configure(STATS_ADMIN_IDS="[42]", STATS_DEFAULT_DAYS="7")
+    path = str(tmp_path / "results.db")
+
+    async def fill():
+        store = ResultsStore(path)
+        await store.start()
+        record(store, 1)
+        record(store, 2, NEGATIVE)
+        record(store, 42, NEGATIVE)
+        await store.close()
+
+    asyncio.run(fill())
+    store = ResultsStore(path)
+    monkeypatch.setitem(container.__dict__, "results_store", store)
+    yield store
+    asyncio.run(store.close())
+
+
+def stats_command(user_id: int, args: str | None) -> list[str]:
+    message = FakeMessage(user_id)
+    command = CommandObject(prefix="/", command="stats", args=args)
+    asyncio.run(cmd_stats(message, command))
+    return message.answers
+
+
+def test_stats_shows_personal_statistics(stats_store):
+    [answer] = stats_command(1, None)
+
+    assert answer.startswith("**Ваша статистика за 7 дн.**")
+    assert "Всего анализов: 1" in answer
+
+
+def test_stats_for_everyone_requires_admin(stats_store):
+    [denied] = stats_command(1, "all")
+    [allowed] = stats_command(42, "all 30")
+
+    assert denied.startswith("⛔")
+    assert allowed.startswith("**Статистика всех пользователей за 30 дн.**")
+    assert "Всего анализов: 3" in allowed
+
+
+@pytest.mark.parametrize("args", ["week", "0", "all -1"])
+def test_stats_rejects_bad_arguments(stats_store, args):
+    [answer] = stats_command(1, args)
+
+    assert answer.startswith("Использование: /stats")
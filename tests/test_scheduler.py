@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from services.scheduler import AnalysisScheduler, QueueFullError
+
+
+class Gate:
+    def __init__(self):
+        self.event = asyncio.Event()
+        self.running = 0
+        self.peak = 0
+        self.started: list[str] = []
+
+    def job(self, name: str):
+        async def factory():
+            self.started.append(name)
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            try:
+                await self.event.wait()
+                return name
+            finally:
+                self.running -= 1
+
+        return factory
+
+
+def test_concurrency_limit():
+    async def scenario():
+        gate = Gate()
+        scheduler = AnalysisScheduler(
+            max_concurrency=2, per_user_limit=5, max_queue_size=10
+        )
+        jobs = [scheduler.submit(user, gate.job(f"u{user}")) for user in range(5)]
+        await asyncio.sleep(0)
+        in_flight, depth = scheduler.in_flight, scheduler.queue_depth
+        gate.event.set()
+        results = await asyncio.gather(*jobs)
+        return gate.peak, in_flight, depth, results, [job.position for job in jobs]
+
+    peak, in_flight, depth, results, positions = asyncio.run(scenario())
+    assert (peak, in_flight, depth) == (2, 2, 3)
+    assert results == ["u0", "u1", "u2", "u3", "u4"]
+    assert positions == [0, 0, 1, 2, 3]
+
+
+def test_users_are_served_round_robin():
+    async def scenario():
+        gate = Gate()
+        scheduler = AnalysisScheduler(
+            max_concurrency=1, per_user_limit=1, max_queue_size=10
+        )
+        jobs = [scheduler.submit(1, gate.job(f"a{i}")) for i in range(3)]
+        jobs += [scheduler.submit(2, gate.job(f"b{i}")) for i in range(2)]
+        gate.event.set()
+        await asyncio.gather(*jobs)
+        return gate.started
+
+    assert asyncio.run(scenario()) == ["a0", "a1", "b0", "a2", "b1"]
+
+
+def test_full_queue_rejects_jobs():
+    async def scenario():
+        gate = Gate()
+        scheduler = AnalysisScheduler(
+            max_concurrency=1, per_user_limit=1, max_queue_size=1
+        )
+        running = scheduler.submit(1, gate.job("running"))
+        queued = scheduler.submit(2, gate.job("queued"))
+        with pytest.raises(QueueFullError) as error:
+            scheduler.submit(3, gate.job("rejected"))
+        gate.event.set()
+        await asyncio.gather(running, queued)
+        return scheduler.stats, error.value.depth, gate.started
+
+    stats, depth, started = asyncio.run(scenario())
+    assert depth == 1
+    assert (stats.submitted, stats.rejected, stats.completed) == (2, 1, 2)
+    assert started == ["running", "queued"]
+
+
+def test_cancelled_job_is_not_started():
+    async def scenario():
+        gate = Gate()
+        scheduler = AnalysisScheduler(
+            max_concurrency=1, per_user_limit=1, max_queue_size=10
+        )
+        running = scheduler.submit(1, gate.job("running"))
+        cancelled = scheduler.submit(2, gate.job("cancelled"))
+        queued = scheduler.submit(3, gate.job("queued"))
+        cancelled.future.cancel()
+        gate.event.set()
+        results = await asyncio.gather(running, queued)
+        return results, gate.started, scheduler.queue_depth, scheduler.in_flight
+
+    results, started, depth, in_flight = asyncio.run(scenario())
+    assert results == ["running", "queued"]
+    assert started == ["running", "queued"]
+    assert (depth, in_flight) == (0, 0)
+
+
+def test_failed_job_frees_its_slot():
+    async def scenario():
+        scheduler = AnalysisScheduler(
+            max_concurrency=1, per_user_limit=1, max_queue_size=10
+        )
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        async def succeed():
+            return "ok"
+
+        failed = scheduler.submit(1, fail)
+        queued = scheduler.submit(1, succeed)
+        with pytest.raises(RuntimeError):
+            await failed
+        return await queued
+
+    assert asyncio.run(scenario()) == "ok"
@@ -0,0 +1,157 @@
+import asyncio
+
+import pytest
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import EditMessageText
+
+from core.container import container
+from services.job_queue import SQLiteJobQueue
+from services.models import AnalysisResult, Tonality
+from worker import AnalysisWorker
+
+RESULT = AnalysisResult(Tonality.POSITIVE, ("Поблагодарить клиента",))
+
+
+class FakeBot:
+    """!
+    @brief Записывает правки сообщений; первые правки могут завершаться ошибками.
+    """
+
+    def __init__(self, *errors: str):
+        self.errors = list(errors)
+        self.edits: list[dict] = []
+
+    async def edit_message_text(self, text, **options):
+        self.edits.append(options)
+        if self.errors:
+            method = EditMessageText(text=text, **options)
+            raise TelegramBadRequest(method, self.errors.pop(0))
+        return True
+
+
+class FakeAnalyzer:
+    def __init__(self, result: AnalysisResult):
+        self.result = result
+        self.calls = 0
+
+    async def analyze_call(self, transcript: str) -> AnalysisResult:
+        self.calls += 1
+        return self.result
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setitem(container.__dict__, "results_store", None)
+    queue = SQLiteJobQueue(
+        str(tmp_path / "jobs.sqlite3"), visibility_timeout=30.0, max_size=100
+    )
+    yield queue
+    queue.close()
+
+
+def make_worker(queue, bot, **options) -> AnalysisWorker:
+    defaults = {
+        "concurrency": 1,
+        "poll_interval": 0.01,
+        "max_attempts": 3,
+        "retry_delay": 0.0,
+    }
+    return AnalysisWorker(queue, bot, **(defaults | options))
+
+
+def jobs(queue) -> list[tuple]:
+    return queue._db.execute(
+        "SELECT state, attempts, error FROM analysis_jobs ORDER BY id"
+    ).fetchall()
+
+
+def process_one(worker: AnalysisWorker) -> None:
+    async def scenario():
+        await worker.queue.put(chat_id=5, message_id=7, user_id=1, transcript="текст")
+        await worker._process(await worker.queue.claim())
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def analyzer(monkeypatch):
+    analyzer = FakeAnalyzer(RESULT)
+    monkeypatch.setitem(container.__dict__, "analyzer", analyzer)
+    return analyzer
+
+
+def test_result_replaces_the_queued_message(queue, analyzer):
+    bot = FakeBot()
+    process_one(make_worker(queue, bot))
+
+    assert bot.edits == [{"chat_id": 5, "message_id": 7, "parse_mode": "Markdown"}]
+    assert jobs(queue) == []
+
+
+def test_unchanged_message_is_not_an_error(queue, analyzer):
+    bot = FakeBot("Bad Request: message is not modified")
+    process_one(make_worker(queue, bot))
+
+    assert len(bot.edits) == 1
+    assert jobs(queue) == []
+
+
+def test_invalid_markdown_is_sent_as_plain_text(queue, analyzer):
+    bot = FakeBot("Bad Request: can't parse entities: unexpected end")
+    process_one(make_worker(queue, bot))
+
+    assert bot.edits == [
+        {"chat_id": 5, "message_id": 7, "parse_mode": "Markdown"},
+        {"chat_id": 5, "message_id": 7},
+    ]
+    assert jobs(queue) == []
+
+
+def test_other_telegram_errors_retry_the_job(queue, analyzer):
+    bot = FakeBot("Bad Request: chat not found")
+    process_one(make_worker(queue, bot))
+
+    assert jobs(queue) == [
+        ("queued", 1, "Telegram server says - Bad Request: chat not found")
+    ]
+
+
+def test_job_is_buried_after_max_attempts(queue, analyzer):
+    analyzer.result = AnalysisResult.failed("model is down")
+    bot = FakeBot()
+    worker = make_worker(queue, bot, max_attempts=2)
+
+    async def scenario():
+        await queue.put(chat_id=5, message_id=7, user_id=1, transcript="текст")
+        for _ in range(2):
+            await worker._process(await queue.claim())
+        return await queue.claim()
+
+    assert asyncio.run(scenario()) is None
+    assert analyzer.calls == 2
+    assert len(bot.edits) == 1
+    assert jobs(queue) == [("dead", 2, "model is down")]
+
+
+def test_worker_loop_survives_a_failed_job(queue, analyzer, monkeypatch):
+    worker = make_worker(queue, FakeBot())
+    processed = []
+
+    async def process(job):
+        processed.append(job.user_id)
+        if job.user_id == 1:
+            raise RuntimeError("queue is unavailable")
+        worker.stop()
+
+    monkeypatch.setattr(worker, "_process", process)
+
+    async def scenario():
+        for user_id in (1, 2):
+            await queue.put(
+                chat_id=5, message_id=user_id, user_id=user_id, transcript="текст"
+            )
+        await asyncio.wait_for(worker.run(), 5)
+
+    asyncio.run(scenario())
+    assert processed == [1, 2]